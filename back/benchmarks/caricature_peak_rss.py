@@ -0,0 +1,176 @@
+"""
+Benchmark de memoria del flujo de caricaturas (POST /photo/generate-caricature).
+
+Levanta un servidor falso de Azure images/edits y de Realtime Database en local,
+envía N peticiones concurrentes con una foto JPEG realista y mide el pico de RSS
+del proceso (ru_maxrss) y el pico de memoria Python (tracemalloc) por petición.
+
+Uso (desde back/):
+    python benchmarks/caricature_peak_rss.py --concurrency 1
+    python benchmarks/caricature_peak_rss.py --concurrency 4 --stream
+
+Cada ejecución es un proceso nuevo para que ru_maxrss no arrastre picos previos.
+"""
+
+import argparse
+import base64
+import io
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Una caricatura PNG de 1024x1024 ocupa ~1.5 MB (~2 MB en base64).
+GENERATED_IMAGE_BYTES = 1536 * 1024
+
+
+def build_fake_server(stream_partials: int) -> ThreadingHTTPServer:
+    generated_b64 = base64.b64encode(os.urandom(GENERATED_IMAGE_BYTES)).decode("ascii")
+
+    class FakeAzureAndFirebase(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _drain_body(self) -> None:
+            remaining = int(self.headers.get("Content-Length", "0"))
+            while remaining > 0:
+                remaining -= len(self.rfile.read(min(remaining, 64 * 1024)))
+
+        def do_POST(self):
+            self._drain_body()
+            time.sleep(0.2)  # Latencia simulada de la generación.
+            if stream_partials:
+                events = [
+                    {"type": "image_edit.partial_image", "partial_image_index": index, "b64_json": generated_b64}
+                    for index in range(stream_partials)
+                ]
+                events.append({"type": "image_edit.completed", "b64_json": generated_b64})
+                body = b"".join(
+                    b"event: " + event["type"].encode() + b"\ndata: " + json.dumps(event).encode() + b"\n\n"
+                    for event in events
+                )
+                content_type = "text/event-stream"
+            else:
+                body = json.dumps({"data": [{"b64_json": generated_b64}]}).encode()
+                content_type = "application/json"
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_PATCH(self):
+            self._drain_body()
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        do_PUT = do_PATCH
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeAzureAndFirebase)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def build_photo_data_url(width: int, height: int) -> str:
+    """JPEG con ruido (se comprime mal, como una foto real de móvil)."""
+    from PIL import Image
+
+    image = Image.frombytes("RGB", (width, height), os.urandom(width * height * 3))
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=90)
+    return "data:image/jpeg;base64," + base64.b64encode(output.getvalue()).decode("ascii")
+
+
+def max_rss_mib() -> float:
+    # Linux: KiB; macOS: bytes.
+    scale = 1024 if sys.platform != "darwin" else 1024 * 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--width", type=int, default=3000)
+    parser.add_argument("--height", type=int, default=2000)
+    parser.add_argument("--stream", action="store_true", help="Respuesta SSE con 2 imágenes parciales")
+    parser.add_argument("--tracemalloc", action="store_true", help="Mide también el pico de memoria Python")
+    args = parser.parse_args()
+
+    server = build_fake_server(stream_partials=2 if args.stream else 0)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    os.environ.update({
+        "AZURE_OPENAI_ENDPOINT": "",
+        "AZURE_OPENAI_API_KEY": "benchmark",
+        "AZURE_OPENAI_IMAGE_EDITS_ENDPOINT": f"{base_url}/edits",
+        "FIREBASE_DATABASE_URL": base_url,
+        "CARICATURE_JOB_CONCURRENCY": str(args.concurrency),
+        "CARICATURE_CACHE_MAX_BYTES": "0",
+        "CARICATURE_PARTIAL_IMAGES": "2" if args.stream else "0",
+    })
+
+    import main as backend
+    from fastapi.testclient import TestClient
+
+    photo_data_urls = [build_photo_data_url(args.width, args.height) for _ in range(args.concurrency)]
+    request_bodies = [
+        json.dumps({"orderNumber": str(index + 1), "photoBase64": photo}).encode("ascii")
+        for index, photo in enumerate(photo_data_urls)
+    ]
+    del photo_data_urls
+    body_size = len(request_bodies[0])
+
+    with TestClient(backend.app) as client:
+        baseline_rss = max_rss_mib()
+        if args.tracemalloc:
+            tracemalloc.start()
+
+        def run_one(body: bytes) -> str:
+            response = client.post(
+                "/photo/generate-caricature",
+                content=body,
+                headers={"Content-Type": "application/json"},
+            )
+            job_id = response.json()["jobId"]
+            while True:
+                status = client.get(f"/photo/jobs/{job_id}").json()
+                if status["status"] in ("succeeded", "failed"):
+                    return status["status"]
+                time.sleep(0.05)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            statuses = list(pool.map(run_one, request_bodies))
+        elapsed = time.perf_counter() - started
+
+        traced_peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+        peak_rss = max_rss_mib()
+
+    server.shutdown()
+    result = {
+        "concurrency": args.concurrency,
+        "stream": args.stream,
+        "requestBodyMiB": round(body_size / 1024 / 1024, 2),
+        "statuses": statuses,
+        "elapsedSeconds": round(elapsed, 2),
+        "baselineRssMiB": round(baseline_rss, 1),
+        "peakRssMiB": round(peak_rss, 1),
+        "peakRssPerRequestMiB": round((peak_rss - baseline_rss) / args.concurrency, 2),
+    }
+    if traced_peak is not None:
+        result["tracedPeakPerRequestMiB"] = round(traced_peak / 1024 / 1024 / args.concurrency, 2)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Servidor falso de GPT Realtime (Azure) para pruebas de carga del relay /ws.
+
+Implementa la parte del protocolo que usa el backend, con retardos configurables
+y sin aleatoriedad:
+
+- Al conectar: `session.created`; cada `session.update` -> `session.updated`.
+- `input_audio_buffer.append`: cuando el turno acumula `turn_audio_ms` de audio
+  se emiten `speech_started`/`speech_stopped`, `committed` y, tras
+  `transcription_delay_ms`, el delta y el `...transcription.completed`. El primer
+  turno de cada conexión dice "Hola, soy el número {orden}" (orden = 1000 + n.º
+  de conexión) para ejercitar la búsqueda en Firebase.
+- `response.create`: tras `first_audio_delay_ms`, `response_audio_ms` de audio en
+  deltas de `audio_chunk_ms` (a ritmo real si `pace_audio`) y `response.done`.
+- `conversation.item.create` / `conversation.item.delete`: item creado / borrado,
+  y una respuesta de texto si la sesión es solo texto (resúmenes).
+
+Uso independiente (desde back/):
+    python benchmarks/fake_realtime.py --port 9001
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import math
+import struct
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import websockets
+
+SAMPLE_RATE = 24000
+BYTES_PER_MS = SAMPLE_RATE * 2 // 1000
+FIRST_ORDER_NUMBER = 1000
+
+
+@dataclass
+class FakeRealtimeConfig:
+    turn_audio_ms: int = 1500
+    transcription_delay_ms: int = 200
+    first_audio_delay_ms: int = 300
+    response_audio_ms: int = 2000
+    audio_chunk_ms: int = 100
+    pace_audio: bool = True
+
+
+def build_pcm16_tone(duration_ms: int, frequency: float = 220.0) -> bytes:
+    """Tono PCM16 mono a 24 kHz (determinista)."""
+    samples = SAMPLE_RATE * duration_ms // 1000
+    return struct.pack(
+        f"<{samples}h",
+        *(int(8000 * math.sin(2 * math.pi * frequency * index / SAMPLE_RATE)) for index in range(samples)),
+    )
+
+
+class FakeRealtimeServer:
+    def __init__(self, config: FakeRealtimeConfig):
+        self.config = config
+        self.connections = 0
+        self.audio_bytes_received = 0
+        self._response_chunk_b64 = base64.b64encode(build_pcm16_tone(config.audio_chunk_ms)).decode("ascii")
+        self._server: Optional[Any] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        self._server = await websockets.serve(self._handle, host, port, max_size=None)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle(self, connection) -> None:
+        self.connections += 1
+        order_number = str(FIRST_ORDER_NUMBER + self.connections)
+        state = {"turn": 0, "turn_bytes": 0, "items": 0, "responses": 0, "text_only": False}
+        background: set[asyncio.Task] = set()
+
+        async def send(event: dict[str, Any]) -> None:
+            await connection.send(json.dumps(event))
+
+        def spawn(coro) -> None:
+            task = asyncio.create_task(coro)
+            background.add(task)
+            task.add_done_callback(background.discard)
+
+        async def finish_turn(turn: int) -> None:
+            item_id = f"item_user_{turn}"
+            await send({"type": "input_audio_buffer.speech_stopped", "audio_end_ms": 0, "item_id": item_id})
+            await send({"type": "input_audio_buffer.committed", "item_id": item_id})
+            await send({"type": "conversation.item.created", "item": {"id": item_id, "type": "message", "role": "user"}})
+            await asyncio.sleep(self.config.transcription_delay_ms / 1000)
+            transcript = (
+                f"Hola, soy el número {order_number}." if turn == 1 else "Trabajo en una empresa de software."
+            )
+            await send({
+                "type": "conversation.item.input_audio_transcription.delta",
+                "item_id": item_id,
+                "content_index": 0,
+                "delta": transcript,
+            })
+            await send({
+                "type": "conversation.item.input_audio_transcription.completed",
+                "item_id": item_id,
+                "content_index": 0,
+                "transcript": transcript,
+            })
+
+        async def respond() -> None:
+            state["responses"] += 1
+            response_id = f"resp_{state['responses']}"
+            item_id = f"item_assistant_{state['responses']}"
+            await send({"type": "response.created", "response": {"id": response_id, "status": "in_progress"}})
+            await asyncio.sleep(self.config.first_audio_delay_ms / 1000)
+            if state["text_only"]:
+                await send({"type": "response.output_text.delta", "response_id": response_id, "delta": "Resumen."})
+            else:
+                chunks = max(1, self.config.response_audio_ms // self.config.audio_chunk_ms)
+                for _ in range(chunks):
+                    await send({
+                        "type": "response.audio.delta",
+                        "response_id": response_id,
+                        "item_id": item_id,
+                        "output_index": 0,
+                        "content_index": 0,
+                        "delta": self._response_chunk_b64,
+                    })
+                    if self.config.pace_audio:
+                        await asyncio.sleep(self.config.audio_chunk_ms / 1000)
+                await send({"type": "response.audio.done", "response_id": response_id, "item_id": item_id})
+            await send({
+                "type": "response.done",
+                "response": {"id": response_id, "status": "completed", "output": [{"id": item_id}]},
+            })
+
+        try:
+            await send({"type": "session.created", "session": {"id": f"sess_{self.connections}"}})
+            async for raw in connection:
+                if not isinstance(raw, str):
+                    continue
+                event = json.loads(raw)
+                event_type = event.get("type")
+                if event_type == "input_audio_buffer.append":
+                    size = len(event.get("audio") or "") * 3 // 4
+                    self.audio_bytes_received += size
+                    if state["turn_bytes"] == 0:
+                        await send({"type": "input_audio_buffer.speech_started", "audio_start_ms": 0})
+                    state["turn_bytes"] += size
+                    if state["turn_bytes"] >= self.config.turn_audio_ms * BYTES_PER_MS:
+                        state["turn_bytes"] = 0
+                        state["turn"] += 1
+                        spawn(finish_turn(state["turn"]))
+                elif event_type == "session.update":
+                    session = event.get("session") or {}
+                    if "modalities" in session:
+                        state["text_only"] = "audio" not in session["modalities"]
+                    await send({"type": "session.updated", "session": session})
+                elif event_type == "response.create":
+                    spawn(respond())
+                elif event_type == "conversation.item.create":
+                    state["items"] += 1
+                    item = event.get("item") or {}
+                    await send({"type": "conversation.item.created", "item": {"id": item.get("id") or f"item_{state['items']}"}})
+                elif event_type == "conversation.item.delete":
+                    await send({"type": "conversation.item.deleted", "item_id": event.get("item_id")})
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            for task in background:
+                task.cancel()
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--turn-audio-ms", type=int, default=1500, help="Audio por turno antes de speech_stopped")
+    parser.add_argument("--transcription-delay-ms", type=int, default=200)
+    parser.add_argument("--first-audio-delay-ms", type=int, default=300)
+    parser.add_argument("--response-audio-ms", type=int, default=2000)
+    parser.add_argument("--audio-chunk-ms", type=int, default=100)
+    parser.add_argument("--no-pace", action="store_true", help="Envía el audio de respuesta sin esperar")
+
+
+def config_from_arguments(args: argparse.Namespace) -> FakeRealtimeConfig:
+    return FakeRealtimeConfig(
+        turn_audio_ms=args.turn_audio_ms,
+        transcription_delay_ms=args.transcription_delay_ms,
+        first_audio_delay_ms=args.first_audio_delay_ms,
+        response_audio_ms=args.response_audio_ms,
+        audio_chunk_ms=args.audio_chunk_ms,
+        pace_audio=not args.no_pace,
+    )
+
+
+async def serve_forever(config: FakeRealtimeConfig, port: int) -> None:
+    server = FakeRealtimeServer(config)
+    bound_port = await server.start(port=port)
+    print(f"Fake realtime escuchando en ws://127.0.0.1:{bound_port}")
+    await asyncio.Future()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9001)
+    add_config_arguments(parser)
+    arguments = parser.parse_args()
+    asyncio.run(serve_forever(config_from_arguments(arguments), arguments.port))
@@ -0,0 +1,150 @@
+"""
+Servidor falso de la API REST de Realtime Database (`{url}/{ruta}.json`).
+
+Cualquier número de orden numérico existe: `users/{n}` se genera al vuelo con
+nombre, foto (data URL de `photo_kb` KB) y `caricatures` caricaturas, así que las
+lecturas por campo, `shallow=true` y el registro completo devuelven lo mismo que
+Firebase. PATCH/PUT se aceptan y se guardan en memoria (`currentUser`,
+`robot_action`, campos de usuario). Cada petición espera `delay_ms`.
+
+Uso independiente (desde back/):
+    python benchmarks/fake_rtdb.py --port 9002 --delay-ms 20
+"""
+
+import argparse
+import base64
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+from urllib.parse import parse_qs, urlsplit
+
+
+def build_fake_user(order_number: str, photo_kb: int, caricatures: int) -> dict[str, Any]:
+    # Bytes deterministas (no aleatorios): el mismo usuario pesa igual en cada ejecución.
+    image = "data:image/jpeg;base64," + base64.b64encode(bytes(range(256)) * (photo_kb * 4)).decode("ascii")
+    return {
+        "fullName": f"Visitante {order_number}",
+        "email": f"visitante{order_number}@example.com",
+        "photo": image,
+        "caricatures": [image for _ in range(caricatures)],
+    }
+
+
+class _FakeHTTPServer(ThreadingHTTPServer):
+    # El backlog por defecto (5) pierde SYN cuando el pool de httpx abre varias
+    # conexiones a la vez, y cada reintento TCP añade 1 s a la latencia medida.
+    request_queue_size = 128
+    daemon_threads = True
+
+
+class FakeRealtimeDatabase:
+    def __init__(self, delay_ms: int = 20, photo_kb: int = 64, caricatures: int = 0):
+        self.delay_ms = delay_ms
+        self.photo_kb = photo_kb
+        self.caricatures = caricatures
+        self.requests = 0
+        self.writes: dict[str, Any] = {}
+        self._users: dict[str, dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def resolve(self, path: str) -> Any:
+        """Valor en `path` (sin `.json`), o None si no existe."""
+        parts = [part for part in path.strip("/").split("/") if part]
+        if not parts:
+            return None
+        with self._lock:
+            if "/".join(parts) in self.writes:
+                return self.writes["/".join(parts)]
+        if parts[0] != "users" or len(parts) < 2 or not parts[1].isdigit():
+            return None
+        with self._lock:
+            user = self._users.get(parts[1])
+            if user is None:
+                user = self._users[parts[1]] = build_fake_user(parts[1], self.photo_kb, self.caricatures)
+        value: Any = user
+        for part in parts[2:]:
+            if isinstance(value, list) and part.isdigit() and int(part) < len(value):
+                value = value[int(part)]
+            elif isinstance(value, dict):
+                value = value.get(part)
+            else:
+                return None
+        return value
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        database = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, value: Any) -> None:
+                body = json.dumps(value).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _path(self) -> tuple[str, dict[str, list[str]]]:
+                url = urlsplit(self.path)
+                path = url.path[: -len(".json")] if url.path.endswith(".json") else url.path
+                return path, parse_qs(url.query)
+
+            def _before_request(self) -> None:
+                with database._lock:
+                    database.requests += 1
+                time.sleep(database.delay_ms / 1000)
+
+            def do_GET(self):
+                self._before_request()
+                path, query = self._path()
+                value = database.resolve(path)
+                if query.get("shallow") == ["true"]:
+                    if isinstance(value, dict):
+                        value = {key: True for key in value}
+                    elif isinstance(value, list):
+                        value = {str(index): True for index in range(len(value))}
+                self._reply(value)
+
+            def do_PATCH(self):
+                self._before_request()
+                path, _ = self._path()
+                length = int(self.headers.get("Content-Length", "0"))
+                payload = json.loads(self.rfile.read(length) or b"null")
+                with database._lock:
+                    if self.command == "PATCH" and isinstance(payload, dict):
+                        for key, value in payload.items():
+                            database.writes["/".join(p for p in (path.strip("/"), key) if p)] = value
+                    else:
+                        database.writes[path.strip("/")] = payload
+                self._reply(payload)
+
+            do_PUT = do_PATCH
+
+        self._server = _FakeHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return f"http://{host}:{self._server.server_address[1]}"
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9002)
+    parser.add_argument("--delay-ms", type=int, default=20)
+    parser.add_argument("--photo-kb", type=int, default=64)
+    parser.add_argument("--caricatures", type=int, default=0)
+    arguments = parser.parse_args()
+    fake = FakeRealtimeDatabase(arguments.delay_ms, arguments.photo_kb, arguments.caricatures)
+    print(f"Fake Realtime Database en {fake.start(port=arguments.port)} (pid {os.getpid()})")
+    threading.Event().wait()
@@ -0,0 +1,230 @@
+"""
+Micro-benchmarks de las funciones puras que se ejecutan por mensaje o por petición.
+
+Cada caso usa datos fijos (el corpus de `order_number_corpus.jsonl`, payloads de
+imágenes deterministas de varios MB, conversaciones de ejemplo y chunks de audio
+de tamaños típicos) y se mide con `timeit`: calibración automática del número de
+vueltas y el mínimo de `--repeat` repeticiones, en microsegundos por llamada.
+
+Con `--save` se guardan los resultados; con `--compare` se comparan con unos
+guardados y el proceso termina con código 1 si algún caso es más de un
+`--tolerance` (por defecto 25 %) más lento. `hot_functions_baseline.json` es la
+línea base del repositorio: los tiempos dependen de la máquina, así que para
+comparar en otra conviene regenerarla allí antes del cambio.
+
+Uso (desde back/):
+    python benchmarks/hot_functions.py
+    python benchmarks/hot_functions.py --save benchmarks/hot_functions_baseline.json
+    python benchmarks/hot_functions.py --compare benchmarks/hot_functions_baseline.json
+    python benchmarks/hot_functions.py --filter audio --repeat 9
+"""
+
+import argparse
+import base64
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import timeit
+from typing import Any, Callable
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+CORPUS_PATH = os.path.join(BENCHMARKS_DIR, "order_number_corpus.jsonl")
+DEFAULT_BASELINE_PATH = os.path.join(BENCHMARKS_DIR, "hot_functions_baseline.json")
+
+# Una caricatura PNG de 1024x1024 ocupa ~1.5 MB (~2 MB en base64).
+GENERATED_IMAGE_BYTES = 1536 * 1024
+
+# Chunks de audio PCM16 a 24 kHz: 20 ms (frame del navegador), 100 ms y 200 ms (coalescidos).
+AUDIO_CHUNK_MS = (20, 100, 200)
+BYTES_PER_MS = 48
+
+SUMMARY_CONVERSATIONS = [
+    ["Hola, soy el número 42.", "Me llamo Marta García.", "Tengo 34 años y trabajo de ingeniera en Seat.",
+     "Me interesa mucho la robótica y la inteligencia artificial."],
+    ["Buenas tardes.", "Mi nombre es Jordi Puig, trabajo en una empresa de software de Barcelona.",
+     "Me gustan los videojuegos y el diseño."],
+    ["Hi, my number is 17.", "I'm here with my family.", "We really like the robot."],
+    ["Tengo 61 años.", "Soy profesor de física jubilado.", "Me encanta la astronomía y la fotografía.",
+     "Vengo cada año a la feria con mis nietos.", "El año pasado también me hice una caricatura."],
+]
+
+
+def load_corpus_texts() -> list[str]:
+    with open(CORPUS_PATH, encoding="utf-8") as corpus_file:
+        return [json.loads(line)["text"] for line in corpus_file if line.strip()]
+
+
+def build_image_payload_factories() -> dict[str, Callable[[], dict[str, Any]]]:
+    """
+    Respuestas del endpoint de imágenes con una y dos imágenes (~2 MB de base64 cada
+    una). Cada llamada crea strings nuevos, como una respuesta real: con los mismos
+    objetos, el hash (cacheado en el str) saldría gratis a partir de la segunda vuelta.
+    """
+    image_b64 = base64.b64encode(bytes(range(256)) * (GENERATED_IMAGE_BYTES // 256)).decode("ascii")
+    other_b64 = image_b64[::-1]
+
+    def fresh(value: str) -> str:
+        return value[:1] + value[1:]
+
+    return {
+        "data_1x2mb": lambda: {"data": [{"b64_json": fresh(image_b64)}]},
+        "output_2x2mb": lambda: {
+            "output": [
+                {"type": "image_generation_call", "b64_json": fresh(image_b64)},
+                {"content": [{"type": "output_image", "b64_json": fresh(other_b64)}]},
+            ]
+        },
+    }
+
+
+def import_backend():
+    os.environ.update({
+        "AZURE_OPENAI_ENDPOINT": "",
+        "FIREBASE_DATABASE_URL": "",
+        "LOG_LEVEL": "WARNING",
+    })
+    # main imprime avisos de configuración al importarse: fuera del JSON de resultados.
+    with contextlib.redirect_stdout(io.StringIO()):
+        import main as backend
+    return backend
+
+
+def build_cases(backend) -> dict[str, tuple[Callable[[], Any], int]]:
+    """Nombre -> (función sin argumentos, llamadas que hace cada ejecución)."""
+    texts = load_corpus_texts()
+    payload_factories = build_image_payload_factories()
+    build_prompt = backend.get_session_prompt.__wrapped__
+    cached_prompt = backend.get_session_prompt(backend.PROMPT_PHASE_CONVERSATION, "Marta García", True)
+
+    def each_text(func: Callable[[str], Any]) -> Callable[[], None]:
+        def run() -> None:
+            for text in texts:
+                func(text)
+        return run
+
+    def each_conversation() -> None:
+        for messages in SUMMARY_CONVERSATIONS:
+            backend.build_user_summary_fallback(messages)
+
+    cases: dict[str, tuple[Callable[[], Any], int]] = {
+        "extract_order_number/corpus": (each_text(backend.extract_order_number), len(texts)),
+        "normalize_text/corpus": (each_text(backend.normalize_text), len(texts)),
+        "build_user_summary_fallback/conversations": (each_conversation, len(SUMMARY_CONVERSATIONS)),
+        "session_prompt/build_welcome": (lambda: build_prompt(backend.PROMPT_PHASE_WELCOME), 1),
+        "session_prompt/build_conversation": (
+            lambda: build_prompt(backend.PROMPT_PHASE_CONVERSATION, "Marta García", True), 1
+        ),
+        "session_prompt/cached": (
+            lambda: backend.get_session_prompt(backend.PROMPT_PHASE_CONVERSATION, "Marta García", True), 1
+        ),
+        "response_create/json_with_instructions": (
+            lambda: json.dumps({"type": "response.create", "response": {"instructions": cached_prompt}}), 1
+        ),
+        "response_create/json_without_instructions": (
+            lambda: json.dumps({"type": "response.create", "response": {}}), 1
+        ),
+    }
+    for name, factory in payload_factories.items():
+        # `copy_only` es el coste de crear la respuesta: el de la función es la diferencia.
+        cases[f"parse_generated_base64_list/{name}"] = (
+            lambda factory=factory: backend.parse_generated_base64_list(factory()), 1
+        )
+        cases[f"parse_generated_base64_list/{name}_copy_only"] = (factory, 1)
+
+    for chunk_ms in AUDIO_CHUNK_MS:
+        pcm = bytes(range(256)) * (chunk_ms * BYTES_PER_MS // 256) + bytes(chunk_ms * BYTES_PER_MS % 256)
+        upstream_delta = json.dumps({
+            "type": "response.audio.delta",
+            "item_id": "item_0123456789abcdef",
+            "content_index": 0,
+            "delta": base64.b64encode(pcm).decode("ascii"),
+        })
+        cases[f"audio_append/template_{chunk_ms}ms"] = (
+            lambda pcm=pcm: backend.build_audio_append_frame(pcm), 1
+        )
+        cases[f"audio_append/json_dumps_{chunk_ms}ms"] = (
+            lambda pcm=pcm: json.dumps({
+                "type": "input_audio_buffer.append", "audio": base64.b64encode(pcm).decode("ascii"),
+            }),
+            1,
+        )
+        cases[f"audio_delta/peek_event_type_{chunk_ms}ms"] = (
+            lambda raw=upstream_delta: backend.peek_event_type(raw), 1
+        )
+        cases[f"audio_delta/to_binary_frame_{chunk_ms}ms"] = (
+            lambda raw=upstream_delta: _binary_frame_from_delta(backend, raw), 1
+        )
+    return cases
+
+
+def _binary_frame_from_delta(backend, raw: str) -> bytes:
+    """Camino de /ws?audio=binary: json.loads del delta, decodificar base64 y empaquetar."""
+    data = json.loads(raw)
+    return backend.build_binary_audio_frame(data["item_id"], data["content_index"], base64.b64decode(data["delta"]))
+
+
+def measure(func: Callable[[], Any], calls: int, repeat: int) -> dict[str, Any]:
+    timer = timeit.Timer(func)
+    loops, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=loops))
+    return {"microsecondsPerCall": round(best / (loops * calls) * 1e6, 3), "loops": loops}
+
+
+def compare(results: dict[str, dict[str, Any]], baseline: dict[str, Any], tolerance: float) -> list[str]:
+    """Añade `ratio` frente a la línea base y devuelve los casos que empeoran más de `tolerance`."""
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get("results", {}).get(name)
+        if not reference:
+            continue
+        ratio = result["microsecondsPerCall"] / reference["microsecondsPerCall"]
+        result["baselineMicrosecondsPerCall"] = reference["microsecondsPerCall"]
+        result["ratio"] = round(ratio, 2)
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=7, help="Repeticiones por caso (se toma la mínima)")
+    parser.add_argument("--filter", default="", help="Solo los casos cuyo nombre contiene este texto")
+    parser.add_argument("--save", default="", help="Guarda los resultados en este JSON")
+    parser.add_argument("--compare", nargs="?", const=DEFAULT_BASELINE_PATH, default="",
+                        help="Compara con unos resultados guardados (por defecto, la línea base del repo)")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Empeoramiento admitido (0.25 = 25 %%)")
+    args = parser.parse_args()
+
+    backend = import_backend()
+    cases = {name: case for name, case in build_cases(backend).items() if args.filter in name}
+    results = {name: measure(func, calls, args.repeat) for name, (func, calls) in cases.items()}
+
+    report: dict[str, Any] = {
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()}",
+        "results": results,
+    }
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as results_file:
+            json.dump(report, results_file, indent=2, ensure_ascii=False)
+            results_file.write("\n")
+
+    regressions: list[str] = []
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        report["regressions"] = regressions
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if regressions:
+        print(f"❌ {len(regressions)} caso(s) más lentos que la línea base: {', '.join(regressions)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
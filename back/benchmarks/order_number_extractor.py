@@ -0,0 +1,195 @@
+"""
+Benchmark de la detección del número de orden sobre un corpus de transcripciones.
+
+Compara `order_number.OrderNumberExtractor` con la implementación anterior
+(copiada abajo tal cual como referencia): aciertos frente a las etiquetas del
+corpus (`order_number_corpus.jsonl`), falsos positivos, fallos y tiempo por
+llamada. Con `es,en` las dos deben dar exactamente los mismos resultados
+(`mismatchesWithLegacy` vacío); la referencia no conoce el catalán.
+
+Uso (desde back/):
+    python benchmarks/order_number_extractor.py
+    python benchmarks/order_number_extractor.py --languages es,en,ca --iterations 2000
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+import unicodedata
+from typing import Callable, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from order_number import OrderNumberExtractor, languages_for_codes  # noqa: E402
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "order_number_corpus.jsonl")
+
+
+# Implementación anterior (referencia): normaliza siempre con NFKD, recorre las
+# palabras clave una a una y recompila los patrones en cada llamada.
+def legacy_normalize_text(text: str) -> str:
+    """Normaliza texto para detectar números con más robustez."""
+    lowered = text.lower().strip()
+    normalized = unicodedata.normalize("NFKD", lowered)
+    return "".join(ch for ch in normalized if not unicodedata.combining(ch))
+
+
+def legacy_extract_order_number(text: str) -> Optional[str]:
+    """
+    Extrae número de orden desde frases como:
+    - "soy el número 42"
+    - "mi código es cuatro dos"
+    - "my number is 42"
+    - "my code is four two"
+    """
+    if not text:
+        return None
+
+    normalized = legacy_normalize_text(text)
+
+    # Buscar contexto mínimo para evitar falsos positivos.
+    intent_keywords = (
+        # Spanish
+        "numero",
+        "codigo",
+        "orden",
+        "id",
+        "identificador",
+        "soy",
+        "mi numero",
+        "mi codigo",
+        # English
+        "number",
+        "code",
+        "order",
+        "identifier",
+        "my number",
+        "my code",
+        "i am",
+        "i'm",
+        "im ",
+    )
+    if not any(keyword in normalized for keyword in intent_keywords):
+        return None
+
+    # 1) Número continuo.
+    contiguous_matches = re.findall(r"\b\d{1,6}\b", normalized)
+    if contiguous_matches:
+        return contiguous_matches[0]
+
+    # 2) Dígitos separados por espacios, comas o guiones.
+    separated_matches = re.findall(r"(?:\d[\s,.\-]*){2,6}", normalized)
+    for raw in separated_matches:
+        digits_only = "".join(ch for ch in raw if ch.isdigit())
+        if 1 <= len(digits_only) <= 6:
+            return digits_only
+
+    # 3) Número expresado en palabras.
+    word_to_digit = {
+        # Spanish
+        "cero": "0",
+        "uno": "1",
+        "una": "1",
+        "dos": "2",
+        "tres": "3",
+        "cuatro": "4",
+        "cinco": "5",
+        "seis": "6",
+        "siete": "7",
+        "ocho": "8",
+        "nueve": "9",
+        # English
+        "zero": "0",
+        "oh": "0",
+        "one": "1",
+        "two": "2",
+        "three": "3",
+        "four": "4",
+        "five": "5",
+        "six": "6",
+        "seven": "7",
+        "eight": "8",
+        "nine": "9",
+    }
+    word_pattern = (
+        r"\b(?:cero|uno|una|dos|tres|cuatro|cinco|seis|siete|ocho|nueve|"
+        r"zero|oh|one|two|three|four|five|six|seven|eight|nine)\b"
+    )
+    sequence_pattern = rf"(?:{word_pattern})(?:[\s,.\-]+(?:{word_pattern}))*"
+    for seq in re.findall(sequence_pattern, normalized):
+        words = re.findall(word_pattern, seq)
+        if not words:
+            continue
+        digits = "".join(word_to_digit[w] for w in words if w in word_to_digit)
+        if 1 <= len(digits) <= 6:
+            return digits
+
+    return None
+
+
+def load_corpus(path: str, languages: set[str]) -> list[dict]:
+    with open(path, encoding="utf-8") as corpus_file:
+        rows = [json.loads(line) for line in corpus_file if line.strip()]
+    return [row for row in rows if row["language"] in languages]
+
+
+def measure(extract: Callable[[str], Optional[str]], corpus: list[dict], iterations: int) -> dict:
+    results = [extract(row["text"]) for row in corpus]
+    correct = sum(result == row["expected"] for result, row in zip(results, corpus))
+    false_positives = sum(result is not None and row["expected"] is None for result, row in zip(results, corpus))
+    misses = sum(result != row["expected"] and row["expected"] is not None for result, row in zip(results, corpus))
+
+    texts = [row["text"] for row in corpus]
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for text in texts:
+            extract(text)
+    elapsed = time.perf_counter() - started
+    return {
+        "accuracy": round(correct / len(corpus), 3),
+        "falsePositives": false_positives,
+        "misses": misses,
+        "microsecondsPerCall": round(elapsed / (iterations * len(texts)) * 1e6, 2),
+        "results": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--languages", default="es,en", help="Idiomas del extractor y del corpus")
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--verbose", action="store_true", help="Muestra las frases mal clasificadas")
+    args = parser.parse_args()
+
+    codes = [code.strip() for code in args.languages.split(",") if code.strip()]
+    corpus = load_corpus(CORPUS_PATH, set(codes))
+    extractor = OrderNumberExtractor(languages_for_codes(codes))
+
+    legacy = measure(legacy_extract_order_number, corpus, args.iterations)
+    current = measure(extractor.extract, corpus, args.iterations)
+    mismatches = [
+        row["text"] for row, before, after in zip(corpus, legacy["results"], current["results"]) if before != after
+    ]
+
+    if args.verbose:
+        for row, result in zip(corpus, current["results"]):
+            if result != row["expected"]:
+                print(f"  [{row['language']}] {row['text']!r}: esperado {row['expected']}, obtenido {result}")
+
+    legacy.pop("results")
+    current.pop("results")
+    print(json.dumps({
+        "languages": codes,
+        "phrases": len(corpus),
+        "legacy": legacy,
+        "extractor": current,
+        "speedup": round(legacy["microsecondsPerCall"] / current["microsecondsPerCall"], 2),
+        "mismatchesWithLegacy": mismatches,
+    }, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
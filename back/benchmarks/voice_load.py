@@ -0,0 +1,352 @@
+"""
+Prueba de carga determinista del relay de voz (/ws de main:app).
+
+Levanta en local un GPT Realtime falso (benchmarks/fake_realtime.py) y una
+Realtime Database falsa (benchmarks/fake_rtdb.py), arranca `uvicorn main:app` en
+un subproceso apuntando a ellos y conecta N quioscos simulados. Cada quiosco
+espera el saludo y, en cada turno, envía el audio PCM16 a ritmo real en frames
+binarios (como el navegador); el servidor falso da el turno por terminado al
+recibir `--turn-audio-ms` de audio, transcribe ("soy el número ..." en el primer
+turno) y responde con audio tras los retardos configurados.
+
+Informa, en JSON:
+- Latencia por turno medida en el quiosco desde el último frame de audio enviado
+  hasta el primer delta de audio recibido y hasta `response.done` (p50/p95/p99).
+- CPU del proceso del servidor (segundos totales y por sesión) y RSS (base, pico y
+  pico por sesión), leídos de /proc (solo Linux).
+
+Los retardos son fijos, así que la diferencia entre dos ejecuciones es el coste del
+propio backend: sirve de línea base para cualquier cambio en el relay.
+
+Uso (desde back/):
+    python benchmarks/voice_load.py --sessions 20 --turns 3
+    python benchmarks/voice_load.py --sessions 20 --binary-audio --env REALTIME_FAST_RELAY=false
+    python benchmarks/voice_load.py --sessions 5 --pcm grabacion.wav
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+import wave
+from typing import Any, Optional
+
+import websockets
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_realtime import (  # noqa: E402
+    BYTES_PER_MS,
+    SAMPLE_RATE,
+    FakeRealtimeServer,
+    add_config_arguments,
+    build_pcm16_tone,
+    config_from_arguments,
+)
+from fake_rtdb import FakeRealtimeDatabase  # noqa: E402
+
+BACK_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_pcm(path: str) -> bytes:
+    """PCM16 mono a 24 kHz desde un .wav (se valida el formato) o un fichero crudo."""
+    if not path.lower().endswith(".wav"):
+        with open(path, "rb") as pcm_file:
+            return pcm_file.read()
+    with wave.open(path, "rb") as wav_file:
+        if (wav_file.getnchannels(), wav_file.getsampwidth(), wav_file.getframerate()) != (1, 2, SAMPLE_RATE):
+            raise SystemExit(f"{path}: se espera PCM16 mono a {SAMPLE_RATE} Hz")
+        return wav_file.readframes(wav_file.getnframes())
+
+
+def build_turn_audio(recording: bytes, turn_audio_ms: int) -> bytes:
+    """Exactamente `turn_audio_ms` de audio, repitiendo la grabación si es más corta."""
+    size = turn_audio_ms * BYTES_PER_MS
+    if not recording:
+        raise SystemExit("La grabación PCM está vacía")
+    repeated = recording * (size // len(recording) + 1)
+    return repeated[:size]
+
+
+def percentile(values: list[float], fraction: float) -> Optional[float]:
+    """Percentil por rango más cercano, en milisegundos redondeados."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, math.ceil(fraction * len(ordered)) - 1)
+    return round(ordered[index] * 1000, 1)
+
+
+def summarize_latencies(values: list[float]) -> dict[str, Any]:
+    return {
+        "count": len(values),
+        "p50_ms": percentile(values, 0.50),
+        "p95_ms": percentile(values, 0.95),
+        "p99_ms": percentile(values, 0.99),
+        "max_ms": percentile(values, 1.0),
+    }
+
+
+def read_process_usage(pid: int) -> tuple[Optional[float], Optional[int]]:
+    """(segundos de CPU usuario+sistema, RSS en bytes) del proceso, o None fuera de Linux."""
+    try:
+        with open(f"/proc/{pid}/stat") as stat_file:
+            fields = stat_file.read().rsplit(")", 1)[1].split()
+        cpu_seconds = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        with open(f"/proc/{pid}/status") as status_file:
+            rss = next(
+                int(line.split()[1]) * 1024 for line in status_file if line.startswith("VmRSS:")
+            )
+        return cpu_seconds, rss
+    except (OSError, StopIteration, IndexError, ValueError):
+        return None, None
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def start_fake_realtime(server: FakeRealtimeServer) -> int:
+    """Arranca el servidor falso en su propio hilo y bucle (no compite con los quioscos)."""
+    loop = asyncio.new_event_loop()
+    ready: dict[str, int] = {}
+    started = threading.Event()
+
+    def run() -> None:
+        asyncio.set_event_loop(loop)
+        ready["port"] = loop.run_until_complete(server.start())
+        started.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    started.wait()
+    return ready["port"]
+
+
+def start_backend(args: argparse.Namespace, realtime_port: int, rtdb_url: str) -> tuple[subprocess.Popen, str]:
+    port = free_port()
+    env = {
+        **os.environ,
+        "AZURE_OPENAI_ENDPOINT": f"http://127.0.0.1:{realtime_port}",
+        "AZURE_OPENAI_API_KEY": "load-test",
+        "FIREBASE_DATABASE_URL": rtdb_url,
+        "FIREBASE_SERVICE_ACCOUNT_PATH": "",
+        "FIREBASE_SERVICE_ACCOUNT_JSON": "",
+        "ROBOT_GIFT_EVENT_URL": "",
+        "ROBOT_CARICATURE_EVENT_URL": "",
+        "LOG_LEVEL": "WARNING",
+    }
+    for assignment in args.env:
+        key, _, value = assignment.partition("=")
+        env[key] = value
+
+    log_target = open(args.server_log, "w") if args.server_log else subprocess.DEVNULL
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACK_DIR,
+        env=env,
+        stdout=log_target,
+        stderr=subprocess.STDOUT,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"main:app terminó al arrancar (código {process.returncode}); usa --server-log")
+        try:
+            with urllib.request.urlopen(f"{base_url}/", timeout=1):
+                return process, base_url
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise SystemExit("main:app no respondió a tiempo")
+
+
+async def run_kiosk(
+    index: int,
+    ws_url: str,
+    turn_audio: bytes,
+    args: argparse.Namespace,
+    results: dict[str, list],
+) -> None:
+    await asyncio.sleep(index * args.ramp_ms / 1000)
+    frame_size = args.frame_ms * BYTES_PER_MS
+    frames = [turn_audio[offset:offset + frame_size] for offset in range(0, len(turn_audio), frame_size)]
+    response_done = asyncio.Event()
+    first_audio = asyncio.Event()
+    received_at: dict[str, float] = {}
+
+    closed = False
+
+    async def read_events(connection) -> None:
+        nonlocal closed
+        try:
+            async for message in connection:
+                event = {"type": "response.audio.delta"} if isinstance(message, bytes) else json.loads(message)
+                event_type = event.get("type")
+                if event_type == "response.audio.delta" and not first_audio.is_set():
+                    received_at["first_audio"] = time.perf_counter()
+                    first_audio.set()
+                elif event_type == "response.done":
+                    received_at["done"] = time.perf_counter()
+                    response_done.set()
+                elif event_type == "session.queued":
+                    results["queued"].append(index)
+                elif event_type == "error" and event.get("code") == "session_limit":
+                    results["rejected"].append(index)
+                elif event_type == "error":
+                    results["errors"].append(message)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            # Sesión cerrada por el servidor (p. ej. rechazada por admisión): no esperar más.
+            closed = True
+            response_done.set()
+
+    query = "?audio=binary" if args.binary_audio else ""
+    try:
+        async with websockets.connect(f"{ws_url}{query}", max_size=None) as connection:
+            reader = asyncio.create_task(read_events(connection))
+            try:
+                await asyncio.wait_for(response_done.wait(), args.turn_timeout)  # Saludo inicial.
+                for _ in range(args.turns):
+                    if closed:
+                        break
+                    response_done.clear()
+                    first_audio.clear()
+                    started = time.perf_counter()
+                    for frame_index, frame in enumerate(frames):
+                        await connection.send(frame)
+                        # Ritmo de micrófono: horario absoluto para no acumular deriva.
+                        delay = started + (frame_index + 1) * args.frame_ms / 1000 - time.perf_counter()
+                        if delay > 0 and frame_index + 1 < len(frames):
+                            await asyncio.sleep(delay)
+                    speech_end = time.perf_counter()
+                    try:
+                        await asyncio.wait_for(response_done.wait(), args.turn_timeout)
+                    except asyncio.TimeoutError:
+                        results["timeouts"].append(index)
+                        break
+                    if closed:
+                        break
+                    if first_audio.is_set():
+                        results["first_audio"].append(received_at["first_audio"] - speech_end)
+                    results["response_done"].append(received_at["done"] - speech_end)
+                    await asyncio.sleep(args.think_ms / 1000)
+            finally:
+                reader.cancel()
+    except (OSError, asyncio.TimeoutError, websockets.exceptions.WebSocketException) as err:
+        results["errors"].append(f"quiosco {index}: {err!r}")
+
+
+async def run_load(args: argparse.Namespace, base_url: str, process: subprocess.Popen) -> dict[str, Any]:
+    recording = load_pcm(args.pcm) if args.pcm else build_pcm16_tone(args.turn_audio_ms)
+    turn_audio = build_turn_audio(recording, args.turn_audio_ms)
+    results: dict[str, list] = {
+        "first_audio": [], "response_done": [], "timeouts": [], "errors": [], "queued": [], "rejected": [],
+    }
+
+    await asyncio.sleep(args.settle_seconds)  # Deja que el pool abra sus conexiones.
+    cpu_before, rss_before = read_process_usage(process.pid)
+    peak_rss = rss_before or 0
+
+    async def sample_rss() -> None:
+        nonlocal peak_rss
+        while True:
+            _, rss = read_process_usage(process.pid)
+            peak_rss = max(peak_rss, rss or 0)
+            await asyncio.sleep(0.1)
+
+    sampler = asyncio.create_task(sample_rss())
+    started = time.perf_counter()
+    ws_url = base_url.replace("http://", "ws://") + "/ws"
+    await asyncio.gather(*(run_kiosk(index, ws_url, turn_audio, args, results) for index in range(args.sessions)))
+    elapsed = time.perf_counter() - started
+    sampler.cancel()
+    cpu_after, _ = read_process_usage(process.pid)
+
+    cpu_seconds = cpu_after - cpu_before if cpu_after is not None and cpu_before is not None else None
+    mb = 1024 * 1024
+    return {
+        "elapsed_seconds": round(elapsed, 2),
+        "turns_completed": len(results["response_done"]),
+        "turns_timed_out": len(results["timeouts"]),
+        "sessions_queued": len(results["queued"]),
+        "sessions_rejected": len(results["rejected"]),
+        "errors": results["errors"][:10],
+        "first_audio_latency": summarize_latencies(results["first_audio"]),
+        "response_done_latency": summarize_latencies(results["response_done"]),
+        "server_cpu_seconds": round(cpu_seconds, 3) if cpu_seconds is not None else None,
+        "server_cpu_seconds_per_session": (
+            round(cpu_seconds / args.sessions, 4) if cpu_seconds is not None else None
+        ),
+        "server_cpu_percent": round(100 * cpu_seconds / elapsed, 1) if cpu_seconds is not None else None,
+        "server_rss_baseline_mb": round(rss_before / mb, 1) if rss_before else None,
+        "server_rss_peak_mb": round(peak_rss / mb, 1) if peak_rss else None,
+        "server_rss_per_session_mb": (
+            round((peak_rss - rss_before) / mb / args.sessions, 2) if rss_before else None
+        ),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=10, help="Quioscos simultáneos")
+    parser.add_argument("--turns", type=int, default=3, help="Turnos de voz por quiosco (tras el saludo)")
+    parser.add_argument("--ramp-ms", type=int, default=50, help="Separación entre el arranque de cada quiosco")
+    parser.add_argument("--frame-ms", type=int, default=20, help="Audio por frame binario del quiosco")
+    parser.add_argument("--think-ms", type=int, default=200, help="Pausa tras cada respuesta")
+    parser.add_argument("--pcm", default="", help="Grabación PCM16 mono 24 kHz (.wav o crudo); por defecto, un tono")
+    parser.add_argument("--binary-audio", action="store_true", help="Conecta con /ws?audio=binary")
+    parser.add_argument("--turn-timeout", type=float, default=30)
+    parser.add_argument("--rtdb-delay-ms", type=int, default=20)
+    parser.add_argument("--photo-kb", type=int, default=64)
+    parser.add_argument("--caricatures", type=int, default=0)
+    parser.add_argument("--settle-seconds", type=float, default=1.0)
+    parser.add_argument("--startup-timeout", type=float, default=30)
+    parser.add_argument("--server-log", default="", help="Fichero para stdout/stderr de main:app")
+    parser.add_argument(
+        "--env", action="append", default=[], metavar="KEY=VALUE",
+        help="Variable de entorno extra para main:app (repetible), p. ej. para comparar ajustes",
+    )
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    fake_rtdb = FakeRealtimeDatabase(args.rtdb_delay_ms, args.photo_kb, args.caricatures)
+    rtdb_url = fake_rtdb.start()
+    fake_realtime = FakeRealtimeServer(config_from_arguments(args))
+    realtime_port = start_fake_realtime(fake_realtime)
+    process, base_url = start_backend(args, realtime_port, rtdb_url)
+    try:
+        report = asyncio.run(run_load(args, base_url, process))
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        fake_rtdb.stop()
+
+    print(json.dumps({
+        "sessions": args.sessions,
+        "turns_per_session": args.turns,
+        "binary_audio": args.binary_audio,
+        "env": args.env,
+        **report,
+        "upstream_connections": fake_realtime.connections,
+        "upstream_audio_mb": round(fake_realtime.audio_bytes_received / (1024 * 1024), 2),
+        "rtdb_requests": fake_rtdb.requests,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
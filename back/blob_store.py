@@ -0,0 +1,113 @@
+"""
+Almacén de imágenes direccionado por contenido (clave = SHA-256 de los bytes).
+
+Las caricaturas y fotos se guardan aquí y Realtime Database / WebSocket solo
+transportan una referencia corta (`/blobs/{sha256}`) en lugar del data URL en
+base64. Al ser direccionado por contenido, la misma imagen se guarda una sola
+vez y la clave sirve directamente como ETag inmutable.
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+from abc import ABC, abstractmethod
+from typing import Optional
+
+BLOB_KEY_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+class BlobNotFoundError(KeyError):
+    """La clave no existe en el almacén."""
+
+
+class BlobStore(ABC):
+    """Interfaz de los backends de almacenamiento de imágenes."""
+
+    @abstractmethod
+    def put(self, data: bytes) -> str:
+        """Guarda los bytes y devuelve su clave SHA-256 (idempotente)."""
+
+    @abstractmethod
+    def size(self, key: str) -> int:
+        """Tamaño en bytes; lanza BlobNotFoundError si no existe."""
+
+    @abstractmethod
+    def read(self, key: str, start: int = 0, end: Optional[int] = None) -> bytes:
+        """Lee el rango [start, end] (end inclusivo; None = hasta el final)."""
+
+
+class LocalBlobStore(BlobStore):
+    """
+    Backend en sistema de ficheros local (desarrollo/pruebas o volumen compartido).
+    Estructura: {root}/{clave[:2]}/{clave}.
+    """
+
+    def __init__(self, root: str):
+        self._root = os.path.abspath(root)
+        os.makedirs(self._root, exist_ok=True)
+
+    def put(self, data: bytes) -> str:
+        key = hashlib.sha256(data).hexdigest()
+        path = self._path(key)
+        if os.path.exists(path):
+            return key
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Escritura atómica: nunca se sirve un fichero a medio escribir.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                tmp_file.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return key
+
+    def size(self, key: str) -> int:
+        try:
+            return os.path.getsize(self._path(key))
+        except OSError as err:
+            raise BlobNotFoundError(key) from err
+
+    def read(self, key: str, start: int = 0, end: Optional[int] = None) -> bytes:
+        try:
+            with open(self._path(key), "rb") as blob_file:
+                blob_file.seek(start)
+                length = -1 if end is None else max(0, end - start + 1)
+                return blob_file.read(length)
+        except OSError as err:
+            raise BlobNotFoundError(key) from err
+
+    def _path(self, key: str) -> str:
+        if not BLOB_KEY_PATTERN.match(key):
+            raise BlobNotFoundError(key)
+        return os.path.join(self._root, key[:2], key)
+
+
+def create_blob_store(backend: str, local_dir: str) -> Optional[BlobStore]:
+    """
+    Crea el backend configurado. `inline` (o vacío) devuelve None: las imágenes
+    siguen viajando como data URL en Realtime Database.
+    """
+    normalized = (backend or "").strip().lower()
+    if normalized in ("", "inline"):
+        return None
+    if normalized == "local":
+        return LocalBlobStore(local_dir)
+    raise ValueError(f"BLOB_STORE_BACKEND desconocido: {backend}")
+
+
+def sniff_image_content_type(head: bytes) -> str:
+    """Detecta el tipo de imagen por su firma (magic bytes)."""
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    return "application/octet-stream"
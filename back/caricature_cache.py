@@ -0,0 +1,262 @@
+"""
+Caché de resultados de generación de caricaturas.
+
+La clave es el SHA-256 de los bytes decodificados de la foto más los parámetros
+que determinan el resultado (prompt, modelo, api-version, preprocesado). Si el
+visitante reenvía la misma foto o el frontend reintenta tras un timeout, se
+reutilizan las caricaturas ya generadas en lugar de pagar otra edición en Azure.
+
+Dos niveles: memoria (LRU con límite de bytes y entradas) y, opcionalmente,
+disco (un JSON por clave, expulsión por antigüedad de uso al superar el límite).
+Las peticiones idénticas concurrentes se coalescen (single-flight): solo la
+primera llama a Azure y el resto espera su resultado (y recibe sus resultados
+parciales); cancelar cualquiera de ellas, incluida la primera, no cancela la
+generación de las demás.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+CACHE_SOURCE_MEMORY = "memory"
+CACHE_SOURCE_DISK = "disk"
+CACHE_SOURCE_COALESCED = "coalesced"
+CACHE_SOURCE_GENERATED = "generated"
+
+
+def build_caricature_cache_key(image_bytes: bytes, **parameters: Any) -> str:
+    """SHA-256 de la foto más los parámetros de generación (orden de claves estable)."""
+    digest = hashlib.sha256(image_bytes)
+    digest.update(b"\x00")
+    digest.update(json.dumps(parameters, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class CaricatureResultCache:
+    """
+    Los resultados son listas de imágenes en base64. Los errores no se cachean:
+    se propagan a todas las peticiones coalescidas y la siguiente vuelve a generar.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        max_entries: int = 64,
+        disk_dir: str = "",
+        disk_max_bytes: int = 512 * 1024 * 1024,
+    ):
+        self._max_bytes = max(0, max_bytes)
+        self._max_entries = max(1, max_entries)
+        self._disk_dir = os.path.abspath(disk_dir) if disk_dir else ""
+        self._disk_max_bytes = max(0, disk_max_bytes)
+        # clave -> (imágenes base64, tamaño en bytes)
+        self._entries: OrderedDict[str, tuple[list[str], int]] = OrderedDict()
+        self._total_bytes = 0
+        self._in_flight: dict[str, asyncio.Task] = {}
+        # Resultados parciales (previsualizaciones) de cada generación en curso.
+        self._partial_listeners: dict[str, list[Callable[[Any], None]]] = {}
+        self._last_partial: dict[str, Any] = {}
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.coalesced = 0
+        self.misses = 0
+        self.evictions = 0
+        if self._disk_dir:
+            os.makedirs(self._disk_dir, exist_ok=True)
+
+    async def get_or_generate(
+        self,
+        key: str,
+        generate: Callable[[Callable[[Any], None]], Awaitable[list[str]]],
+        on_partial: Optional[Callable[[Any], None]] = None,
+    ) -> tuple[list[str], str]:
+        """
+        Devuelve (imágenes, origen) con origen memory/disk/coalesced/generated.
+        `generate(publish)` recibe con qué publicar resultados parciales (desde el
+        event loop); cada uno llega al `on_partial` de todas las peticiones que
+        esperan esa generación, y quien se une tarde recibe primero el último.
+        """
+        cached = self._get_memory(key)
+        if cached is not None:
+            self.memory_hits += 1
+            return cached, CACHE_SOURCE_MEMORY
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            images, _ = await self._wait_in_flight(key, task, on_partial)
+            return list(images), CACHE_SOURCE_COALESCED
+
+        # La generación va en una tarea propia de la caché: si se cancela la petición
+        # que la inició, sigue para las coalescidas (y su resultado queda cacheado).
+        self._partial_listeners[key] = []
+        task = asyncio.create_task(
+            self._load_or_generate(key, generate, lambda partial: self._publish_partial(key, partial))
+        )
+        self._in_flight[key] = task
+        task.add_done_callback(lambda done: self._finish_in_flight(key, done))
+        images, source = await self._wait_in_flight(key, task, on_partial)
+        return list(images), source
+
+    async def _wait_in_flight(
+        self,
+        key: str,
+        task: asyncio.Task,
+        on_partial: Optional[Callable[[Any], None]],
+    ) -> tuple[list[str], str]:
+        listeners = self._partial_listeners.get(key)
+        if on_partial is None or listeners is None:
+            return await asyncio.shield(task)
+        if key in self._last_partial:
+            on_partial(self._last_partial[key])
+        listeners.append(on_partial)
+        try:
+            return await asyncio.shield(task)
+        finally:
+            listeners.remove(on_partial)
+
+    def _publish_partial(self, key: str, partial: Any) -> None:
+        if key not in self._partial_listeners:
+            return
+        self._last_partial[key] = partial
+        for listener in list(self._partial_listeners[key]):
+            listener(partial)
+
+    async def _load_or_generate(
+        self,
+        key: str,
+        generate: Callable[[Callable[[Any], None]], Awaitable[list[str]]],
+        publish: Callable[[Any], None],
+    ) -> tuple[list[str], str]:
+        images = await self._read_disk(key)
+        if images is not None:
+            self.disk_hits += 1
+            source = CACHE_SOURCE_DISK
+        else:
+            self.misses += 1
+            images = await generate(publish)
+            source = CACHE_SOURCE_GENERATED
+            if images:
+                await self._write_disk(key, images)
+        if images:
+            self._put_memory(key, images)
+        return images, source
+
+    def _finish_in_flight(self, key: str, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+            self._partial_listeners.pop(key, None)
+            self._last_partial.pop(key, None)
+        if not task.cancelled():
+            # Evita el aviso "exception was never retrieved" si ya nadie esperaba.
+            task.exception()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._total_bytes,
+            "in_flight": len(self._in_flight),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "disk_enabled": bool(self._disk_dir),
+        }
+
+    def _get_memory(self, key: str) -> Optional[list[str]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return list(entry[0])
+
+    def _put_memory(self, key: str, images: list[str]) -> None:
+        size = sum(len(image) for image in images)
+        if size > self._max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._total_bytes -= previous[1]
+        self._entries[key] = (list(images), size)
+        self._total_bytes += size
+        while self._entries and (
+            len(self._entries) > self._max_entries or self._total_bytes > self._max_bytes
+        ):
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._total_bytes -= evicted_size
+            self.evictions += 1
+
+    async def _read_disk(self, key: str) -> Optional[list[str]]:
+        if not self._disk_dir:
+            return None
+        return await asyncio.to_thread(self._read_disk_sync, key)
+
+    async def _write_disk(self, key: str, images: list[str]) -> None:
+        if not self._disk_dir:
+            return
+        try:
+            await asyncio.to_thread(self._write_disk_sync, key, images)
+        except OSError as err:
+            # El nivel de disco es una optimización: un fallo no debe perder la generación.
+            print(f"⚠️ No se pudo guardar la caricatura en la caché de disco: {err}")
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self._disk_dir, key[:2], f"{key}.json")
+
+    def _read_disk_sync(self, key: str) -> Optional[list[str]]:
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as cache_file:
+                images = json.load(cache_file)
+            # mtime = último uso, para expulsar primero lo menos usado.
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(images, list) or not all(isinstance(image, str) for image in images):
+            return None
+        return images
+
+    def _write_disk_sync(self, key: str, images: list[str]) -> None:
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as tmp_file:
+                json.dump(images, tmp_file)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        self._evict_disk_sync()
+
+    def _evict_disk_sync(self) -> None:
+        files: list[tuple[float, int, str]] = []
+        total = 0
+        for directory, _, names in os.walk(self._disk_dir):
+            for name in names:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        files.sort()
+        for _, size, path in files:
+            if total <= self._disk_max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
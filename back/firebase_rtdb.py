@@ -0,0 +1,160 @@
+"""
+Cliente asyncio para la API REST de Firebase Realtime Database.
+
+Sustituye las llamadas bloqueantes (Admin SDK / urllib) que se ejecutaban con
+`asyncio.to_thread`: usa un único `httpx.AsyncClient` con conexiones HTTP/1.1
+keep-alive reutilizadas, timeout por llamada y un semáforo que limita las
+peticiones simultáneas para no saturar Firebase en ráfagas.
+"""
+
+import asyncio
+import datetime
+import json
+from typing import Any, Callable, Optional
+
+import httpx
+
+
+class FirebaseRealtimeError(RuntimeError):
+    """Error de transporte o respuesta HTTP no exitosa de Realtime Database."""
+
+
+class FirebaseRealtimeClient:
+    """
+    Acceso REST a Realtime Database (`{database_url}/{path}.json`).
+
+    Si se indica `token_provider` (p. ej. `credential.get_access_token` del Admin SDK),
+    las peticiones se autentican con OAuth2 Bearer; el token se renueva en un hilo
+    solo cuando está a punto de caducar. Sin proveedor, se usa acceso público.
+    """
+
+    # Margen para renovar el token antes de que caduque.
+    TOKEN_REFRESH_MARGIN_SECONDS = 120
+
+    def __init__(
+        self,
+        database_url: str,
+        token_provider: Optional[Callable[[], Any]] = None,
+        timeout_seconds: float = 5,
+        max_connections: int = 20,
+        max_concurrency: int = 16,
+    ):
+        self._base_url = database_url.rstrip("/")
+        self._token_provider = token_provider
+        self._timeout_seconds = timeout_seconds
+        self._max_connections = max(1, max_connections)
+        self._max_concurrency = max(1, max_concurrency)
+        self._http: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._token_lock: Optional[asyncio.Lock] = None
+        self._access_token: Optional[str] = None
+        self._token_expiry: Optional[datetime.datetime] = None
+
+    @property
+    def configured(self) -> bool:
+        return bool(self._base_url)
+
+    async def get(
+        self,
+        path: str,
+        params: Optional[dict[str, str]] = None,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """GET de un nodo. Devuelve None si no existe."""
+        response = await self._request("GET", path, params=params, timeout=timeout)
+        if response.status_code == 404:
+            return None
+        return response.json() if response.content else None
+
+    async def put(self, path: str, value: Any, timeout: Optional[float] = None) -> None:
+        """Sobrescribe el nodo completo."""
+        await self._request("PUT", path, body=value, timeout=timeout)
+
+    async def patch(self, path: str, fields: dict[str, Any], timeout: Optional[float] = None) -> None:
+        """Actualiza solo los hijos indicados (admite rutas multi-nivel como claves)."""
+        await self._request("PATCH", path, body=fields, timeout=timeout)
+
+    async def aclose(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        body: Any = None,
+        params: Optional[dict[str, str]] = None,
+        timeout: Optional[float] = None,
+    ) -> httpx.Response:
+        if not self.configured:
+            raise FirebaseRealtimeError("FIREBASE_DATABASE_URL no configurado")
+
+        http = self._get_http()
+        headers: dict[str, str] = {}
+        token = await self._get_access_token()
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        content = None
+        if body is not None:
+            content = json.dumps(body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+
+        url = f"{self._base_url}/{path.strip('/')}.json"
+        async with self._semaphore:
+            try:
+                response = await http.request(
+                    method,
+                    url,
+                    params=params,
+                    content=content,
+                    headers=headers,
+                    timeout=timeout if timeout is not None else self._timeout_seconds,
+                )
+            except httpx.HTTPError as err:
+                raise FirebaseRealtimeError(f"{method} {path}: {err!r}") from err
+
+        if response.status_code == 404 and method == "GET":
+            return response
+        if not 200 <= response.status_code < 300:
+            raise FirebaseRealtimeError(
+                f"{method} {path}: HTTP {response.status_code} {response.text[:200]}"
+            )
+        return response
+
+    def _get_http(self) -> httpx.AsyncClient:
+        # Se crea perezosamente para quedar ligado al event loop de la aplicación.
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self._max_connections,
+                    max_keepalive_connections=self._max_connections,
+                    keepalive_expiry=60,
+                ),
+                timeout=self._timeout_seconds,
+            )
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+            self._token_lock = asyncio.Lock()
+        return self._http
+
+    async def _get_access_token(self) -> Optional[str]:
+        if self._token_provider is None:
+            return None
+        if self._token_is_fresh():
+            return self._access_token
+
+        async with self._token_lock:
+            if not self._token_is_fresh():
+                # La renovación OAuth del Admin SDK es bloqueante; ocurre ~1 vez por hora.
+                token_info = await asyncio.to_thread(self._token_provider)
+                self._access_token = token_info.access_token
+                self._token_expiry = token_info.expiry
+        return self._access_token
+
+    def _token_is_fresh(self) -> bool:
+        if not self._access_token:
+            return False
+        if self._token_expiry is None:
+            return True
+        remaining = self._token_expiry - datetime.datetime.utcnow()
+        return remaining.total_seconds() > self.TOKEN_REFRESH_MARGIN_SECONDS
@@ -0,0 +1,173 @@
+"""
+Manejo de imágenes en bytes sin copias completas intermedias.
+
+- `Base64FieldStreamDecoder`: decodifica el campo base64 de un cuerpo JSON según
+  llegan los chunks de la petición (`request.stream()`), sin construir nunca el
+  string base64 completo; del resto del JSON solo se guardan los campos pequeños.
+- `MultipartFormBody`: cuerpo multipart/form-data que `requests` envía por trozos
+  (memoryview sobre la imagen) en lugar de montar una copia completa en memoria.
+"""
+
+import binascii
+import json
+import re
+import uuid
+from typing import Any, Iterator, Union
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+# Un data URL ("data:image/jpeg;base64,") cabe de sobra en este prefijo.
+DATA_URL_PREFIX_MAX_BYTES = 128
+CHUNK_BYTES = 64 * 1024
+# Margen para el `\s*` alrededor de los dos puntos al reanudar la búsqueda de la clave.
+KEY_SEARCH_SLACK_BYTES = 64
+
+
+class PayloadTooLargeError(ValueError):
+    """El cuerpo de la petición supera el tamaño máximo permitido."""
+
+
+class Base64FieldStreamDecoder:
+    """
+    `feed(chunk)` por cada chunk del cuerpo y `finish()` al terminar, que devuelve
+    (resto de campos del JSON, bytes decodificados del campo). Lanza ValueError si
+    el JSON o el base64 no son válidos y PayloadTooLargeError si se supera `max_bytes`.
+    """
+
+    def __init__(self, field_name: str, max_bytes: int = 0):
+        key = field_name.encode("utf-8")
+        self._key_pattern = re.compile(rb'"' + re.escape(key) + rb'"\s*:\s*"')
+        # La búsqueda se reanuda donde quedó la anterior (menos lo que puede ocupar una
+        # clave partida entre chunks): con la clave tarde o ausente no es cuadrática.
+        self._key_span = len(key) + 4 + KEY_SEARCH_SLACK_BYTES
+        self._search_from = 0
+        self._max_bytes = max_bytes
+        self._received = 0
+        self._state = "head"
+        self._head = bytearray()
+        self._tail = bytearray()
+        self._prefix = b""
+        self._pending = b""
+        self._decoded = bytearray()
+
+    def feed(self, chunk: BytesLike) -> None:
+        self._received += len(chunk)
+        if self._max_bytes and self._received > self._max_bytes:
+            raise PayloadTooLargeError(f"Cuerpo mayor de {self._max_bytes} bytes")
+
+        # Se procesa en trozos acotados: las copias parciales (cabecera, prefijo, resto
+        # de base64) nunca son del tamaño del cuerpo aunque llegue en un único chunk.
+        view = memoryview(chunk)
+        for offset in range(0, len(view), CHUNK_BYTES):
+            self._feed_piece(bytes(view[offset:offset + CHUNK_BYTES]))
+
+    def _feed_piece(self, chunk: bytes) -> None:
+        if self._state == "head":
+            self._head += chunk
+            match = self._key_pattern.search(self._head, self._search_from)
+            if match is None:
+                self._search_from = max(0, len(self._head) - self._key_span)
+                return
+            # Lo que ya llegó del valor se procesa como si fuera un chunk nuevo.
+            chunk = bytes(self._head[match.end():])
+            del self._head[match.end():]
+            self._state = "prefix"
+
+        if self._state == "tail":
+            self._tail += chunk
+            return
+
+        end = chunk.find(b'"')
+        self._feed_value(chunk if end < 0 else chunk[:end])
+        if end >= 0:
+            if self._state == "prefix":
+                self._flush_prefix()
+            if self._pending:
+                raise ValueError("Base64 inválido: longitud incorrecta")
+            self._state = "tail"
+            self._tail += chunk[end + 1:]
+
+    def finish(self) -> tuple[dict[str, Any], bytes]:
+        if self._state != "tail":
+            raise ValueError("Campo base64 ausente o JSON incompleto")
+        try:
+            fields = json.loads(bytes(self._head) + b'"' + bytes(self._tail))
+        except ValueError as err:
+            raise ValueError(f"JSON inválido: {err}") from err
+        if not isinstance(fields, dict):
+            raise ValueError("Se esperaba un objeto JSON")
+        self._head.clear()
+        self._tail.clear()
+        # bytes inmutables: io.BytesIO y hashlib los usan sin copiar; el bytearray se libera.
+        decoded = bytes(self._decoded)
+        self._decoded = bytearray()
+        return fields, decoded
+
+    def _feed_value(self, part: bytes) -> None:
+        if self._state != "prefix":
+            self._decode(part)
+            return
+        # Se acumula el inicio del valor para descartar el prefijo "data:...;base64,".
+        self._prefix += part
+        if len(self._prefix) >= DATA_URL_PREFIX_MAX_BYTES:
+            self._flush_prefix()
+
+    def _flush_prefix(self) -> None:
+        prefix, self._prefix = self._prefix, b""
+        self._state = "value"
+        if prefix.startswith(b"data:"):
+            marker = prefix.find(b"base64,")
+            if marker < 0:
+                raise ValueError("Data URL sin base64")
+            prefix = prefix[marker + len(b"base64,"):]
+        self._decode(prefix)
+
+    def _decode(self, part: bytes) -> None:
+        if b"\\" in part:
+            raise ValueError("Base64 con caracteres escapados")
+        data = self._pending + part if self._pending else part
+        # Se decodifican bloques completos de 4 caracteres; el resto espera al siguiente chunk.
+        usable = len(data) // 4 * 4
+        if usable:
+            try:
+                self._decoded += binascii.a2b_base64(memoryview(data)[:usable], strict_mode=True)
+            except binascii.Error as err:
+                raise ValueError(f"Base64 inválido: {err}") from err
+        self._pending = data[usable:]
+
+
+class MultipartFormBody:
+    """
+    Cuerpo multipart/form-data iterable y con longitud conocida: `requests` lo envía
+    por trozos con Content-Length (sin chunked) y la imagen no se copia.
+    """
+
+    def __init__(self, fields: dict[str, str], file_field: str, filename: str, data: BytesLike, content_type: str):
+        self.boundary = uuid.uuid4().hex
+        parts: list[BytesLike] = []
+        for name, value in fields.items():
+            parts.append(
+                f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode("utf-8")
+            )
+        parts.append(
+            (
+                f"--{self.boundary}\r\n"
+                f'Content-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+                f"Content-Type: {content_type}\r\n\r\n"
+            ).encode("utf-8")
+        )
+        parts.append(memoryview(data))
+        parts.append(f"\r\n--{self.boundary}--\r\n".encode("utf-8"))
+        self._parts = parts
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self) -> int:
+        return sum(len(part) for part in self._parts)
+
+    def __iter__(self) -> Iterator[BytesLike]:
+        for part in self._parts:
+            for offset in range(0, len(part), CHUNK_BYTES):
+                yield part[offset:offset + CHUNK_BYTES]
@@ -0,0 +1,93 @@
+"""
+Lectura incremental de la respuesta en streaming de images/edits (`stream=true`).
+
+Azure/OpenAI envían Server-Sent Events `image_edit.partial_image` (previsualizaciones
+progresivas) e `image_edit.completed` (imagen final), cada uno con un `b64_json`
+de varios MB. El parser consume los chunks según llegan y emite cada evento en
+cuanto está completo: el buffer solo contiene el evento en curso y cada imagen
+se decodifica una vez desde los bytes recibidos, sin copias intermedias del texto.
+"""
+
+import json
+from typing import Any, Iterator, Optional
+
+PARTIAL_IMAGE_EVENT_TYPES = frozenset({
+    "image_edit.partial_image",
+    "image_generation.partial_image",
+})
+COMPLETED_IMAGE_EVENT_TYPES = frozenset({
+    "image_edit.completed",
+    "image_generation.completed",
+})
+
+EVENT_SEPARATORS = (b"\n\n", b"\r\n\r\n")
+
+
+class ImageStreamParser:
+    """Parser SSE incremental: `feed(chunk)` devuelve los eventos completados por ese chunk."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        # Posición a partir de la que buscar el separador: no se re-escanean los MB ya vistos.
+        self._scan_from = 0
+
+    def feed(self, chunk: bytes) -> list[dict[str, Any]]:
+        self._buffer += chunk
+        return list(self._drain())
+
+    def close(self) -> list[dict[str, Any]]:
+        """Procesa un último evento sin separador final (si el servidor cerró sin él)."""
+        if not self._buffer.strip():
+            self._buffer.clear()
+            return []
+        self._buffer += b"\n\n"
+        return list(self._drain())
+
+    def _drain(self) -> Iterator[dict[str, Any]]:
+        while True:
+            end, separator_length = self._find_separator()
+            if end < 0:
+                # El separador más largo puede quedar partido entre dos chunks.
+                self._scan_from = max(0, len(self._buffer) - 3)
+                return
+            block = bytes(memoryview(self._buffer)[:end])
+            del self._buffer[:end + separator_length]
+            self._scan_from = 0
+            event = parse_sse_block(block)
+            if event is not None:
+                yield event
+
+    def _find_separator(self) -> tuple[int, int]:
+        best, best_length = -1, 0
+        for separator in EVENT_SEPARATORS:
+            index = self._buffer.find(separator, self._scan_from)
+            if index >= 0 and (best < 0 or index < best):
+                best, best_length = index, len(separator)
+        return best, best_length
+
+
+def parse_sse_block(block: bytes) -> Optional[dict[str, Any]]:
+    """Convierte un bloque SSE en dict (`type` sale del JSON o de la línea `event:`)."""
+    event_name = ""
+    data_lines: list[bytes] = []
+    for line in block.split(b"\n"):
+        line = line.rstrip(b"\r")
+        if line.startswith(b"data:"):
+            data_lines.append(line[5:].lstrip(b" "))
+        elif line.startswith(b"event:"):
+            event_name = line[6:].strip().decode("utf-8", errors="replace")
+
+    if not data_lines:
+        return None
+    data = data_lines[0] if len(data_lines) == 1 else b"\n".join(data_lines)
+    if data.strip() == b"[DONE]":
+        return None
+    try:
+        event = json.loads(data)
+    except ValueError:
+        return None
+    if not isinstance(event, dict):
+        return None
+    if event_name and not event.get("type"):
+        event["type"] = event_name
+    return event
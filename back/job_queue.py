@@ -0,0 +1,250 @@
+"""
+Cola de trabajos asíncrona en memoria con workers acotados.
+
+Se usa para que las peticiones largas (p. ej. la generación de caricaturas,
+20-90 s contra Azure) no mantengan abierta la petición HTTP: el envío devuelve
+un id de trabajo al momento y el cliente consulta el estado o se suscribe a
+sus cambios. Los fallos transitorios se reintentan con backoff exponencial.
+"""
+
+import asyncio
+import datetime
+import uuid
+from dataclasses import dataclass, field
+from time import monotonic
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_RETRYING = "retrying"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+TERMINAL_JOB_STATUSES = frozenset({JOB_SUCCEEDED, JOB_FAILED})
+
+
+class PermanentJobError(RuntimeError):
+    """Error que no se resuelve reintentando (datos de entrada inválidos, 4xx...)."""
+
+
+class JobQueueFullError(RuntimeError):
+    """La cola ha alcanzado su capacidad máxima."""
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    payload: Any
+    # Clave de negocio opcional (p. ej. número de orden) para buscar su último trabajo.
+    key: Optional[str] = None
+    status: str = JOB_QUEUED
+    stage: str = ""
+    attempts: int = 0
+    error: Optional[str] = None
+    result: Optional[dict[str, Any]] = None
+    created_at: str = field(default_factory=lambda: datetime.datetime.utcnow().isoformat() + "Z")
+    finished_at: Optional[str] = None
+    finished_monotonic: Optional[float] = None
+    # Última previsualización ({"index", "image"}); fuera del snapshot por su tamaño.
+    preview: Optional[dict[str, Any]] = field(default=None, repr=False)
+    _listeners: list[asyncio.Queue] = field(default_factory=list, repr=False)
+
+    @property
+    def done(self) -> bool:
+        return self.status in TERMINAL_JOB_STATUSES
+
+    def set_stage(self, stage: str) -> None:
+        """Progreso intermedio reportado por el runner (se publica a los suscriptores)."""
+        self.stage = stage
+        self._publish()
+
+    def set_preview(self, preview: Optional[dict[str, Any]]) -> None:
+        """Resultado parcial (p. ej. imagen progresiva); el snapshot solo lleva su índice."""
+        self.preview = preview
+        self._publish()
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "jobId": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "stage": self.stage,
+            "previewIndex": self.preview.get("index") if self.preview else None,
+            "attempts": self.attempts,
+            "error": self.error,
+            "result": self.result,
+            "createdAt": self.created_at,
+            "finishedAt": self.finished_at,
+        }
+
+    def _publish(self) -> None:
+        snapshot = self.snapshot()
+        for listener in list(self._listeners):
+            listener.put_nowait(snapshot)
+
+
+class JobQueue:
+    """
+    `runner(job)` ejecuta el trabajo y devuelve el resultado; si lanza
+    PermanentJobError el trabajo falla sin reintentos, cualquier otra excepción
+    se reintenta hasta `max_attempts` con backoff `retry_base_seconds * 2^n`.
+    """
+
+    def __init__(
+        self,
+        kind: str,
+        runner: Callable[[Job], Awaitable[dict[str, Any]]],
+        concurrency: int = 2,
+        max_queue_size: int = 50,
+        max_attempts: int = 3,
+        retry_base_seconds: float = 2,
+        retention_seconds: float = 3600,
+    ):
+        self._kind = kind
+        self._runner = runner
+        self._concurrency = max(1, concurrency)
+        self._max_queue_size = max(1, max_queue_size)
+        self._max_attempts = max(1, max_attempts)
+        self._retry_base_seconds = retry_base_seconds
+        self._retention_seconds = retention_seconds
+        self._jobs: dict[str, Job] = {}
+        self._latest_by_key: dict[str, str] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: list[asyncio.Task] = []
+        self._retry_tasks: set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=self._max_queue_size)
+        self._workers = [
+            asyncio.create_task(self._worker(index)) for index in range(self._concurrency)
+        ]
+
+    async def stop(self) -> None:
+        for task in [*self._workers, *self._retry_tasks]:
+            task.cancel()
+        await asyncio.gather(*self._workers, *self._retry_tasks, return_exceptions=True)
+        self._workers = []
+        self._retry_tasks.clear()
+
+    def submit(self, payload: Any, key: Optional[str] = None) -> Job:
+        """
+        Encola un trabajo y lo devuelve inmediatamente (JobQueueFullError si no cabe).
+        Con `key`, queda como el último trabajo de esa clave (ver `latest`).
+        """
+        if self._queue is None:
+            raise RuntimeError("La cola de trabajos no está iniciada")
+        self._prune_finished()
+        job = Job(id=uuid.uuid4().hex, kind=self._kind, payload=payload, key=key)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull as err:
+            raise JobQueueFullError(f"Cola de {self._kind} llena") from err
+        self._jobs[job.id] = job
+        if key is not None:
+            self._latest_by_key[key] = job.id
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def latest(self, key: str) -> Optional[Job]:
+        """Último trabajo enviado con `key` mientras la cola lo conserve."""
+        job_id = self._latest_by_key.get(key)
+        return self._jobs.get(job_id) if job_id is not None else None
+
+    async def subscribe(self, job: Job) -> AsyncIterator[dict[str, Any]]:
+        """Emite el estado actual y cada cambio posterior hasta que el trabajo termina."""
+        listener: asyncio.Queue = asyncio.Queue()
+        job._listeners.append(listener)
+        try:
+            snapshot = job.snapshot()
+            yield snapshot
+            while not job.done or not listener.empty():
+                snapshot = await listener.get()
+                yield snapshot
+                if snapshot["status"] in TERMINAL_JOB_STATUSES:
+                    break
+        finally:
+            job._listeners.remove(listener)
+
+    def stats(self) -> dict[str, Any]:
+        counts: dict[str, int] = {}
+        for job in self._jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {
+            "concurrency": self._concurrency,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "jobs": counts,
+        }
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job) -> None:
+        job.attempts += 1
+        job.status = JOB_RUNNING
+        job._publish()
+        try:
+            result = await self._runner(job)
+        except asyncio.CancelledError:
+            raise
+        except PermanentJobError as err:
+            self._finish(job, JOB_FAILED, error=str(err))
+        except Exception as err:
+            if job.attempts >= self._max_attempts:
+                self._finish(job, JOB_FAILED, error=str(err))
+                return
+            delay = self._retry_base_seconds * (2 ** (job.attempts - 1))
+            print(
+                f"⚠️ Trabajo {self._kind} {job.id} falló (intento {job.attempts}), "
+                f"reintento en {delay:.1f}s: {err}"
+            )
+            job.status = JOB_RETRYING
+            job.error = str(err)
+            job._publish()
+            # El backoff no ocupa un worker: se reencola cuando vence la espera.
+            task = asyncio.create_task(self._requeue_after(job, delay))
+            self._retry_tasks.add(task)
+            task.add_done_callback(self._retry_tasks.discard)
+        else:
+            self._finish(job, JOB_SUCCEEDED, result=result)
+
+    async def _requeue_after(self, job: Job, delay: float) -> None:
+        await asyncio.sleep(delay)
+        await self._queue.put(job)
+
+    def _finish(
+        self,
+        job: Job,
+        status: str,
+        result: Optional[dict[str, Any]] = None,
+        error: Optional[str] = None,
+    ) -> None:
+        job.status = status
+        job.result = result
+        job.error = error
+        job.payload = None  # Liberar la entrada (p. ej. la foto en base64) cuanto antes.
+        job.preview = None
+        job.finished_at = datetime.datetime.utcnow().isoformat() + "Z"
+        job.finished_monotonic = monotonic()
+        job._publish()
+
+    def _prune_finished(self) -> None:
+        now = monotonic()
+        expired = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job.finished_monotonic is not None
+            and now - job.finished_monotonic > self._retention_seconds
+        ]
+        for job_id in expired:
+            job = self._jobs.pop(job_id)
+            if job.key is not None and self._latest_by_key.get(job.key) == job_id:
+                del self._latest_by_key[job.key]
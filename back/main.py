@@ -1,28 +1,81 @@
 import asyncio
 import base64
+import binascii
 import datetime
 import json
+import logging
 import os
 import re
+import struct
 import sys
-import unicodedata
-import urllib.error
 import urllib.request
-from time import time
-from typing import Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from time import monotonic, time
+from typing import Any, Awaitable, Callable, Optional
 
 import requests
 import websockets
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
 from firebase_admin import credentials, db, initialize_app
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from openai import AzureOpenAI
 from pydantic import BaseModel
 
+from blob_store import BlobNotFoundError, create_blob_store, sniff_image_content_type
+from caricature_cache import CaricatureResultCache, build_caricature_cache_key
+from firebase_rtdb import FirebaseRealtimeClient, FirebaseRealtimeError
+from image_payloads import Base64FieldStreamDecoder, MultipartFormBody, PayloadTooLargeError
+from image_stream import COMPLETED_IMAGE_EVENT_TYPES, PARTIAL_IMAGE_EVENT_TYPES, ImageStreamParser
+from job_queue import JOB_SUCCEEDED, Job, JobQueue, JobQueueFullError, PermanentJobError
+from metrics import (
+    TURN_STAGE_RESPONSE_CREATE,
+    TURN_STAGE_USER_LOOKUP,
+    Gauge,
+    Histogram,
+    TurnLatencyTracker,
+    render_metrics,
+    set_enabled as set_metrics_enabled,
+    timed,
+)
+from order_number import OrderNumberExtractor, languages_for_codes, normalize_text
+from order_prefetch import OrderNumberPrefetcher
+from photo_preprocessing import preprocess_photo
+from realtime_pool import RealtimeConnectionPool
+from robot_dispatch import RobotDispatcher, RobotQueueFullError
+from structured_log import LogSampler, bind_log_context, configure_logging, logging_stats, update_log_context
+from summarization import SUMMARY_SOURCE_FALLBACK, SummarizationService, SummaryQueueFullError
+from session_registry import SessionLimitError, SessionRegistry, VoiceSession
+from summary_batch import BATCH_ID_PATTERN, SummaryCheckpointStore, stream_summary_batch
+from user_cache import UserRecordCache
+
 load_dotenv()
 
-app = FastAPI(title="GPT Realtime Voice API")
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """Arranca y detiene los servicios en segundo plano del backend."""
+    await realtime_pool.start()
+    await caricature_jobs.start()
+    await robot_dispatcher.start()
+    await summarization_service.start()
+    try:
+        yield
+    finally:
+        await summarization_service.stop()
+        for task in list(deferred_robot_dispatches.values()):
+            task.cancel()
+        await robot_dispatcher.stop()
+        await caricature_jobs.stop()
+        image_generation_executor.shutdown(wait=False, cancel_futures=True)
+        await realtime_pool.stop()
+        await firebase_rtdb.aclose()
+
+
+app = FastAPI(title="GPT Realtime Voice API", lifespan=lifespan)
 
 cors_origins = os.getenv(
     "CORS_ORIGINS",
@@ -61,13 +114,104 @@ MODEL_NAME = os.getenv("MODEL_NAME", "gpt-realtime")
 FIREBASE_DATABASE_URL = os.getenv("FIREBASE_DATABASE_URL", "")
 FIREBASE_SERVICE_ACCOUNT_PATH = os.getenv("FIREBASE_SERVICE_ACCOUNT_PATH", "")
 FIREBASE_SERVICE_ACCOUNT_JSON = os.getenv("FIREBASE_SERVICE_ACCOUNT_JSON", "")
+# Cliente REST asíncrono de Realtime Database (keep-alive, timeouts y concurrencia acotada).
+FIREBASE_HTTP_TIMEOUT_SECONDS = float(os.getenv("FIREBASE_HTTP_TIMEOUT_SECONDS", "5"))
+FIREBASE_HTTP_WRITE_TIMEOUT_SECONDS = float(os.getenv("FIREBASE_HTTP_WRITE_TIMEOUT_SECONDS", "10"))
+FIREBASE_HTTP_MAX_CONNECTIONS = int(os.getenv("FIREBASE_HTTP_MAX_CONNECTIONS", "20"))
+FIREBASE_HTTP_MAX_CONCURRENCY = int(os.getenv("FIREBASE_HTTP_MAX_CONCURRENCY", "16"))
+# Caché de users/{order_number}: TTL, caché negativa, LRU con límite de entradas y bytes.
+# USER_CACHE_TTL_SECONDS=0 la desactiva. El listener de users/ (invalidación por cambios)
+# es opcional porque su sincronización inicial descarga todo el nodo users.
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+USER_CACHE_NEGATIVE_TTL_SECONDS = float(os.getenv("USER_CACHE_NEGATIVE_TTL_SECONDS", "5"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "256"))
+USER_CACHE_MAX_BYTES = int(os.getenv("USER_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+USER_CACHE_FIREBASE_LISTENER = os.getenv("USER_CACHE_FIREBASE_LISTENER", "false").strip().lower() in ("1", "true", "yes")
+# Idiomas reconocidos al detectar el número de orden (es, en, ca).
+ORDER_NUMBER_LANGUAGES = os.getenv("ORDER_NUMBER_LANGUAGES", "es,en").split(",")
+# Lectura especulativa de users/{order} con la transcripción parcial (eventos delta),
+# confirmada o descartada con la transcripción final.
+ORDER_NUMBER_PREFETCH = os.getenv("ORDER_NUMBER_PREFETCH", "true").strip().lower() in ("1", "true", "yes")
+ORDER_NUMBER_PREFETCH_MAX_PER_TURN = int(os.getenv("ORDER_NUMBER_PREFETCH_MAX_PER_TURN", "3"))
+# whisper-1 envía el texto en un único delta; gpt-4o-transcribe lo envía por trozos.
+REALTIME_TRANSCRIPTION_MODEL = os.getenv("REALTIME_TRANSCRIPTION_MODEL", "whisper-1").strip() or "whisper-1"
 USER_DATA_API_URL = os.getenv("USER_DATA_API_URL", "").strip()
 USER_DATA_API_TIMEOUT_SECONDS = int(os.getenv("USER_DATA_API_TIMEOUT_SECONDS", "5"))
 USER_DATA_API_RETRIES = int(os.getenv("USER_DATA_API_RETRIES", "2"))
 
-# URLs para eventos de robot (regalo y caricatura)
-GIFT_ROBOT_API_URL = os.getenv("GIFT_ROBOT_API_URL", "aqui irá la URL del regalo")
-CARICATURE_ROBOT_API_URL = os.getenv("CARICATURE_ROBOT_API_URL", "aqui irá la URL de la caricatura")
+# Histogramas de latencia expuestos en /metrics (formato Prometheus).
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+# Logs de la sesión de voz: JSON por líneas desde una cola (nunca bloquean el relay).
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").strip().upper() or "INFO"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").strip().lower()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_AUDIO_SAMPLE_EVERY = int(os.getenv("LOG_AUDIO_SAMPLE_EVERY", "500"))
+# Relay rápido en /ws: reenvía sin json.loads/dumps los eventos que el backend no inspecciona.
+REALTIME_FAST_RELAY = os.getenv("REALTIME_FAST_RELAY", "true").strip().lower() in ("1", "true", "yes")
+# Pool de conexiones GPT Realtime pre-calentadas (0 = sin conexiones ociosas, se abre una por visitante).
+REALTIME_POOL_SIZE = int(os.getenv("REALTIME_POOL_SIZE", "2"))
+REALTIME_POOL_MAX_AGE_SECONDS = int(os.getenv("REALTIME_POOL_MAX_AGE_SECONDS", "600"))
+REALTIME_POOL_PING_INTERVAL_SECONDS = int(os.getenv("REALTIME_POOL_PING_INTERVAL_SECONDS", "30"))
+REALTIME_CONNECT_TIMEOUT_SECONDS = int(os.getenv("REALTIME_CONNECT_TIMEOUT_SECONDS", "10"))
+# Admisión en /ws: sesiones de voz simultáneas (0 = sin límite) y cola de espera
+# (0 = rechazo inmediato cuando no hay hueco).
+VOICE_MAX_SESSIONS = int(os.getenv("VOICE_MAX_SESSIONS", "20"))
+VOICE_QUEUE_SIZE = int(os.getenv("VOICE_QUEUE_SIZE", "10"))
+VOICE_QUEUE_TIMEOUT_SECONDS = float(os.getenv("VOICE_QUEUE_TIMEOUT_SECONDS", "30"))
+# Resúmenes (/transcriptions/summarize): sesiones realtime de texto reutilizables, cola
+# acotada y plazo total; SUMMARY_CHAT_DEPLOYMENT activa el respaldo por chat completions.
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", "2"))
+SUMMARY_QUEUE_SIZE = int(os.getenv("SUMMARY_QUEUE_SIZE", "32"))
+SUMMARY_DEADLINE_SECONDS = float(os.getenv("SUMMARY_DEADLINE_SECONDS", "20"))
+SUMMARY_SESSION_MAX_AGE_SECONDS = float(os.getenv("SUMMARY_SESSION_MAX_AGE_SECONDS", "600"))
+SUMMARY_CHAT_DEPLOYMENT = os.getenv("SUMMARY_CHAT_DEPLOYMENT", "").strip()
+# Lotes (/transcriptions/summarize/batch): workers por lote, tamaño máximo y checkpoints.
+SUMMARY_BATCH_CONCURRENCY = int(os.getenv("SUMMARY_BATCH_CONCURRENCY", str(SUMMARY_WORKERS)))
+SUMMARY_BATCH_MAX_CONVERSATIONS = int(os.getenv("SUMMARY_BATCH_MAX_CONVERSATIONS", "1000"))
+SUMMARY_CHECKPOINT_DIR = os.getenv("SUMMARY_CHECKPOINT_DIR", "").strip()
+# Coalescing de audio de entrada: ventana objetivo (ms de PCM16 24 kHz) y espera máxima antes de enviar.
+# AUDIO_COALESCE_WINDOW_MS=0 desactiva el coalescing (un append por chunk del navegador).
+AUDIO_COALESCE_WINDOW_MS = int(os.getenv("AUDIO_COALESCE_WINDOW_MS", "60"))
+AUDIO_COALESCE_MAX_DELAY_MS = int(os.getenv("AUDIO_COALESCE_MAX_DELAY_MS", "40"))
+
+# URLs para eventos de robot (regalo y caricatura); vacío = sin envío HTTP (solo robot_action).
+GIFT_ROBOT_API_URL = os.getenv("GIFT_ROBOT_API_URL", "")
+CARICATURE_ROBOT_API_URL = os.getenv("CARICATURE_ROBOT_API_URL", "")
+ROBOT_HTTP_TIMEOUT_SECONDS = float(os.getenv("ROBOT_HTTP_TIMEOUT_SECONDS", "10"))
+ROBOT_MAX_ATTEMPTS = int(os.getenv("ROBOT_MAX_ATTEMPTS", "5"))
+ROBOT_RETRY_BASE_SECONDS = float(os.getenv("ROBOT_RETRY_BASE_SECONDS", "1"))
+ROBOT_RETRY_MAX_SECONDS = float(os.getenv("ROBOT_RETRY_MAX_SECONDS", "30"))
+ROBOT_QUEUE_SIZE = int(os.getenv("ROBOT_QUEUE_SIZE", "100"))
+# Mientras se conserva una entrega, repetir la orden del mismo visitante no la reenvía.
+ROBOT_DELIVERY_RETENTION_SECONDS = int(os.getenv("ROBOT_DELIVERY_RETENTION_SECONDS", "86400"))
+ROBOT_GIFT = "gift"
+ROBOT_CARICATURE = "caricature"
+# Almacén de imágenes generadas: "inline" guarda data URL en Firebase (comportamiento original),
+# "local" guarda en disco por SHA-256 y Firebase/WebSocket llevan solo la URL /blobs/{sha256}.
+BLOB_STORE_BACKEND = os.getenv("BLOB_STORE_BACKEND", "inline")
+BLOB_STORE_LOCAL_DIR = os.getenv("BLOB_STORE_LOCAL_DIR", "blobs")
+# URL pública del backend para las referencias; vacío = rutas relativas (/blobs/...).
+BLOB_PUBLIC_BASE_URL = os.getenv("BLOB_PUBLIC_BASE_URL", "").strip()
+# Cola de generación de caricaturas: workers (= llamadas simultáneas a Azure), capacidad,
+# reintentos con backoff exponencial y tiempo que se conserva el estado de trabajos terminados.
+CARICATURE_JOB_CONCURRENCY = int(os.getenv("CARICATURE_JOB_CONCURRENCY", "2"))
+CARICATURE_JOB_QUEUE_SIZE = int(os.getenv("CARICATURE_JOB_QUEUE_SIZE", "50"))
+CARICATURE_JOB_MAX_ATTEMPTS = int(os.getenv("CARICATURE_JOB_MAX_ATTEMPTS", "3"))
+CARICATURE_JOB_RETRY_BASE_SECONDS = float(os.getenv("CARICATURE_JOB_RETRY_BASE_SECONDS", "2"))
+CARICATURE_JOB_RETENTION_SECONDS = int(os.getenv("CARICATURE_JOB_RETENTION_SECONDS", "3600"))
+CARICATURE_MAX_REQUEST_BYTES = int(os.getenv("CARICATURE_MAX_REQUEST_BYTES", str(25 * 1024 * 1024)))
+CARICATURE_CACHE_MAX_BYTES = int(os.getenv("CARICATURE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CARICATURE_CACHE_MAX_ENTRIES = int(os.getenv("CARICATURE_CACHE_MAX_ENTRIES", "64"))
+CARICATURE_CACHE_DIR = os.getenv("CARICATURE_CACHE_DIR", "")
+CARICATURE_CACHE_DISK_MAX_BYTES = int(os.getenv("CARICATURE_CACHE_DISK_MAX_BYTES", str(512 * 1024 * 1024)))
+# Preprocesado de la foto antes de images/edits: lado máximo, calidad JPEG y recorte a la cara
+# (este último requiere opencv-python-headless instalado).
+PHOTO_PREPROCESS_ENABLED = os.getenv("PHOTO_PREPROCESS_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+PHOTO_MAX_SIDE = int(os.getenv("PHOTO_MAX_SIDE", "1024"))
+PHOTO_JPEG_QUALITY = int(os.getenv("PHOTO_JPEG_QUALITY", "85"))
+PHOTO_FACE_CROP = os.getenv("PHOTO_FACE_CROP", "false").strip().lower() in ("1", "true", "yes")
+# Previsualizaciones progresivas de images/edits (0 = sin streaming, máximo 3).
+CARICATURE_PARTIAL_IMAGES = max(0, min(3, int(os.getenv("CARICATURE_PARTIAL_IMAGES", "2"))))
 MODEL_IMAGE_NAME = os.getenv("MODEL_IMAGE_NAME", "gpt-image-1.5")
 AZURE_OPENAI_IMAGE_API_VERSION = os.getenv(
     "AZURE_OPENAI_IMAGE_API_VERSION",
@@ -96,9 +240,73 @@ AZURE_OPENAI_IMAGE_EDITS_ENDPOINT = os.getenv(
 
 client: Optional[AzureOpenAI] = None
 firebase_app: Optional[Any] = None
-active_sessions: dict[str, Any] = {}
+blob_store = create_blob_store(BLOB_STORE_BACKEND, BLOB_STORE_LOCAL_DIR)
+session_registry = SessionRegistry(
+    max_sessions=VOICE_MAX_SESSIONS,
+    max_waiting=VOICE_QUEUE_SIZE,
+    wait_timeout_seconds=VOICE_QUEUE_TIMEOUT_SECONDS,
+)
 current_status: str = "idle"
 status_listener_started: bool = False
+users_listener_started: bool = False
+# Se desactiva si el despliegue rechaza `stream=true` en images/edits.
+image_edit_streaming_supported: bool = True
+
+user_cache = UserRecordCache(
+    ttl_seconds=USER_CACHE_TTL_SECONDS,
+    negative_ttl_seconds=USER_CACHE_NEGATIVE_TTL_SECONDS,
+    max_entries=USER_CACHE_MAX_ENTRIES,
+    max_bytes=USER_CACHE_MAX_BYTES,
+)
+order_number_extractor = OrderNumberExtractor(languages_for_codes(ORDER_NUMBER_LANGUAGES))
+
+set_metrics_enabled(METRICS_ENABLED)
+logger = configure_logging(LOG_LEVEL, json_format=LOG_FORMAT != "text", queue_size=LOG_QUEUE_SIZE)
+VOICE_TURN_SECONDS = Histogram(
+    "fulgencio_voice_turn_stage_seconds",
+    "Seconds from the end of the visitor's speech to each stage of the voice turn.",
+    "stage",
+)
+REALTIME_CONNECT_SECONDS = Histogram(
+    "fulgencio_realtime_connect_seconds",
+    "Seconds to get an initialized upstream realtime session for a /ws visitor.",
+    "source",
+)
+FIREBASE_CALL_SECONDS = Histogram(
+    "fulgencio_firebase_call_seconds",
+    "Duration of the Firebase Realtime Database helpers.",
+    "helper",
+)
+IMAGE_CALL_SECONDS = Histogram(
+    "fulgencio_image_call_seconds",
+    "Duration of the caricature image helpers.",
+    "helper",
+)
+VOICE_SESSION_WAIT_SECONDS = Histogram(
+    "fulgencio_voice_session_wait_seconds",
+    "Seconds a /ws visitor waited for a free voice session slot.",
+)
+Gauge(
+    "fulgencio_voice_sessions_active",
+    "Voice sessions currently holding an upstream realtime session.",
+    lambda: session_registry.active,
+)
+Gauge(
+    "fulgencio_voice_sessions_waiting",
+    "Voice sessions waiting in the admission queue.",
+    lambda: session_registry.waiting,
+)
+Gauge(
+    "fulgencio_voice_sessions_max",
+    "Configured maximum of concurrent voice sessions (0 = unlimited).",
+    lambda: session_registry.max_sessions,
+)
+Gauge(
+    "fulgencio_voice_sessions_rejected_total",
+    "Voice sessions turned away because the queue was full or the wait timed out.",
+    lambda: session_registry.rejected + session_registry.timed_out,
+    metric_type="counter",
+)
 
 if AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_API_KEY:
     client = AzureOpenAI(
@@ -156,150 +364,183 @@ def initialize_firebase():
         print("ℹ️ Se usará fallback REST para lectura pública.")
 
 
-def get_user_from_realtime_db(order_number: str) -> Optional[dict[str, Any]]:
+def firebase_access_token():
+    """Token OAuth2 de la cuenta de servicio del Admin SDK para la API REST."""
+    return firebase_app.credential.get_access_token()
+
+
+@timed(FIREBASE_CALL_SECONDS)
+async def get_user_from_realtime_db(order_number: str) -> Optional[dict[str, Any]]:
     """
     Lee users/{order_number} desde Realtime Database.
-    Prioriza Admin SDK; si no hay credenciales, usa REST pública.
+    Usa el cliente REST asíncrono (autenticado si hay Admin SDK, público si no)
+    y la caché en memoria, que también recuerda durante unos segundos los números
+    inexistentes. Los errores de red no se cachean.
     """
     if not FIREBASE_DATABASE_URL:
         return None
 
-    if firebase_app is not None:
-        try:
-            users_ref = db.reference("users", app=firebase_app)
-            value = users_ref.child(order_number).get()
-            return value if isinstance(value, dict) else None
-        except Exception as err:
-            print(f"⚠️ Error leyendo Firebase Admin para {order_number}: {err}")
+    found, cached_user = user_cache.get(order_number)
+    if found:
+        return cached_user
 
-    # Fallback REST (útil si las reglas permiten lectura pública)
-    url = f"{FIREBASE_DATABASE_URL.rstrip('/')}/users/{order_number}.json"
     try:
-        with urllib.request.urlopen(url, timeout=5) as response:
-            payload = response.read().decode("utf-8")
-            value = json.loads(payload) if payload else None
-            return value if isinstance(value, dict) else None
-    except urllib.error.HTTPError as http_err:
-        if http_err.code != 404:
-            print(f"⚠️ Error HTTP en Firebase REST para {order_number}: {http_err}")
+        value = await firebase_rtdb.get(f"users/{order_number}")
+    except FirebaseRealtimeError as err:
+        logger.warning("Error leyendo Firebase: %s", err, extra={"order": order_number})
+        return None
     except Exception as err:
-        print(f"⚠️ Error en Firebase REST para {order_number}: {err}")
+        logger.warning("Error en Firebase REST: %s", err, extra={"order": order_number})
+        return None
 
-    return None
+    user = value if isinstance(value, dict) else None
+    user_cache.put(order_number, user)
+    return user
 
 
-def update_user_fields_in_realtime_db(order_number: str, fields: dict[str, Any]) -> bool:
+# Campos escalares que necesita el lock-in (prompt, notificación y nodos de Firebase).
+USER_PROFILE_FIELDS = ("fullName", "name", "nombre", "full_name", "userId", "user_id", "id", "email")
+
+
+def project_user_profile(user_data: dict[str, Any]) -> dict[str, Any]:
     """
-    Actualiza campos parciales en users/{order_number}.
-    Prioriza Admin SDK; si no hay credenciales, usa REST PATCH.
+    Proyección ligera de un registro de usuario: solo campos escalares y
+    `caricaturesCount` (sin `photo` ni las imágenes de `caricatures`).
+    """
+    profile = {
+        field: user_data[field]
+        for field in USER_PROFILE_FIELDS
+        if user_data.get(field) is not None
+    }
+    caricatures = user_data.get("caricatures")
+    profile["caricaturesCount"] = len(caricatures) if isinstance(caricatures, (list, dict)) else 0
+    return profile
+
+
+def user_has_caricatures(user_data: dict[str, Any]) -> bool:
+    """Admite tanto el registro completo como la proyección de `project_user_profile`."""
+    if "caricaturesCount" in user_data:
+        return int(user_data.get("caricaturesCount") or 0) > 0
+    caricatures = user_data.get("caricatures")
+    return isinstance(caricatures, list) and len(caricatures) > 0
+
+
+@timed(FIREBASE_CALL_SECONDS)
+async def get_user_profile_from_realtime_db(order_number: str) -> Optional[dict[str, Any]]:
+    """
+    Lee solo los campos escalares de users/{order_number} y cuenta las caricaturas,
+    sin descargar los data URL de `photo` ni de `caricatures`: primero las claves del
+    nodo (shallow=true) y después, en paralelo, solo los campos de perfil que existen.
+    Así cada búsqueda ocupa 2-4 huecos del cliente de Firebase y no 9.
+    Si el registro completo ya está en caché, se proyecta desde ahí.
     """
     if not FIREBASE_DATABASE_URL:
-        print("❌ FIREBASE_DATABASE_URL no configurado para actualizar Firebase.")
-        return False
+        return None
 
-    if firebase_app is not None:
-        try:
-            users_ref = db.reference("users", app=firebase_app)
-            users_ref.child(order_number).update(fields)
-            return True
-        except Exception as err:
-            print(f"⚠️ Error actualizando Firebase Admin para {order_number}: {err}")
+    found, cached_user = user_cache.get(order_number)
+    if found:
+        return project_user_profile(cached_user) if cached_user is not None else None
 
     try:
-        url = f"{FIREBASE_DATABASE_URL.rstrip('/')}/users/{order_number}.json"
-        payload = json.dumps(fields).encode("utf-8")
-        request = urllib.request.Request(
-            url,
-            data=payload,
-            headers={"Content-Type": "application/json"},
-            method="PATCH",
+        keys = await firebase_rtdb.get(f"users/{order_number}", params={"shallow": "true"})
+        if not isinstance(keys, dict):
+            return None
+        # shallow=true trunca a `true` los hijos; si trae ya un valor escalar, se usa.
+        present_fields = [field for field in USER_PROFILE_FIELDS if field in keys]
+        missing_fields = [field for field in present_fields if keys[field] is True]
+        values = await asyncio.gather(
+            *(firebase_rtdb.get(f"users/{order_number}/{field}") for field in missing_fields),
+            *(
+                [firebase_rtdb.get(f"users/{order_number}/caricatures", params={"shallow": "true"})]
+                if "caricatures" in keys
+                else []
+            ),
         )
-        with urllib.request.urlopen(request, timeout=10) as response:
-            status = getattr(response, "status", 200)
-            return 200 <= status < 300
     except Exception as err:
-        print(f"❌ Error actualizando Firebase REST para {order_number}: {err}")
-        return False
+        logger.warning("Error leyendo perfil de Firebase: %s", err, extra={"order": order_number})
+        return None
+
+    fetched = dict(zip(missing_fields, values))
+    caricature_keys = values[len(missing_fields)] if "caricatures" in keys else None
+    profile = {
+        field: value
+        for field in present_fields
+        if (value := fetched[field] if field in fetched else keys[field]) is not None
+    }
+    if not profile and caricature_keys is None:
+        return None
+    profile["caricaturesCount"] = (
+        len(caricature_keys) if isinstance(caricature_keys, (dict, list)) else 0
+    )
+    return profile
 
 
-def write_robot_action_to_realtime_db(user_data: dict[str, Any]) -> bool:
+@timed(FIREBASE_CALL_SECONDS)
+async def update_user_fields_in_realtime_db(order_number: str, fields: dict[str, Any]) -> bool:
     """
-    Escribe la acción del robot en el nodo `robot_action` en Firebase.
-    - Si existe `caricatures` en user_data, envía `draw_caricature`.
-    - Si no existe, envía `give_gift_bag`.
+    Actualiza campos parciales en users/{order_number} (PATCH).
     """
     if not FIREBASE_DATABASE_URL:
-        print("❌ FIREBASE_DATABASE_URL no configurado para robot_action.")
+        logger.error("FIREBASE_DATABASE_URL no configurado para actualizar Firebase", extra={"order": order_number})
         return False
 
-    has_caricatures_node = "caricatures" in user_data
-    timestamp = int(time())
-
-    if has_caricatures_node:
-        caricatures = user_data.get("caricatures")
-        caricature_image = ""
-        if isinstance(caricatures, list) and len(caricatures) > 0:
-            first = caricatures[0]
-            if isinstance(first, str):
-                caricature_image = first
-
-        action_payload = {
-            "type": "draw_caricature",
-            "timestamp": timestamp,
-            "userId": str(
-                user_data.get("userId")
-                or user_data.get("user_id")
-                or user_data.get("id")
-                or ""
-            ).strip(),
-            "fullName": str(
-                user_data.get("full_name")
-                or user_data.get("fullName")
-                or user_data.get("name")
-                or user_data.get("nombre")
-                or ""
-            ).strip(),
-            "caricatureImage": caricature_image,
-        }
-    else:
-        action_payload = {
-            "type": "give_gift_bag",
-            "timestamp": timestamp,
-        }
-
-    if firebase_app is not None:
-        try:
-            robot_action_ref = db.reference("robot_action", app=firebase_app)
-            robot_action_ref.set(action_payload)
-            return True
-        except Exception as err:
-            print(f"⚠️ Error escribiendo robot_action con Firebase Admin: {err}")
-
     try:
-        url = f"{FIREBASE_DATABASE_URL.rstrip('/')}/robot_action.json"
-        payload = json.dumps(action_payload).encode("utf-8")
-        request = urllib.request.Request(
-            url,
-            data=payload,
-            headers={"Content-Type": "application/json"},
-            method="PUT",
+        await firebase_rtdb.patch(
+            f"users/{order_number}",
+            fields,
+            timeout=FIREBASE_HTTP_WRITE_TIMEOUT_SECONDS,
         )
-        with urllib.request.urlopen(request, timeout=10) as response:
-            status = getattr(response, "status", 200)
-            return 200 <= status < 300
+        # Write-through: la siguiente lectura ya ve los campos nuevos sin ir a Firebase.
+        user_cache.apply_fields(order_number, fields)
+        return True
     except Exception as err:
-        print(f"❌ Error escribiendo robot_action por REST: {err}")
+        logger.error("Error actualizando Firebase: %s", err, extra={"order": order_number})
         return False
 
 
-def write_current_user_to_realtime_db(user_data: dict[str, Any], order_number: str) -> bool:
+def build_robot_action_payload(user_data: dict[str, Any]) -> dict[str, Any]:
     """
-    Escribe los datos del usuario resuelto en el nodo `currentUser`.
+    Construye la acción del robot para el nodo `robot_action`.
+    - Si existe `caricatures` en user_data, `draw_caricature`.
+    - Si no existe, `give_gift_bag`.
     """
-    if not FIREBASE_DATABASE_URL:
-        print("❌ FIREBASE_DATABASE_URL no configurado para currentUser.")
-        return False
+    timestamp = int(time())
+
+    if "caricatures" not in user_data:
+        return {
+            "type": "give_gift_bag",
+            "timestamp": timestamp,
+        }
+
+    caricatures = user_data.get("caricatures")
+    caricature_image = ""
+    if isinstance(caricatures, list) and len(caricatures) > 0:
+        first = caricatures[0]
+        if isinstance(first, str):
+            caricature_image = first
+
+    return {
+        "type": "draw_caricature",
+        "timestamp": timestamp,
+        "userId": str(
+            user_data.get("userId")
+            or user_data.get("user_id")
+            or user_data.get("id")
+            or ""
+        ).strip(),
+        "fullName": str(
+            user_data.get("full_name")
+            or user_data.get("fullName")
+            or user_data.get("name")
+            or user_data.get("nombre")
+            or ""
+        ).strip(),
+        "caricatureImage": caricature_image,
+    }
+
 
+def build_current_user_payload(user_data: dict[str, Any], order_number: str) -> dict[str, Any]:
+    """Copia de los datos del usuario para `currentUser` con `userId` normalizado."""
     current_user_payload = dict(user_data)
 
     # Normalizar userId para consumo del frontend.
@@ -312,42 +553,130 @@ def write_current_user_to_realtime_db(user_data: dict[str, Any], order_number: s
     ).strip()
     if normalized_user_id:
         current_user_payload["userId"] = normalized_user_id
+    return current_user_payload
 
-    if firebase_app is not None:
-        try:
-            current_user_ref = db.reference("currentUser", app=firebase_app)
-            current_user_ref.set(current_user_payload)
-            return True
-        except Exception as err:
-            print(f"⚠️ Error escribiendo currentUser con Firebase Admin: {err}")
+
+@timed(FIREBASE_CALL_SECONDS)
+async def write_robot_action_to_realtime_db(user_data: dict[str, Any]) -> bool:
+    """
+    Escribe la acción del robot en el nodo `robot_action` en Firebase.
+    """
+    if not FIREBASE_DATABASE_URL:
+        logger.error("FIREBASE_DATABASE_URL no configurado para robot_action")
+        return False
 
     try:
-        url = f"{FIREBASE_DATABASE_URL.rstrip('/')}/currentUser.json"
-        payload = json.dumps(current_user_payload).encode("utf-8")
-        request = urllib.request.Request(
-            url,
-            data=payload,
-            headers={"Content-Type": "application/json"},
-            method="PUT",
+        await firebase_rtdb.put(
+            "robot_action",
+            build_robot_action_payload(user_data),
+            timeout=FIREBASE_HTTP_WRITE_TIMEOUT_SECONDS,
         )
-        with urllib.request.urlopen(request, timeout=10) as response:
-            status = getattr(response, "status", 200)
-            return 200 <= status < 300
+        return True
     except Exception as err:
-        print(f"❌ Error escribiendo currentUser por REST: {err}")
+        logger.error("Error escribiendo robot_action en Firebase: %s", err)
         return False
 
 
-def extract_base64_payload(image_data: str) -> str:
+@timed(FIREBASE_CALL_SECONDS)
+async def write_current_user_to_realtime_db(user_data: dict[str, Any], order_number: str) -> bool:
     """
-    Admite data URL o base64 directo y devuelve solo el payload base64.
+    Escribe los datos del usuario resuelto en el nodo `currentUser`.
     """
-    if not image_data:
-        return ""
-    marker = "base64,"
-    if marker in image_data:
-        return image_data.split(marker, 1)[1].strip()
-    return image_data.strip()
+    if not FIREBASE_DATABASE_URL:
+        logger.error("FIREBASE_DATABASE_URL no configurado para currentUser", extra={"order": order_number})
+        return False
+
+    try:
+        await firebase_rtdb.put(
+            "currentUser",
+            build_current_user_payload(user_data, order_number),
+            timeout=FIREBASE_HTTP_WRITE_TIMEOUT_SECONDS,
+        )
+        return True
+    except Exception as err:
+        logger.error("Error escribiendo currentUser en Firebase: %s", err, extra={"order": order_number})
+        return False
+
+
+@timed(FIREBASE_CALL_SECONDS)
+async def write_user_lock_in_to_realtime_db(user_data: dict[str, Any], order_number: str) -> bool:
+    """
+    Escribe `currentUser` y `robot_action` en una sola petición: update multi-ruta
+    sobre la raíz, atómico en Realtime Database (ambos nodos o ninguno).
+    """
+    if not FIREBASE_DATABASE_URL:
+        logger.error("FIREBASE_DATABASE_URL no configurado para currentUser/robot_action", extra={"order": order_number})
+        return False
+
+    try:
+        await firebase_rtdb.patch(
+            "",
+            {
+                "currentUser": build_current_user_payload(user_data, order_number),
+                "robot_action": build_robot_action_payload(user_data),
+            },
+            timeout=FIREBASE_HTTP_WRITE_TIMEOUT_SECONDS,
+        )
+        return True
+    except Exception as err:
+        logger.error("Error escribiendo currentUser/robot_action en Firebase: %s", err, extra={"order": order_number})
+        return False
+
+
+def build_blob_reference(key: str) -> str:
+    """Referencia corta que viaja en Firebase/WebSocket en lugar del data URL."""
+    return f"{BLOB_PUBLIC_BASE_URL.rstrip('/')}/blobs/{key}"
+
+
+@timed(IMAGE_CALL_SECONDS)
+async def store_image(image_bytes: bytes, content_type: str) -> str:
+    """
+    Guarda una imagen en el almacén configurado y devuelve lo que se escribe en Firebase:
+    la referencia /blobs/{sha256} o, con el backend inline, el data URL.
+    """
+    if blob_store is None:
+        return f"data:{content_type};base64,{base64.b64encode(image_bytes).decode('ascii')}"
+    key = await asyncio.to_thread(blob_store.put, image_bytes)
+    return build_blob_reference(key)
+
+
+async def store_image_base64(image_base64: str, content_type: str) -> str:
+    """Como store_image, pero sin decodificar cuando el backend es inline."""
+    if blob_store is None:
+        return f"data:{content_type};base64,{image_base64}"
+    return await store_image(binascii.a2b_base64(image_base64), content_type)
+
+
+def parse_byte_range(range_header: Optional[str], total_size: int) -> Optional[tuple[int, int]]:
+    """
+    Interpreta una cabecera Range de un solo rango (`bytes=a-b`, `bytes=a-`, `bytes=-n`).
+    Devuelve (inicio, fin inclusivo), None si no aplica, es multi-rango o no es
+    sintácticamente válida (se ignora y se sirve completo, RFC 7233) y lanza
+    ValueError si el rango es válido pero no satisfacible.
+    """
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    start_text, separator, end_text = range_header[len("bytes="):].strip().partition("-")
+    start_text, end_text = start_text.strip(), end_text.strip()
+    if (
+        not separator
+        or not (start_text or end_text)
+        or (start_text and not start_text.isdigit())
+        or (end_text and not end_text.isdigit())
+    ):
+        return None
+    if not start_text:
+        suffix_length = int(end_text)
+        if suffix_length <= 0 or total_size <= 0:
+            raise ValueError("rango vacío")
+        return max(0, total_size - suffix_length), total_size - 1
+    start = int(start_text)
+    end = int(end_text) if end_text else total_size - 1
+    if end_text and end < start:
+        return None
+    if start >= total_size:
+        raise ValueError("rango fuera del recurso")
+    return start, min(end, total_size - 1)
 
 
 def parse_generated_base64_list(response_data: dict[str, Any]) -> list[str]:
@@ -393,57 +722,152 @@ def parse_generated_base64_list(response_data: dict[str, Any]) -> list[str]:
     return deduped
 
 
-def call_image_generation_sync(photo_base64_or_data_url: str) -> list[str]:
+class ImageGenerationError(RuntimeError):
+    """Error en la llamada a images/edits; `transient` indica si tiene sentido reintentar."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, transient: bool = False):
+        super().__init__(message)
+        self.status_code = status_code
+        self.transient = transient
+
+
+def build_caricature_request_key(image_bytes: bytes) -> str:
+    """Clave de la caché de caricaturas: foto + todo lo que cambia el resultado."""
+    return build_caricature_cache_key(
+        image_bytes,
+        prompt=AZURE_OPENAI_IMAGE_PROMPT,
+        model=MODEL_IMAGE_NAME,
+        api_version=AZURE_OPENAI_IMAGE_API_VERSION,
+        endpoint=AZURE_OPENAI_IMAGE_EDITS_ENDPOINT,
+        preprocess=[PHOTO_PREPROCESS_ENABLED, PHOTO_MAX_SIDE, PHOTO_JPEG_QUALITY, PHOTO_FACE_CROP],
+    )
+
+
+@timed(IMAGE_CALL_SECONDS)
+def call_image_generation_sync(
+    image_bytes: bytes,
+    on_partial_image: Optional[Callable[[int, str], None]] = None,
+) -> list[str]:
     """
     Edita imagen usando gpt-image-1.5 en endpoint /images/edits
     enviando multipart/form-data (image + prompt), según guía indicada.
+    Con `on_partial_image` se pide la respuesta en streaming y se invoca
+    (desde este hilo) con cada previsualización progresiva (índice, base64).
     """
+    global image_edit_streaming_supported
+
     if not AZURE_OPENAI_IMAGE_EDITS_ENDPOINT:
         raise RuntimeError("AZURE_OPENAI_IMAGE_EDITS_ENDPOINT no configurado")
     if not AZURE_OPENAI_API_KEY:
         raise RuntimeError("AZURE_OPENAI_API_KEY no configurado")
 
-    raw_base64 = extract_base64_payload(photo_base64_or_data_url)
-    if not raw_base64:
-        raise RuntimeError("Foto base64 vacía")
-
-    try:
-        image_bytes = base64.b64decode(raw_base64, validate=True)
-    except Exception as err:
-        raise RuntimeError(f"Base64 de foto inválido: {err}") from err
-
-    # Nombre/extensión orientativo; el backend recibe jpeg desde canvas por defecto.
-    files = {
-        "image": ("image_to_edit.jpg", image_bytes, "image/jpeg"),
-    }
+    if PHOTO_PREPROCESS_ENABLED:
+        try:
+            with IMAGE_CALL_SECONDS.time("preprocess_photo"):
+                photo = preprocess_photo(
+                    image_bytes,
+                    max_side=PHOTO_MAX_SIDE,
+                    jpeg_quality=PHOTO_JPEG_QUALITY,
+                    face_crop=PHOTO_FACE_CROP,
+                )
+        except ValueError as err:
+            raise ImageGenerationError(str(err)) from err
+        print(
+            f"🖼️ Foto preprocesada: {photo.original_content_type} {photo.original_size} bytes -> "
+            f"{photo.content_type} {len(photo.data)} bytes ({photo.width}x{photo.height}"
+            f"{', cara recortada' if photo.face_cropped else ''}) tiempos ms={photo.timings_ms}"
+        )
+        upload = (photo.filename, photo.data, photo.content_type)
+    else:
+        # Sin preprocesado se envían los bytes originales con su tipo real.
+        content_type = sniff_image_content_type(image_bytes[:16])
+        upload = (f"image_to_edit.{content_type.rsplit('/', 1)[-1]}", image_bytes, content_type)
     data = {
         "prompt": AZURE_OPENAI_IMAGE_PROMPT,
         "n": "1",
     }
-    headers = {
-        "Authorization": f"Bearer {AZURE_OPENAI_API_KEY}",
-    }
 
     version = AZURE_OPENAI_IMAGE_API_VERSION
     request_url = f"{AZURE_OPENAI_IMAGE_EDITS_ENDPOINT}?api-version={version}"
     print(f"🖼️ Edit endpoint fijo: {request_url}")
-    response = requests.post(
-        request_url,
-        headers=headers,
-        files=files,
-        data=data,
-        timeout=90,
-    )
+
+    def post_image_edit(fields: dict[str, str], stream: bool = False) -> requests.Response:
+        # Multipart por trozos sobre la imagen: requests no monta una copia del cuerpo.
+        body = MultipartFormBody(fields, "image", *upload)
+        return requests.post(
+            request_url,
+            headers={
+                "Authorization": f"Bearer {AZURE_OPENAI_API_KEY}",
+                "Content-Type": body.content_type,
+            },
+            data=body,
+            timeout=90,
+            stream=stream,
+        )
+
+    if on_partial_image is not None and CARICATURE_PARTIAL_IMAGES > 0 and image_edit_streaming_supported:
+        response = post_image_edit(
+            {**data, "stream": "true", "partial_images": str(CARICATURE_PARTIAL_IMAGES)},
+            stream=True,
+        )
+        print(f"🖼️ Status Foundry edits (stream): {response.status_code}")
+        with response:
+            if response.status_code != 400 or not image_edit_rejects_streaming(response.text):
+                # Un 400 por la foto (moderación, imagen inválida) es permanente y no
+                # debe apagar las previsualizaciones del resto de visitantes.
+                return read_image_edit_response(response, version, on_partial_image)
+            # Despliegue o api-version sin streaming de imágenes: se desactiva y se
+            # repite la petición sin stream (mismo coste, la anterior fue rechazada).
+            image_edit_streaming_supported = False
+            print(f"⚠️ Streaming de images/edits no soportado, se usa modo completo: {response.text[:300]}")
+
+    response = post_image_edit(data)
     print(f"🖼️ Status Foundry edits: {response.status_code}")
+    return read_image_edit_response(response, version)
+
 
+STREAMING_PARAMETER_PATTERN = re.compile(r"\b(stream|partial_images)\b", re.IGNORECASE)
+
+
+def image_edit_rejects_streaming(body: str) -> bool:
+    """
+    True si el 400 de images/edits se debe a `stream`/`partial_images` (despliegue
+    o api-version sin streaming) y no a la foto o al prompt.
+    """
+    try:
+        error = json.loads(body).get("error")
+    except (ValueError, AttributeError):
+        error = None
+    if isinstance(error, dict):
+        if error.get("param") in ("stream", "partial_images"):
+            return True
+        body = str(error.get("message") or "")
+    return bool(STREAMING_PARAMETER_PATTERN.search(body))
+
+
+def read_image_edit_response(
+    response: requests.Response,
+    version: str,
+    on_partial_image: Optional[Callable[[int, str], None]] = None,
+) -> list[str]:
+    """Valida la respuesta de images/edits y extrae las imágenes (JSON completo o SSE)."""
     if response.status_code != 200:
-        raise RuntimeError(
+        raise ImageGenerationError(
             f"HTTP {response.status_code} {response.reason} "
-            f"(api-version={version}). Body: {response.text}"
+            f"(api-version={version}). Body: {response.text}",
+            status_code=response.status_code,
+            # Throttling y errores de servidor suelen resolverse reintentando.
+            transient=response.status_code in (408, 429) or response.status_code >= 500,
         )
 
-    response_data = response.json()
-    generated_base64_list = parse_generated_base64_list(response_data)
+    if "text/event-stream" in response.headers.get("Content-Type", ""):
+        generated_base64_list = read_image_edit_stream(response, on_partial_image)
+        body_preview = "(stream)"
+    else:
+        # json.loads sobre los bytes: sin la copia en texto que hace response.json().
+        generated_base64_list = parse_generated_base64_list(json.loads(response.content))
+        body_preview = response.content[:500].decode("utf-8", errors="replace")
+
     if generated_base64_list:
         print(
             f"✅ Caricaturas generadas correctamente (api-version={version}). "
@@ -451,16 +875,44 @@ def call_image_generation_sync(photo_base64_or_data_url: str) -> list[str]:
         )
         return generated_base64_list
 
-    raise RuntimeError(
-        f"200 sin b64_json (api-version={version}). Body: {response.text}"
+    raise ImageGenerationError(
+        f"200 sin b64_json (api-version={version}). Body: {body_preview}",
+        status_code=response.status_code,
     )
 
 
-def normalize_text(text: str) -> str:
-    """Normaliza texto para detectar números con más robustez."""
-    lowered = text.lower().strip()
-    normalized = unicodedata.normalize("NFKD", lowered)
-    return "".join(ch for ch in normalized if not unicodedata.combining(ch))
+def read_image_edit_stream(
+    response: requests.Response,
+    on_partial_image: Optional[Callable[[int, str], None]] = None,
+) -> list[str]:
+    """
+    Consume los eventos SSE según llegan: reenvía cada imagen parcial y se queda
+    solo con las finales. Un evento `error` dentro del stream se trata como transitorio.
+    """
+    parser = ImageStreamParser()
+    results: list[str] = []
+
+    def handle(events: list[dict[str, Any]]) -> None:
+        for event in events:
+            event_type = event.get("type", "")
+            b64_json = event.get("b64_json")
+            if event_type in PARTIAL_IMAGE_EVENT_TYPES and isinstance(b64_json, str):
+                index = int(event.get("partial_image_index", 0))
+                print(f"🖼️ Previsualización parcial #{index}: longitud base64={len(b64_json)}")
+                if on_partial_image is not None:
+                    on_partial_image(index, b64_json)
+            elif event_type in COMPLETED_IMAGE_EVENT_TYPES and isinstance(b64_json, str):
+                results.append(b64_json)
+            elif event_type == "error" or "error" in event:
+                raise ImageGenerationError(
+                    f"Error en el stream de images/edits: {event.get('error', event)}",
+                    transient=True,
+                )
+
+    for chunk in response.iter_content(chunk_size=64 * 1024):
+        handle(parser.feed(chunk))
+    handle(parser.close())
+    return results
 
 
 def extract_order_number(text: str) -> Optional[str]:
@@ -471,89 +923,7 @@ def extract_order_number(text: str) -> Optional[str]:
     - "my number is 42"
     - "my code is four two"
     """
-    if not text:
-        return None
-
-    normalized = normalize_text(text)
-
-    # Buscar contexto mínimo para evitar falsos positivos.
-    intent_keywords = (
-        # Spanish
-        "numero",
-        "codigo",
-        "orden",
-        "id",
-        "identificador",
-        "soy",
-        "mi numero",
-        "mi codigo",
-        # English
-        "number",
-        "code",
-        "order",
-        "identifier",
-        "my number",
-        "my code",
-        "i am",
-        "i'm",
-        "im ",
-    )
-    if not any(keyword in normalized for keyword in intent_keywords):
-        return None
-
-    # 1) Número continuo.
-    contiguous_matches = re.findall(r"\b\d{1,6}\b", normalized)
-    if contiguous_matches:
-        return contiguous_matches[0]
-
-    # 2) Dígitos separados por espacios, comas o guiones.
-    separated_matches = re.findall(r"(?:\d[\s,.\-]*){2,6}", normalized)
-    for raw in separated_matches:
-        digits_only = "".join(ch for ch in raw if ch.isdigit())
-        if 1 <= len(digits_only) <= 6:
-            return digits_only
-
-    # 3) Número expresado en palabras.
-    word_to_digit = {
-        # Spanish
-        "cero": "0",
-        "uno": "1",
-        "una": "1",
-        "dos": "2",
-        "tres": "3",
-        "cuatro": "4",
-        "cinco": "5",
-        "seis": "6",
-        "siete": "7",
-        "ocho": "8",
-        "nueve": "9",
-        # English
-        "zero": "0",
-        "oh": "0",
-        "one": "1",
-        "two": "2",
-        "three": "3",
-        "four": "4",
-        "five": "5",
-        "six": "6",
-        "seven": "7",
-        "eight": "8",
-        "nine": "9",
-    }
-    word_pattern = (
-        r"\b(?:cero|uno|una|dos|tres|cuatro|cinco|seis|siete|ocho|nueve|"
-        r"zero|oh|one|two|three|four|five|six|seven|eight|nine)\b"
-    )
-    sequence_pattern = rf"(?:{word_pattern})(?:[\s,.\-]+(?:{word_pattern}))*"
-    for seq in re.findall(sequence_pattern, normalized):
-        words = re.findall(word_pattern, seq)
-        if not words:
-            continue
-        digits = "".join(word_to_digit[w] for w in words if w in word_to_digit)
-        if 1 <= len(digits) <= 6:
-            return digits
-
-    return None
+    return order_number_extractor.extract(text)
 
 
 # =============================================================================
@@ -635,6 +1005,204 @@ def build_conversation_prompt(user_name: str = None, has_caricatures: bool = Fal
     return REGLAS_CONVERSACION + "\n" + "=== CURRENT SITUATION ===\n\n" + name_part + situation_part
 
 
+PROMPT_PHASE_WELCOME = "welcome"
+PROMPT_PHASE_CONVERSATION = "conversation"
+
+
+@lru_cache(maxsize=256)
+def get_session_prompt(phase: str, user_name: Optional[str] = None, has_caricatures: bool = False) -> str:
+    """
+    Registro memoizado de prompts por (fase, nombre, caricaturas): cada combinación
+    se construye una vez y devuelve siempre el mismo objeto str, lo que permite
+    comparar barato con las instrucciones que ya tiene la sesión upstream.
+    """
+    if phase == PROMPT_PHASE_WELCOME:
+        return build_welcome_prompt()
+    return build_conversation_prompt(user_name, has_caricatures)
+
+
+def build_realtime_session_init() -> dict[str, Any]:
+    """session.update inicial de cada sesión de voz: prompt de bienvenida, audio y VAD."""
+    return {
+        "type": "session.update",
+        "session": {
+            "modalities": ["text", "audio"],
+            "instructions": get_session_prompt(PROMPT_PHASE_WELCOME),
+            "voice": "cedar",
+            "input_audio_format": "pcm16",
+            "output_audio_format": "pcm16",
+            "input_audio_transcription": {
+                "model": REALTIME_TRANSCRIPTION_MODEL
+            },
+            "turn_detection": {
+                "type": "server_vad",
+                "threshold": 0.5,
+                "prefix_padding_ms": 300,
+                "silence_duration_ms": 500,
+                "create_response": False,
+            },
+        }
+    }
+
+
+def build_realtime_url_candidates() -> list[str]:
+    """URLs de GPT Realtime a probar en orden: primero con deployment=, después con model=."""
+    if not AZURE_OPENAI_ENDPOINT:
+        return []
+
+    endpoint_base = AZURE_OPENAI_ENDPOINT.rstrip("/")
+    if endpoint_base.startswith("https://"):
+        endpoint_base = endpoint_base.replace("https://", "wss://")
+    elif endpoint_base.startswith("http://"):
+        endpoint_base = endpoint_base.replace("http://", "ws://")
+
+    return [
+        f"{endpoint_base}/openai/realtime?deployment={MODEL_NAME}&api-version={AZURE_OPENAI_API_VERSION}",
+        f"{endpoint_base}/openai/realtime?model={MODEL_NAME}&api-version={AZURE_OPENAI_API_VERSION}",
+    ]
+
+
+# =============================================================================
+# RELAY REALTIME (FAST PATH)
+# =============================================================================
+
+# Plantilla pre-renderizada de input_audio_buffer.append: solo cambia el base64.
+AUDIO_APPEND_PREFIX = b'{"type":"input_audio_buffer.append","audio":"'
+AUDIO_APPEND_SUFFIX = b'"}'
+
+TRANSCRIPTION_DELTA_EVENT = "conversation.item.input_audio_transcription.delta"
+TRANSCRIPTION_COMPLETED_EVENT = "conversation.item.input_audio_transcription.completed"
+
+# Eventos upstream que el backend necesita decodificar; el resto se reenvía tal cual.
+INSPECTED_REALTIME_EVENTS = frozenset(
+    {TRANSCRIPTION_COMPLETED_EVENT} | ({TRANSCRIPTION_DELTA_EVENT} if ORDER_NUMBER_PREFETCH else set())
+)
+
+# Solo se acepta "type" como primera clave del objeto para evitar confundirlo
+# con el "type" de un item anidado.
+EVENT_TYPE_PREFIX_PATTERN = re.compile(r'\{\s*"type"\s*:\s*"([^"\\]*)"')
+
+
+def build_audio_append_frame(audio_data: bytes) -> bytes:
+    """
+    Construye el evento input_audio_buffer.append (JSON en UTF-8) a partir de PCM16
+    sin pasar por dict + json.dumps. El base64 nunca contiene caracteres a escapar.
+    """
+    return b"".join((AUDIO_APPEND_PREFIX, base64.b64encode(audio_data), AUDIO_APPEND_SUFFIX))
+
+
+# Modo binario hacia el cliente (negociado con /ws?audio=binary): cada response.audio.delta
+# se envía como frame binario = cabecera <uint16 longitud_cabecera><uint16 content_index>
+# + item_id ASCII (rellenado a longitud par) + PCM16 crudo.
+BINARY_AUDIO_QUERY_VALUE = "binary"
+BINARY_AUDIO_HEADER = struct.Struct("<HH")
+
+
+def build_binary_audio_frame(item_id: str, content_index: int, audio_data: bytes) -> bytes:
+    """
+    Empaqueta un delta de audio como frame binario para el cliente.
+    La cabecera tiene longitud par para que el PCM16 quede alineado a Int16 en el navegador.
+    """
+    item_id_bytes = item_id.encode("ascii", errors="ignore")[:255]
+    header_length = BINARY_AUDIO_HEADER.size + len(item_id_bytes)
+    padding = b"\x00" if header_length % 2 else b""
+    header_length += len(padding)
+    return b"".join((
+        BINARY_AUDIO_HEADER.pack(header_length, max(0, min(content_index, 0xFFFF))),
+        item_id_bytes,
+        padding,
+        audio_data,
+    ))
+
+
+def peek_event_type(raw_event: str) -> Optional[str]:
+    """
+    Lee el campo "type" de un evento realtime con un escaneo del prefijo,
+    sin decodificar el JSON completo. Devuelve None si no puede determinarlo.
+    """
+    match = EVENT_TYPE_PREFIX_PATTERN.match(raw_event)
+    return match.group(1) if match else None
+
+
+# PCM16 mono a 24 kHz: 2 bytes por muestra.
+PCM16_BYTES_PER_MS = 24000 * 2 // 1000
+
+
+class AudioFrameCoalescer:
+    """
+    Agrupa los chunks PCM16 pequeños del navegador en un único input_audio_buffer.append.
+    Envía cuando se alcanza la ventana objetivo o cuando vence la espera máxima
+    desde el primer chunk pendiente, lo que ocurra antes.
+    """
+
+    def __init__(
+        self,
+        send_frame: Callable[[bytes], Awaitable[None]],
+        window_ms: int = AUDIO_COALESCE_WINDOW_MS,
+        max_delay_ms: int = AUDIO_COALESCE_MAX_DELAY_MS,
+    ):
+        self._send_frame = send_frame
+        # Múltiplo de 2 para no partir muestras PCM16.
+        self._target_bytes = max(0, window_ms) * PCM16_BYTES_PER_MS // 2 * 2
+        self._max_delay_seconds = max(0, max_delay_ms) / 1000
+        self._buffer = bytearray()
+        self._deadline_task: Optional[asyncio.Task] = None
+        self._send_lock = asyncio.Lock()
+        self.chunks_received = 0
+        self.frames_sent = 0
+
+    async def push(self, audio_data: bytes) -> None:
+        """Añade un chunk y envía si se alcanza la ventana objetivo."""
+        self.chunks_received += 1
+        if self._target_bytes <= 0:
+            await self._send(bytes(audio_data))
+            return
+
+        self._buffer += audio_data
+        if len(self._buffer) >= self._target_bytes:
+            await self.flush()
+        elif self._deadline_task is None:
+            self._deadline_task = asyncio.create_task(self._flush_after_deadline())
+
+    async def flush(self) -> None:
+        """Envía el audio pendiente (si lo hay) como un solo append."""
+        self._cancel_deadline()
+        if not self._buffer:
+            return
+        payload = bytes(self._buffer)
+        self._buffer.clear()
+        await self._send(payload)
+
+    async def close(self) -> None:
+        """Descarta el temporizador y el audio pendiente al cerrar la sesión."""
+        self._cancel_deadline()
+        self._buffer.clear()
+
+    async def _send(self, payload: bytes) -> None:
+        # El lock garantiza el orden entre el flush por tamaño y el flush por deadline.
+        async with self._send_lock:
+            await self._send_frame(build_audio_append_frame(payload))
+            self.frames_sent += 1
+
+    async def _flush_after_deadline(self) -> None:
+        try:
+            await asyncio.sleep(self._max_delay_seconds)
+            self._deadline_task = None
+            await self.flush()
+        except asyncio.CancelledError:
+            pass
+        except websockets.exceptions.ConnectionClosed:
+            logger.info("Conexión con GPT Realtime cerrada (flush de audio)")
+        except Exception as err:
+            logger.warning("Error enviando audio coalescido: %s", err)
+
+    def _cancel_deadline(self) -> None:
+        task = self._deadline_task
+        self._deadline_task = None
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+
+
 def send_user_data_to_external_api_sync(order_number: str, user_data: dict[str, Any]) -> bool:
     """
     Envía datos del usuario a una API externa (si está configurada).
@@ -673,58 +1241,38 @@ def send_user_data_to_external_api_sync(order_number: str, user_data: dict[str,
     return False
 
 
-async def trigger_gift_robot(order_number: str) -> bool:
+def build_robot_dispatch(order_number: str, user_data: dict[str, Any]) -> tuple[str, dict[str, Any]]:
     """
-    Dispara evento para mover el robot de regalo.
-    Envía el número de orden al robot.
+    Robot y cuerpo de la orden HTTP para el usuario, con el mismo criterio que
+    `robot_action`: con caricaturas se dibuja la primera, si no se entrega el regalo.
+    La imagen es la que guarda Firebase (data URL o referencia /blobs/{sha256}).
     """
-    print(f"🎁 Disparando evento de regalo para usuario {order_number}...")
-    try:
-        response = await asyncio.to_thread(
-            lambda: requests.post(
-                GIFT_ROBOT_API_URL,
-                json={"orderNumber": order_number, "action": "gift"},
-                timeout=10,
-            )
-        )
-        if 200 <= response.status_code < 300:
-            print(f"✅ Robot regalo activado para usuario {order_number}")
-            return True
-        else:
-            print(f"⚠️ Robot regalo respondió con status {response.status_code}")
-            return False
-    except Exception as e:
-        print(f"se ha lanzado evento para regalo (error: {e})")
-        return False
+    action = build_robot_action_payload(user_data)
+    if action["type"] == "draw_caricature":
+        return ROBOT_CARICATURE, {
+            "orderNumber": order_number,
+            "action": "caricature",
+            "image": action["caricatureImage"],
+        }
+    return ROBOT_GIFT, {"orderNumber": order_number, "action": "gift"}
 
 
-async def trigger_caricature_robot(order_number: str, caricature_base64: str) -> bool:
-    """
-    Dispara evento para que el robot dibuje la caricatura.
-    Envía la imagen en base64 al robot.
-    """
-    print(f"🖼️ Disparando evento de caricatura para usuario {order_number}...")
+def dispatch_robot_for_user(order_number: str, user_data: dict[str, Any]) -> None:
+    """Encola la orden del robot sin esperar a la entrega (idempotente por visitante)."""
+    robot, payload = build_robot_dispatch(order_number, user_data)
+    if not robot_dispatcher.configured(robot):
+        return
     try:
-        response = await asyncio.to_thread(
-            lambda: requests.post(
-                CARICATURE_ROBOT_API_URL,
-                json={
-                    "orderNumber": order_number,
-                    "action": "caricature",
-                    "image": caricature_base64,
-                },
-                timeout=30,
-            )
-        )
-        if 200 <= response.status_code < 300:
-            print(f"✅ Robot caricatura activado para usuario {order_number}")
-            return True
-        else:
-            print(f"⚠️ Robot caricatura respondió con status {response.status_code}")
-            return False
-    except Exception as e:
-        print(f"se ha lanzado evento para caricatura (error: {e})")
-        return False
+        delivery = robot_dispatcher.dispatch(robot, order_number, payload)
+    except RobotQueueFullError as err:
+        logger.error("%s: se descarta la orden del robot", err, extra={"order": order_number})
+        return
+    logger.info(
+        "Orden para robot %s: %s",
+        robot,
+        delivery.status,
+        extra={"order": order_number, "deliveryId": delivery.id},
+    )
 
 
 def setup_firebase_status_listener():
@@ -763,19 +1311,192 @@ def setup_firebase_status_listener():
         print(f"⚠️ Error configurando listener de status: {e}")
 
 
+def setup_firebase_users_listener():
+    """
+    Configura listener sobre `users` para invalidar la caché de usuarios
+    cuando cambia algún registro desde fuera del backend.
+    """
+    global users_listener_started
+
+    if users_listener_started or not USER_CACHE_FIREBASE_LISTENER or not user_cache.enabled:
+        return
+
+    if firebase_app is None:
+        print("⚠️ Firebase no inicializado, no se puede configurar listener de users")
+        return
+
+    initial_sync_done = False
+
+    def on_users_change(event):
+        nonlocal initial_sync_done
+        path_parts = [part for part in (event.path or "").split("/") if part]
+        if not path_parts:
+            # El primer evento es la sincronización completa del nodo: nada que invalidar.
+            if initial_sync_done:
+                user_cache.clear()
+            initial_sync_done = True
+            return
+        user_cache.invalidate(path_parts[0])
+
+    try:
+        db.reference("users", app=firebase_app).listen(on_users_change)
+        users_listener_started = True
+        print("✅ Listener de users de Firebase configurado (invalidación de caché)")
+    except Exception as e:
+        print(f"⚠️ Error configurando listener de users: {e}")
+
+
 initialize_firebase()
 setup_firebase_status_listener()
+setup_firebase_users_listener()
+
+firebase_rtdb = FirebaseRealtimeClient(
+    FIREBASE_DATABASE_URL,
+    token_provider=firebase_access_token if firebase_app is not None else None,
+    timeout_seconds=FIREBASE_HTTP_TIMEOUT_SECONDS,
+    max_connections=FIREBASE_HTTP_MAX_CONNECTIONS,
+    max_concurrency=FIREBASE_HTTP_MAX_CONCURRENCY,
+)
+
+realtime_pool = RealtimeConnectionPool(
+    build_realtime_url_candidates() if AZURE_OPENAI_API_KEY else [],
+    {"api-key": AZURE_OPENAI_API_KEY},
+    build_realtime_session_init,
+    size=REALTIME_POOL_SIZE,
+    max_age_seconds=REALTIME_POOL_MAX_AGE_SECONDS,
+    ping_interval_seconds=REALTIME_POOL_PING_INTERVAL_SECONDS,
+    connect_timeout_seconds=REALTIME_CONNECT_TIMEOUT_SECONDS,
+)
+
+robot_dispatcher = RobotDispatcher(
+    {ROBOT_GIFT: GIFT_ROBOT_API_URL, ROBOT_CARICATURE: CARICATURE_ROBOT_API_URL},
+    timeout_seconds=ROBOT_HTTP_TIMEOUT_SECONDS,
+    max_attempts=ROBOT_MAX_ATTEMPTS,
+    retry_base_seconds=ROBOT_RETRY_BASE_SECONDS,
+    retry_max_seconds=ROBOT_RETRY_MAX_SECONDS,
+    max_queue_size=ROBOT_QUEUE_SIZE,
+    retention_seconds=ROBOT_DELIVERY_RETENTION_SECONDS,
+)
+
+
+async def run_caricature_job(job: Job) -> dict[str, Any]:
+    """
+    Trabajo de la cola de caricaturas: genera en Azure (pool de hilos propio),
+    guarda las imágenes y actualiza users/{order}. Si solo falla la escritura en
+    Firebase, el reintento no vuelve a pagar la generación.
+    """
+    order_number = job.payload["orderNumber"]
+    log_extra = {"order": order_number, "jobId": job.id}
+    logger.info("Inicio generación de caricatura (intento %d)", job.attempts, extra=log_extra)
+
+    fields = job.payload.get("fields")
+    if fields is None:
+        job.set_stage("generating")
+        logger.info("Generando caricatura en Azure Foundry", extra=log_extra)
+        loop = asyncio.get_running_loop()
+
+        def generate(publish_preview: Callable[[Any], None]) -> Awaitable[list[str]]:
+            def publish_partial_image(index: int, b64_image: str) -> None:
+                # Llega desde el hilo de generación: se publica en el event loop.
+                preview = {"index": index, "image": f"data:image/png;base64,{b64_image}"}
+                loop.call_soon_threadsafe(publish_preview, preview)
+
+            return loop.run_in_executor(
+                image_generation_executor,
+                call_image_generation_sync,
+                photo_bytes,
+                publish_partial_image,
+            )
+
+        photo_bytes = job.payload["photoBytes"]
+        try:
+            # Misma foto y parámetros (reenvío o reintento del frontend): se reutiliza
+            # el resultado o se espera a la generación que ya está en curso, cuyas
+            # previsualizaciones llegan también a este trabajo.
+            caricatures_base64, source = await caricature_cache.get_or_generate(
+                build_caricature_request_key(photo_bytes),
+                generate,
+                on_partial=job.set_preview,
+            )
+        except ImageGenerationError as err:
+            if not err.transient:
+                raise PermanentJobError(str(err)) from err
+            raise
+        logger.info(
+            "Caricaturas obtenidas (%s): %d, longitudes base64 %s",
+            source,
+            len(caricatures_base64),
+            [len(b64_img) for b64_img in caricatures_base64],
+            extra=log_extra,
+        )
+
+        job.preview = None
+        job.set_stage("storing")
+        # Con almacén de blobs, Firebase guarda referencias cortas; en modo inline, data URL.
+        caricatures_data_urls = [
+            await store_image_base64(img_b64, "image/png") for img_b64 in caricatures_base64
+        ]
+        fields = {
+            "caricatures": caricatures_data_urls,
+            "caricaturesTimestamp": datetime.datetime.utcnow().isoformat() + "Z",
+        }
+        if blob_store is not None:
+            # La foto original (escrita por el frontend como data URL) también sale de Firebase.
+            fields["photo"] = await store_image(photo_bytes, sniff_image_content_type(photo_bytes[:16]))
+        job.payload["fields"] = fields
+        # Un reintento solo repite el guardado: la foto ya no hace falta en memoria.
+        job.payload.pop("photoBytes", None)
+
+    job.set_stage("saving")
+    logger.info("Guardando caricaturas en Firebase", extra=log_extra)
+    updated_ok = await update_user_fields_in_realtime_db(order_number, fields)
+    if not updated_ok:
+        raise RuntimeError("No se pudo guardar caricatures en Firebase")
+
+    logger.info("Caricaturas guardadas en users/%s/caricatures", order_number, extra=log_extra)
+    return {
+        "orderNumber": order_number,
+        "storedInFirebase": True,
+        "generatedCount": len(fields["caricatures"]),
+    }
 
 
-class CaricatureGenerationRequest(BaseModel):
-    orderNumber: str
-    photoBase64: str
+caricature_cache = CaricatureResultCache(
+    max_bytes=CARICATURE_CACHE_MAX_BYTES,
+    max_entries=CARICATURE_CACHE_MAX_ENTRIES,
+    disk_dir=CARICATURE_CACHE_DIR,
+    disk_max_bytes=CARICATURE_CACHE_DISK_MAX_BYTES,
+)
+# Pool de hilos propio: las llamadas bloqueantes a Azure no ocupan el pool por defecto
+# (que usan Firebase, resúmenes, etc.) y su número queda acotado por la concurrencia de la cola.
+image_generation_executor = ThreadPoolExecutor(
+    max_workers=max(1, CARICATURE_JOB_CONCURRENCY),
+    thread_name_prefix="image-generation",
+)
+caricature_jobs = JobQueue(
+    "caricature",
+    run_caricature_job,
+    concurrency=CARICATURE_JOB_CONCURRENCY,
+    max_queue_size=CARICATURE_JOB_QUEUE_SIZE,
+    max_attempts=CARICATURE_JOB_MAX_ATTEMPTS,
+    retry_base_seconds=CARICATURE_JOB_RETRY_BASE_SECONDS,
+    retention_seconds=CARICATURE_JOB_RETENTION_SECONDS,
+)
 
 
 class TranscriptionSummaryRequest(BaseModel):
     messages: list[dict[str, str]]
 
 
+class TranscriptionBatchConversation(TranscriptionSummaryRequest):
+    id: Optional[str] = None
+
+
+class TranscriptionSummaryBatchRequest(BaseModel):
+    conversations: list[TranscriptionBatchConversation]
+    batchId: Optional[str] = None
+
+
 def build_user_summary_fallback(messages: list[str]) -> str:
     """
     Fallback local para generar un resumen breve y legible del usuario
@@ -851,9 +1572,41 @@ def build_user_summary_fallback(messages: list[str]) -> str:
     return summary
 
 
-async def summarize_user_messages_with_realtime(messages: list[dict[str, str]]) -> str:
+SUMMARY_SESSION_INSTRUCTIONS = "You are an assistant that summarizes conversations accurately."
+
+
+def build_summary_session_init() -> dict[str, Any]:
+    """session.update de las sesiones de resumen: solo texto."""
+    return {
+        "type": "session.update",
+        "session": {
+            "modalities": ["text"],
+            "instructions": SUMMARY_SESSION_INSTRUCTIONS,
+        },
+    }
+
+
+async def summarize_with_chat_completions(prompt: str) -> str:
+    """Respaldo REST del resumen (SUMMARY_CHAT_DEPLOYMENT)."""
+
+    def call() -> str:
+        completion = client.chat.completions.create(
+            model=SUMMARY_CHAT_DEPLOYMENT,
+            messages=[
+                {"role": "system", "content": SUMMARY_SESSION_INSTRUCTIONS},
+                {"role": "user", "content": prompt},
+            ],
+            timeout=SUMMARY_DEADLINE_SECONDS,
+        )
+        return completion.choices[0].message.content or ""
+
+    return await asyncio.to_thread(call)
+
+
+async def summarize_user_messages_with_realtime(messages: list[dict[str, str]]) -> tuple[str, str]:
     """
     Resume solo los mensajes del usuario usando gpt-realtime en modo texto.
+    Devuelve (resumen, origen): "model", "rest" o "fallback" (resumen local).
     """
     normalized_messages: list[dict[str, str]] = []
     for item in messages:
@@ -870,21 +1623,9 @@ async def summarize_user_messages_with_realtime(messages: list[dict[str, str]])
     ]
 
     if not user_only_messages:
-        return ""
+        return "", SUMMARY_SOURCE_FALLBACK
     if not AZURE_OPENAI_ENDPOINT or not AZURE_OPENAI_API_KEY:
-        return build_user_summary_fallback(user_only_messages)
-
-    endpoint_base = AZURE_OPENAI_ENDPOINT.rstrip("/")
-    if endpoint_base.startswith("https://"):
-        endpoint_base = endpoint_base.replace("https://", "wss://")
-    elif endpoint_base.startswith("http://"):
-        endpoint_base = endpoint_base.replace("http://", "ws://")
-
-    realtime_url = (
-        f"{endpoint_base}/openai/realtime"
-        f"?deployment={MODEL_NAME}&api-version={AZURE_OPENAI_API_VERSION}"
-    )
-    headers = {"api-key": AZURE_OPENAI_API_KEY}
+        return build_user_summary_fallback(user_only_messages), SUMMARY_SOURCE_FALLBACK
 
     full_conversation = "\n".join(
         f"- {m['role'].upper()}: {m['content']}" for m in normalized_messages
@@ -895,60 +1636,36 @@ async def summarize_user_messages_with_realtime(messages: list[dict[str, str]])
         f"{full_conversation}\n\n"
     )
 
-    collected_text_parts: list[str] = []
     try:
-        async with websockets.connect(realtime_url, additional_headers=headers) as realtime_ws:
-            session_init = {
-                "type": "session.update",
-                "session": {
-                    "modalities": ["text"],
-                    "instructions": "You are an assistant that summarizes conversations accurately.",
-                },
-            }
-            await realtime_ws.send(json.dumps(session_init))
-
-            await realtime_ws.send(
-                json.dumps(
-                    {
-                        "type": "conversation.item.create",
-                        "item": {
-                            "type": "message",
-                            "role": "user",
-                            "content": [{"type": "input_text", "text": summarization_prompt}],
-                        },
-                    }
-                )
-            )
-            await realtime_ws.send(json.dumps({"type": "response.create"}))
-
-            # Recibir texto hasta completar la respuesta
-            for _ in range(200):
-                raw = await asyncio.wait_for(realtime_ws.recv(), timeout=20)
-                if not isinstance(raw, str):
-                    continue
-                event = json.loads(raw)
-                event_type = event.get("type")
-                if event_type in ("conversation.item.output_text.delta", "response.output_text.delta"):
-                    delta = event.get("delta")
-                    if isinstance(delta, str):
-                        collected_text_parts.append(delta)
-                elif event_type in ("conversation.item.output_text.done", "response.output_text.done"):
-                    text = event.get("text")
-                    if isinstance(text, str) and text.strip():
-                        if not "".join(collected_text_parts).strip():
-                            collected_text_parts.append(text)
-                elif event_type == "response.done":
-                    break
-    except Exception as err:
-        print(f"⚠️ Error resumiendo con gpt-realtime: {err}")
-
-    summary = "".join(collected_text_parts).strip()
-    if summary:
-        # Si el modelo devolvió algo con formato de "lista pegada", usar fallback limpio.
-        if summary.count("|") >= 2 and len(summary) > 120:
-            return build_user_summary_fallback(user_only_messages)
-        return summary
-    return build_user_summary_fallback(user_only_messages)
+        summary, source = await summarization_service.summarize(
+            summarization_prompt,
+            lambda: build_user_summary_fallback(user_only_messages),
+        )
+    except SummaryQueueFullError:
+        print("⚠️ Cola de resúmenes llena, se usa el resumen local")
+        return build_user_summary_fallback(user_only_messages), SUMMARY_SOURCE_FALLBACK
+
+    # Si el modelo devolvió algo con formato de "lista pegada", usar fallback limpio.
+    if source != SUMMARY_SOURCE_FALLBACK and summary.count("|") >= 2 and len(summary) > 120:
+        return build_user_summary_fallback(user_only_messages), SUMMARY_SOURCE_FALLBACK
+    return summary, source
+
+
+summarization_service = SummarizationService(
+    RealtimeConnectionPool(
+        build_realtime_url_candidates() if AZURE_OPENAI_API_KEY else [],
+        {"api-key": AZURE_OPENAI_API_KEY},
+        build_summary_session_init,
+        size=0,
+        connect_timeout_seconds=REALTIME_CONNECT_TIMEOUT_SECONDS,
+    ),
+    rest_summarize=summarize_with_chat_completions if SUMMARY_CHAT_DEPLOYMENT else None,
+    workers=SUMMARY_WORKERS,
+    max_queue_size=SUMMARY_QUEUE_SIZE,
+    deadline_seconds=SUMMARY_DEADLINE_SECONDS,
+    session_max_age_seconds=SUMMARY_SESSION_MAX_AGE_SECONDS,
+)
+summary_checkpoints = SummaryCheckpointStore(SUMMARY_CHECKPOINT_DIR)
 
 
 @app.get("/")
@@ -969,9 +1686,31 @@ async def health():
         "status": "healthy",
         "endpoint_configured": bool(AZURE_OPENAI_ENDPOINT),
         "api_key_configured": bool(AZURE_OPENAI_API_KEY),
+        "realtime_pool": realtime_pool.stats(),
+        "caricature_jobs": caricature_jobs.stats(),
+        "caricature_cache": caricature_cache.stats(),
+        "robots": robot_dispatcher.stats(),
+        "summaries": summarization_service.stats(),
+        "logging": logging_stats(),
+        "prompt_cache": get_session_prompt.cache_info()._asdict(),
+        "voice_sessions": session_registry.stats(),
     }
 
 
+@app.get("/sessions")
+async def voice_sessions():
+    """Sesiones de voz vivas (activas y en cola) con su uso de recursos."""
+    return {**session_registry.stats(), "sessions": session_registry.snapshot()}
+
+
+@app.get("/metrics")
+async def metrics():
+    """Histogramas de latencia en formato de exposición de Prometheus."""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Métricas desactivadas")
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.get("/firebase/health")
 async def firebase_health():
     """Estado de integración Firebase en backend."""
@@ -980,13 +1719,15 @@ async def firebase_health():
         "service_account_path_configured": bool(FIREBASE_SERVICE_ACCOUNT_PATH),
         "service_account_json_configured": bool(FIREBASE_SERVICE_ACCOUNT_JSON.strip()),
         "admin_sdk_initialized": firebase_app is not None,
+        "users_listener_started": users_listener_started,
+        "user_cache": user_cache.stats(),
     }
 
 
 @app.get("/firebase/users/{order_number}")
 async def firebase_get_user(order_number: str):
     """Lee users/{order_number} en Realtime Database."""
-    user = get_user_from_realtime_db(order_number)
+    user = await get_user_from_realtime_db(order_number)
     return {
         "order_number": order_number,
         "found": user is not None,
@@ -994,61 +1735,189 @@ async def firebase_get_user(order_number: str):
     }
 
 
-@app.post("/photo/generate-caricature")
-async def generate_caricature(payload: CaricatureGenerationRequest):
+@app.get("/blobs/{key}")
+async def get_blob(key: str, request: Request):
+    """
+    Sirve una imagen del almacén. La clave SHA-256 es un ETag fuerte e inmutable;
+    admite If-None-Match (304) y peticiones Range de un solo rango (206/416).
     """
-    Genera caricaturas desde foto usando gpt-image-1.5 y las guarda en
-    users/{order}/caricatures (array).
+    if blob_store is None:
+        raise HTTPException(status_code=404, detail="Almacén de imágenes no configurado")
+
+    try:
+        total_size = await asyncio.to_thread(blob_store.size, key)
+    except BlobNotFoundError:
+        raise HTTPException(status_code=404, detail="Imagen no encontrada")
+
+    etag = f'"{key}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Accept-Ranges": "bytes",
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match and any(tag.strip() in (etag, "*") for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range and if_range.strip() != etag:
+        range_header = None
+    try:
+        byte_range = parse_byte_range(range_header, total_size)
+    except ValueError:
+        headers["Content-Range"] = f"bytes */{total_size}"
+        return Response(status_code=416, headers=headers)
+
+    try:
+        if byte_range is None:
+            body = await asyncio.to_thread(blob_store.read, key)
+            content_type = sniff_image_content_type(body[:16])
+            return Response(content=body, media_type=content_type, headers=headers)
+
+        start, end = byte_range
+        head = await asyncio.to_thread(blob_store.read, key, 0, 15)
+        body = await asyncio.to_thread(blob_store.read, key, start, end)
+    except BlobNotFoundError:
+        raise HTTPException(status_code=404, detail="Imagen no encontrada")
+    headers["Content-Range"] = f"bytes {start}-{end}/{total_size}"
+    return Response(
+        content=body,
+        status_code=206,
+        media_type=sniff_image_content_type(head),
+        headers=headers,
+    )
+
+
+@app.post("/photo/generate-caricature", status_code=202)
+async def generate_caricature(request: Request):
     """
-    order_number = payload.orderNumber.strip()
-    print("========================================")
-    print("🟦 Inicio generación de caricatura")
-    print(f"🧾 orderNumber: {order_number}")
-    print("========================================")
+    Encola la generación de caricaturas (gpt-image-1.5 -> users/{order}/caricatures)
+    y devuelve el id del trabajo sin esperar a Azure. El progreso se consulta en
+    /photo/jobs/{id} o se recibe por SSE en /photo/jobs/{id}/events.
 
+    Cuerpo JSON `{"orderNumber": "...", "photoBase64": "<base64 o data URL>"}`. Se lee
+    por chunks y la foto se decodifica al vuelo: nunca se materializa el string base64.
+    """
+    decoder = Base64FieldStreamDecoder("photoBase64", max_bytes=CARICATURE_MAX_REQUEST_BYTES)
+    try:
+        async for chunk in request.stream():
+            decoder.feed(chunk)
+        fields, photo_bytes = decoder.finish()
+    except PayloadTooLargeError as err:
+        raise HTTPException(status_code=413, detail=str(err))
+    except ValueError as err:
+        raise HTTPException(status_code=400, detail=f"Cuerpo inválido: {err}")
+
+    order_number = str(fields.get("orderNumber") or "").strip()
     if not order_number:
         raise HTTPException(status_code=400, detail="orderNumber es obligatorio")
-    if not payload.photoBase64.strip():
+    if not photo_bytes:
         raise HTTPException(status_code=400, detail="photoBase64 es obligatorio")
 
     try:
-        print("1) Generando caricatura en Azure Foundry...")
-        caricatures_base64 = await asyncio.to_thread(
-            call_image_generation_sync,
-            payload.photoBase64,
-        )
-        print(f"2) Caricaturas generadas. Total: {len(caricatures_base64)}")
-        for i, b64_img in enumerate(caricatures_base64, start=1):
-            print(f"   - Caricatura #{i}: longitud base64={len(b64_img)}")
+        # Clave = número de orden, para seguir su progreso desde /ws.
+        job = caricature_jobs.submit({
+            "orderNumber": order_number,
+            "photoBytes": photo_bytes,
+        }, key=order_number)
+    except JobQueueFullError as err:
+        logger.error("Cola de caricaturas llena, se rechaza la petición", extra={"order": order_number})
+        raise HTTPException(status_code=503, detail=str(err))
 
-        caricatures_data_urls = [
-            f"data:image/png;base64,{img_b64}" for img_b64 in caricatures_base64
-        ]
+    logger.info("Caricatura encolada", extra={"order": order_number, "jobId": job.id})
+    return {
+        "ok": True,
+        "orderNumber": order_number,
+        "jobId": job.id,
+        "status": job.status,
+        "statusUrl": f"/photo/jobs/{job.id}",
+        "eventsUrl": f"/photo/jobs/{job.id}/events",
+    }
 
-        print("3) Guardando caricaturas en Firebase...")
-        updated_ok = await asyncio.to_thread(
-            update_user_fields_in_realtime_db,
-            order_number,
-            {
-                "caricatures": caricatures_data_urls,
-                "caricaturesTimestamp": datetime.datetime.utcnow().isoformat() + "Z",
-            },
-        )
-        if not updated_ok:
-            raise RuntimeError("No se pudo guardar caricatures en Firebase")
 
-        print(f"✅ Caricaturas guardadas en users/{order_number}/caricatures")
-        return {
-            "ok": True,
-            "orderNumber": order_number,
-            "storedInFirebase": True,
-            "generatedCount": len(caricatures_data_urls),
-        }
-    except HTTPException:
+def find_caricature_job_for_order(order_number: str) -> Optional[Job]:
+    """Último trabajo de caricatura del usuario mientras la cola lo conserve."""
+    return caricature_jobs.latest(order_number)
+
+
+# Órdenes de robot aplazadas hasta que termine la caricatura en curso (una por orden).
+deferred_robot_dispatches: dict[str, asyncio.Task] = {}
+
+
+async def dispatch_robot_after_caricature(order_number: str, job: Job) -> None:
+    """Espera a que termine la caricatura y encola la orden del robot con el registro final."""
+    try:
+        async for _ in caricature_jobs.subscribe(job):
+            pass
+        user_data = await get_user_from_realtime_db(order_number)
+        if user_data:
+            dispatch_robot_for_user(order_number, user_data)
+    except asyncio.CancelledError:
         raise
     except Exception as err:
-        print(f"❌ Error en generación/guardado de caricatura: {err}")
-        raise HTTPException(status_code=500, detail=str(err))
+        logger.warning("No se pudo enviar la orden aplazada del robot: %s", err, extra={"order": order_number})
+    finally:
+        deferred_robot_dispatches.pop(order_number, None)
+
+
+def defer_robot_dispatch(order_number: str, job: Job) -> None:
+    """
+    La orden HTTP al robot es irrevocable: con una caricatura en curso se espera a su
+    resultado (dibujo, o regalo si falla) en vez de enviar ya el regalo. No depende de
+    la sesión /ws: si el visitante se desconecta, la orden sale igualmente.
+    """
+    if order_number in deferred_robot_dispatches:
+        return
+    task = asyncio.create_task(dispatch_robot_after_caricature(order_number, job))
+    deferred_robot_dispatches[order_number] = task
+
+
+@app.get("/photo/jobs/{job_id}")
+async def get_caricature_job(job_id: str):
+    """Estado de un trabajo de generación de caricaturas."""
+    job = caricature_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return job.snapshot()
+
+
+@app.get("/photo/jobs/{job_id}/events")
+async def stream_caricature_job(job_id: str):
+    """
+    Server-Sent Events con cada cambio de estado del trabajo hasta que termina.
+    Las previsualizaciones progresivas se emiten aparte como `event: preview`.
+    """
+    job = caricature_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+
+    async def event_stream():
+        last_preview_index = None
+        async for snapshot in caricature_jobs.subscribe(job):
+            preview = job.preview
+            if preview is not None and snapshot["previewIndex"] != last_preview_index:
+                last_preview_index = snapshot["previewIndex"]
+                yield f"event: preview\ndata: {json.dumps(preview)}\n\n"
+            yield f"event: job\ndata: {json.dumps(snapshot)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/robots/deliveries/{order_number}")
+async def get_robot_deliveries(order_number: str):
+    """Estado de las órdenes enviadas a los robots para un número de orden."""
+    deliveries = robot_dispatcher.find_by_order(order_number.strip())
+    if not deliveries:
+        raise HTTPException(status_code=404, detail="Sin órdenes de robot para ese número")
+    return {
+        "orderNumber": order_number.strip(),
+        "deliveries": [delivery.snapshot() for delivery in deliveries],
+    }
 
 
 @app.post("/transcriptions/summarize")
@@ -1056,13 +1925,74 @@ async def summarize_transcription(payload: TranscriptionSummaryRequest):
     """
     Recibe mensajes del usuario y devuelve un resumen generado con gpt-realtime.
     """
-    summary = await summarize_user_messages_with_realtime(payload.messages)
+    summary, source = await summarize_user_messages_with_realtime(payload.messages)
     return {
         "ok": True,
         "summary": summary,
+        "source": source,
     }
 
 
+@app.post("/transcriptions/summarize/batch")
+async def summarize_transcription_batch(payload: TranscriptionSummaryBatchRequest):
+    """
+    Resume muchas conversaciones y devuelve los resultados como NDJSON según terminan.
+    Reenviar el mismo lote (mismo contenido o mismo batchId) reanuda desde el checkpoint.
+    """
+    if not payload.conversations:
+        raise HTTPException(status_code=400, detail="Lote sin conversaciones")
+    if len(payload.conversations) > SUMMARY_BATCH_MAX_CONVERSATIONS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Máximo {SUMMARY_BATCH_MAX_CONVERSATIONS} conversaciones por lote",
+        )
+    if payload.batchId is not None and not BATCH_ID_PATTERN.fullmatch(payload.batchId):
+        raise HTTPException(status_code=400, detail="batchId solo admite letras, números, '_' y '-' (máx. 64)")
+
+    async def ndjson_stream():
+        async for event in stream_summary_batch(
+            [(conversation.id, conversation.messages) for conversation in payload.conversations],
+            summarize_user_messages_with_realtime,
+            summary_checkpoints,
+            batch_id=payload.batchId,
+            concurrency=SUMMARY_BATCH_CONCURRENCY,
+        ):
+            if event["type"] == "done":
+                print(
+                    f"✅ Lote de resúmenes {event['batchId']}: {event['completed']} completados, "
+                    f"{event['failed']} con error en {event['elapsedSeconds']}s"
+                )
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(
+        ndjson_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def wait_for_voice_session_slot(websocket: WebSocket, session: VoiceSession) -> bool:
+    """
+    Espera en la cola de admisión avisando al frontend de su posición. Mientras
+    espera se descartan los mensajes del cliente; si se desconecta, la sesión sale
+    de la cola y devuelve False. SessionLimitError si se rechaza o se agota la espera.
+    """
+
+    async def notify_queued(position: int) -> None:
+        logger.info("Sesión de voz en cola", extra={"position": position})
+        await websocket.send_json({
+            "type": "session.queued",
+            "position": position,
+            "maxSessions": session_registry.max_sessions,
+        })
+
+    async def wait_for_disconnect() -> None:
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    return await session_registry.wait_for_slot(session, notify_queued, wait_for_disconnect)
+
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """
@@ -1070,8 +2000,17 @@ async def websocket_endpoint(websocket: WebSocket):
     Recibe audio del frontend y lo reenvía al modelo GPT Realtime de Microsoft Foundry.
     """
     await websocket.accept()
-    
+    # El cliente puede pedir el audio de respuesta como frames binarios (sin base64).
+    binary_audio = websocket.query_params.get("audio", "").strip().lower() == BINARY_AUDIO_QUERY_VALUE
+    session = session_registry.register(
+        client=websocket.client.host if websocket.client else "",
+        binary_audio=binary_audio,
+    )
+    # Id corto de sesión en cada línea de log (también en las tareas que se creen después).
+    bind_log_context(session=session.id)
+
     if not client:
+        session_registry.release(session)
         await websocket.send_json({
             "type": "error",
             "message": "Azure OpenAI no está configurado. Verifica las variables de entorno."
@@ -1079,40 +2018,51 @@ async def websocket_endpoint(websocket: WebSocket):
         await websocket.close()
         return
 
+    # Admisión: cada sesión abre una conexión GPT Realtime; sin hueco se espera en cola
+    # (el frontend recibe session.queued) o se rechaza con el código 1013 (reintentar).
     try:
-        endpoint_base = AZURE_OPENAI_ENDPOINT.rstrip('/')
-        if endpoint_base.startswith('https://'):
-            endpoint_base = endpoint_base.replace('https://', 'wss://')
-        elif endpoint_base.startswith('http://'):
-            endpoint_base = endpoint_base.replace('http://', 'ws://')
-        
-        realtime_url = f"{endpoint_base}/openai/realtime?deployment={MODEL_NAME}&api-version={AZURE_OPENAI_API_VERSION}"
-        
-        print(f"Intentando conectar a: {realtime_url.replace(AZURE_OPENAI_API_KEY, '***')}")
-        
-        headers = {
-            "api-key": AZURE_OPENAI_API_KEY,
-        }
+        if not session_registry.try_admit(session):
+            if not await wait_for_voice_session_slot(websocket, session):
+                logger.info("Cliente desconectado mientras esperaba en cola")
+                return
+    except SessionLimitError as err:
+        logger.warning("Sesión de voz rechazada: %s", err, extra={"reason": err.reason})
+        try:
+            await websocket.send_json({"type": "error", "code": "session_limit", "message": str(err)})
+            await websocket.close(code=1013)
+        except Exception:
+            pass
+        return
+    except BaseException:
+        # Cliente caído al avisarle de la cola, cancelación...: el hueco no puede quedar sin dueño.
+        session_registry.release(session)
+        raise
+    VOICE_SESSION_WAIT_SECONDS.observe(session.wait_seconds)
+    if binary_audio:
+        logger.info("Cliente solicita audio binario (response.audio.delta sin base64)")
 
+    try:
+        # Conexión ya inicializada del pool (o abierta en el momento si no hay ninguna caliente).
+        # Los fallos de conexión se separan de los errores durante la conversación.
+        acquire_started = monotonic()
+        lease = await realtime_pool.acquire()
+        REALTIME_CONNECT_SECONDS.observe(
+            monotonic() - acquire_started,
+            "pooled" if lease.created_at < acquire_started else "fresh",
+        )
         try:
-            async with websockets.connect(
-                realtime_url,
-                additional_headers=headers,
-            ) as realtime_ws:
-                await handle_realtime_connection(realtime_ws, websocket)
-        except Exception as e:
-            print(f"Error con 'deployment', intentando con 'model': {e}")
-            # Si falla con deployment, intentar con model
-            realtime_url = f"{endpoint_base}/openai/realtime?model={MODEL_NAME}&api-version={AZURE_OPENAI_API_VERSION}"
-            print(f"Intentando conectar a: {realtime_url}")
-            async with websockets.connect(
-                realtime_url,
-                additional_headers=headers,
-            ) as realtime_ws:
-                await handle_realtime_connection(realtime_ws, websocket)
-    
+            await handle_realtime_connection(
+                lease.connection,
+                websocket,
+                binary_audio,
+                warmup_events=lease.warmup_events,
+                session=session,
+            )
+        finally:
+            await lease.close()
+
     except Exception as e:
-        print(f"Error general en WebSocket: {e}")
+        logger.error("Error general en WebSocket: %s", e)
         try:
             if websocket.client_state.name != "DISCONNECTED":
                 await websocket.send_json({
@@ -1122,6 +2072,7 @@ async def websocket_endpoint(websocket: WebSocket):
         except:
             pass
     finally:
+        session_registry.release(session)
         try:
             if websocket.client_state.name != "DISCONNECTED":
                 await websocket.close()
@@ -1129,40 +2080,138 @@ async def websocket_endpoint(websocket: WebSocket):
             pass
 
 
-async def handle_realtime_connection(realtime_ws, websocket):
-    """Maneja la conexión con GPT Realtime una vez establecida"""
+async def handle_realtime_connection(
+    realtime_ws,
+    websocket,
+    binary_audio: bool = False,
+    warmup_events: Optional[list[Any]] = None,
+    session: Optional[VoiceSession] = None,
+):
+    """
+    Maneja la conexión con GPT Realtime una vez establecida.
+    Con binary_audio=True los response.audio.delta se envían al cliente como frames binarios.
+    Si llega warmup_events, la sesión ya tiene aplicado el session.update inicial
+    (conexión del pool) y esos eventos se reenvían al cliente en lugar de esperarlos.
+    `session` es la entrada del registro donde se anota el uso (audio, respuestas, orden).
+    """
+    if session is None:
+        session = VoiceSession(id="")
     session_ctx: dict[str, Any] = {
         "latest_user_text": "",
         "is_user_locked": False,
         "locked_order_number": None,
         "locked_user_data": None,
         "initial_response_sent": False,
+        # Instrucciones vigentes en la sesión upstream (las del session.update inicial o del pool).
+        "upstream_instructions": get_session_prompt(PROMPT_PHASE_WELCOME),
+        "instructions_skipped": 0,
     }
 
-    session_init = {
-        "type": "session.update",
-        "session": {
-            "modalities": ["text", "audio"],
-            "instructions": build_welcome_prompt(),
-            "voice": "cedar",
-            "input_audio_format": "pcm16",
-            "output_audio_format": "pcm16",
-            "input_audio_transcription": {
-                "model": "whisper-1"
-            },
-            "turn_detection": {
-                "type": "server_vad",
-                "threshold": 0.5,
-                "prefix_padding_ms": 300,
-                "silence_duration_ms": 500,
-                "create_response": False,
-            },
-            "input_audio_transcription": {
-                "model": "whisper-1"
-            }
-        }
-    }
-    await realtime_ws.send(json.dumps(session_init))
+    if warmup_events is None:
+        await realtime_ws.send(json.dumps(build_realtime_session_init()))
+
+    session_tasks: set[asyncio.Task] = set()
+    turn_latency = TurnLatencyTracker(VOICE_TURN_SECONDS)
+    log_sampler = LogSampler(LOG_AUDIO_SAMPLE_EVERY)
+    order_prefetcher = OrderNumberPrefetcher(
+        order_number_extractor,
+        get_user_profile_from_realtime_db,
+        max_per_turn=ORDER_NUMBER_PREFETCH_MAX_PER_TURN,
+    )
+
+    def spawn_session_task(coro: Awaitable[Any]) -> None:
+        """Lanza trabajo en segundo plano ligado a la sesión (se espera al cerrarla)."""
+        task = asyncio.create_task(coro)
+        session_tasks.add(task)
+        task.add_done_callback(session_tasks.discard)
+
+    # Seguimiento de la caricatura en curso: se cancela al cerrar la sesión, no se espera.
+    progress_tasks: set[asyncio.Task] = set()
+
+    async def forward_caricature_progress(order_number: str, job: Job) -> None:
+        """
+        Reenvía al panel de caricaturas las previsualizaciones del trabajo en curso
+        (caricature.preview) y, cuando termina, las caricaturas finales (user.context.media).
+        """
+        last_preview_index = None
+        try:
+            async for snapshot in caricature_jobs.subscribe(job):
+                preview = job.preview
+                if preview is not None and snapshot["previewIndex"] != last_preview_index:
+                    last_preview_index = snapshot["previewIndex"]
+                    await websocket.send_json({
+                        "type": "caricature.preview",
+                        "orderNumber": order_number,
+                        "index": preview["index"],
+                        "image": preview["image"],
+                    })
+                if snapshot["status"] != JOB_SUCCEEDED:
+                    continue
+                user_data = await get_user_from_realtime_db(order_number)
+                if user_data:
+                    await websocket.send_json({
+                        "type": "user.context.media",
+                        "orderNumber": order_number,
+                        "caricatures": user_data.get("caricatures") or [],
+                        "photo": user_data.get("photo") if isinstance(user_data.get("photo"), str) else None,
+                    })
+                    logger.info("Caricaturas finales enviadas al frontend", extra={"order": order_number})
+        except asyncio.CancelledError:
+            raise
+        except Exception as err:
+            logger.warning("No se pudo reenviar el progreso de la caricatura: %s", err)
+
+    async def load_user_media_and_persist(order_number: str) -> None:
+        """
+        Carga el registro completo (foto y caricaturas), lo envía al frontend en
+        user.context.media y escribe currentUser + robot_action en Firebase.
+        """
+        user_data = await get_user_from_realtime_db(order_number)
+        if not user_data:
+            logger.warning("No se pudo cargar el registro completo", extra={"order": order_number})
+            return
+
+        resolved_caricatures = user_data.get("caricatures")
+        resolved_photo = user_data.get("photo")
+        if resolved_photo:
+            logger.info("Foto del usuario detectada", extra={"chars": len(str(resolved_photo))})
+        try:
+            if websocket.client_state.name != "DISCONNECTED":
+                await websocket.send_json({
+                    "type": "user.context.media",
+                    "orderNumber": order_number,
+                    "caricatures": (
+                        resolved_caricatures
+                        if isinstance(resolved_caricatures, list)
+                        else []
+                    ),
+                    "photo": resolved_photo if isinstance(resolved_photo, str) else None,
+                })
+                logger.info("Evento user.context.media enviado al frontend")
+        except Exception as err:
+            logger.warning("No se pudo enviar user.context.media al frontend: %s", err)
+
+        pending_job = None
+        if not resolved_caricatures:
+            job = find_caricature_job_for_order(order_number)
+            if job is not None and not job.done:
+                pending_job = job
+                logger.info("Caricatura en curso, se reenvían previsualizaciones", extra={"order": order_number})
+                task = asyncio.create_task(forward_caricature_progress(order_number, job))
+                progress_tasks.add(task)
+                task.add_done_callback(progress_tasks.discard)
+
+        if await write_user_lock_in_to_realtime_db(user_data, order_number):
+            logger.info("currentUser y robot_action actualizados en Firebase")
+        else:
+            logger.warning("No se pudo actualizar currentUser/robot_action en Firebase")
+        if pending_job is not None:
+            defer_robot_dispatch(order_number, pending_job)
+        else:
+            dispatch_robot_for_user(order_number, user_data)
+
+        if USER_DATA_API_URL:
+            await asyncio.to_thread(send_user_data_to_external_api_sync, order_number, user_data)
 
     async def resolve_user_context_if_needed() -> None:
         """
@@ -1170,41 +2219,32 @@ async def handle_realtime_connection(realtime_ws, websocket):
         datos en Firebase, bloquea el contexto para esta sesión.
         """
         if session_ctx["is_user_locked"]:
+            order_prefetcher.discard()
             return
 
         latest_text = session_ctx.get("latest_user_text", "")
         order_number = extract_order_number(latest_text)
         if not order_number:
+            order_prefetcher.discard()
             return
 
-        user_data = await asyncio.to_thread(get_user_from_realtime_db, order_number)
+        # Solo campos escalares: las imágenes se cargan después, fuera del camino crítico.
+        # Si la transcripción parcial ya lo detectó, la lectura está en curso o terminada.
+        user_data = await order_prefetcher.commit(order_number)
+        turn_latency.mark(TURN_STAGE_USER_LOOKUP)
         '''
         print(f"user_data: {user_data}")
         '''
         if not user_data:
-            print(f"⚠️ Número detectado pero sin datos en Firebase: {order_number}")
+            logger.warning("Número detectado pero sin datos en Firebase", extra={"order": order_number})
             return
 
-        current_user_ok = await asyncio.to_thread(
-            write_current_user_to_realtime_db,
-            user_data,
-            order_number,
-        )
-        if current_user_ok:
-            print("✅ currentUser actualizado en Firebase.")
-        else:
-            print("⚠️ No se pudo actualizar currentUser en Firebase.")
-
-        robot_action_ok = await asyncio.to_thread(write_robot_action_to_realtime_db, user_data)
-        if robot_action_ok:
-            print("✅ robot_action actualizado en Firebase.")
-        else:
-            print("⚠️ No se pudo actualizar robot_action en Firebase.")
-
         session_ctx["is_user_locked"] = True
         session_ctx["locked_order_number"] = order_number
         session_ctx["locked_user_data"] = user_data
-        print(f"se ha detectado que se ha pedido el número: {order_number}")
+        update_log_context(order=order_number)
+        session.order_number = order_number
+        logger.info("Número de orden detectado")
         resolved_name = (
             str(
                 user_data.get("fullName")
@@ -1213,57 +2253,54 @@ async def handle_realtime_connection(realtime_ws, websocket):
                 or ""
             ).strip()
         )
-        print(f"Nombre resuelto desde Firebase: {resolved_name or '(vacío)'}")
-        resolved_caricatures = user_data.get("caricatures")
-        has_caricatures = isinstance(resolved_caricatures, list) and len(resolved_caricatures) > 0
-        resolved_photo = user_data.get("photo")
-        if isinstance(resolved_caricatures, list):
-            print(f"Caricaturas detectadas para usuario: {len(resolved_caricatures)}")
-        else:
-            print("Caricaturas detectadas para usuario: 0")
-        if resolved_photo:
-            print(f"Foto del usuario detectada: {len(str(resolved_photo))} caracteres")
+        logger.info("Nombre resuelto desde Firebase: %s", resolved_name or "(vacío)")
+        caricatures_count = int(user_data.get("caricaturesCount") or 0)
+        has_caricatures = caricatures_count > 0
+        logger.info("Caricaturas detectadas para usuario", extra={"caricatures": caricatures_count})
+
+        # Registro completo (foto, caricaturas) + escritura de currentUser/robot_action,
+        # fuera del camino crítico: no hace falta esperarlos para que Fulgencio responda.
+        spawn_session_task(load_user_media_and_persist(order_number))
+
+        async def notify_frontend() -> None:
+            # Enviar al frontend el contexto resuelto; foto y caricaturas llegan
+            # después en user.context.media.
+            try:
+                await websocket.send_json({
+                    "type": "user.context.resolved",
+                    "orderNumber": order_number,
+                    "fullName": resolved_name,
+                    "caricaturesCount": caricatures_count,
+                    "caricatures": [],
+                    "photo": None,
+                })
+                logger.info("Evento user.context.resolved enviado al frontend")
+            except Exception as err:
+                logger.warning("No se pudo enviar user.context.resolved al frontend: %s", err)
 
-        # Enviar al frontend el contexto resuelto (incluyendo caricaturas y foto) para UI.
-        try:
-            await websocket.send_json({
-                "type": "user.context.resolved",
-                "orderNumber": order_number,
-                "fullName": resolved_name,
-                "caricatures": (
-                    resolved_caricatures
-                    if isinstance(resolved_caricatures, list)
-                    else []
-                ),
-                "photo": resolved_photo if isinstance(resolved_photo, str) else None,
-            })
-            print("✅ Evento user.context.resolved enviado al frontend.")
-        except Exception as err:
-            print(f"⚠️ No se pudo enviar user.context.resolved al frontend: {err}")
+        async def update_session_prompt() -> None:
+            # Refuerzo fuerte: fijar contexto personalizado en la sesión realtime.
+            user_name = resolved_name or None
+            session_instructions = get_session_prompt(PROMPT_PHASE_CONVERSATION, user_name, has_caricatures)
 
-        # Refuerzo fuerte: fijar contexto personalizado en la sesión realtime.
-        user_name = resolved_name or None
-        session_instructions = build_conversation_prompt(user_name, has_caricatures)
-        
-        session_update = {
-            "type": "session.update",
-            "session": {
-                "instructions": session_instructions
-            },
-        }
-        try:
-            await realtime_ws.send(json.dumps(session_update))
-            print("✅ session.update con prompt de conversación enviado.")
-        except Exception as err:
-            print(f"⚠️ No se pudo enviar session.update: {err}")
+            session_update = {
+                "type": "session.update",
+                "session": {
+                    "instructions": session_instructions
+                },
+            }
+            try:
+                await realtime_ws.send(json.dumps(session_update))
+                session_ctx["upstream_instructions"] = session_instructions
+                logger.info("session.update con prompt de conversación enviado")
+            except Exception as err:
+                logger.warning("No se pudo enviar session.update: %s", err)
 
-        if USER_DATA_API_URL:
-            await asyncio.to_thread(send_user_data_to_external_api_sync, order_number, user_data)
+        await asyncio.gather(notify_frontend(), update_session_prompt())
 
-    def inject_personalization_in_response(message: dict[str, Any]) -> dict[str, Any]:
-        """
-        Añade instrucciones personalizadas justo antes de pedir respuesta al modelo.
-        """
+
+    def current_session_prompt() -> str:
+        """Prompt que corresponde al estado actual de la sesión (memoizado)."""
         user_data = session_ctx.get("locked_user_data") or {}
         user_name = None
         
@@ -1275,21 +2312,32 @@ async def handle_realtime_connection(realtime_ws, websocket):
                 or user_data.get("nombre")
                 or ""
             ).strip() or None
-            resolved_caricatures = user_data.get("caricatures")
-            has_caricatures = isinstance(resolved_caricatures, list) and len(resolved_caricatures) > 0
+            has_caricatures = user_has_caricatures(user_data)
 
         # Usar prompt de conversación si ya tenemos usuario, si no el de bienvenida
         if session_ctx["is_user_locked"]:
-            personalization = build_conversation_prompt(user_name, has_caricatures)
-        else:
-            personalization = build_welcome_prompt()
+            return get_session_prompt(PROMPT_PHASE_CONVERSATION, user_name, has_caricatures)
+        return get_session_prompt(PROMPT_PHASE_WELCOME)
 
+    def inject_personalization_in_response(message: dict[str, Any]) -> dict[str, Any]:
+        """
+        Añade instrucciones personalizadas justo antes de pedir respuesta al modelo,
+        solo si difieren de las que la sesión upstream ya tiene por session.update.
+        """
+        personalization = current_session_prompt()
         response_payload = message.get("response")
         if not isinstance(response_payload, dict):
             response_payload = {}
 
         existing_instructions = response_payload.get("instructions")
-        if isinstance(existing_instructions, str) and existing_instructions.strip():
+        has_existing_instructions = isinstance(existing_instructions, str) and existing_instructions.strip()
+        if not has_existing_instructions and personalization == session_ctx["upstream_instructions"]:
+            # La sesión ya las tiene: no se reenvían varios KB en cada turno.
+            session_ctx["instructions_skipped"] += 1
+            message["response"] = response_payload
+            return message
+
+        if has_existing_instructions:
             response_payload["instructions"] = (
                 f"{personalization}\n\n{existing_instructions.strip()}"
             )
@@ -1304,11 +2352,18 @@ async def handle_realtime_connection(realtime_ws, websocket):
         response_msg = {"type": "response.create"}
         response_msg = inject_personalization_in_response(response_msg)
         await realtime_ws.send(json.dumps(response_msg))
+        turn_latency.mark(TURN_STAGE_RESPONSE_CREATE)
 
     # Respuesta inicial de la sesión (sin esperar a frontend).
     await trigger_response_create()
     session_ctx["initial_response_sent"] = True
 
+    async def send_audio_frame(frame: bytes) -> None:
+        # Frame de texto construido desde plantilla (sin dict ni json.dumps).
+        await realtime_ws.send(frame, text=True)
+
+    audio_coalescer = AudioFrameCoalescer(send_audio_frame)
+
     async def forward_to_realtime():
         try:
             while True:
@@ -1316,7 +2371,7 @@ async def handle_realtime_connection(realtime_ws, websocket):
                     data = await websocket.receive()
                 except RuntimeError as e:
                     if "disconnect" in str(e).lower():
-                        print("Cliente desconectado (receive)")
+                        logger.info("Cliente desconectado (receive)")
                         break
                     raise
                 
@@ -1324,34 +2379,45 @@ async def handle_realtime_connection(realtime_ws, websocket):
                     audio_data = data["bytes"]
                     audio_size = len(audio_data)
                     if audio_size > 0:
-                        audio_base64 = base64.b64encode(audio_data).decode("utf-8")
+                        session.audio_bytes_in += audio_size
+                        if logger.isEnabledFor(logging.DEBUG) and log_sampler.sample("audio_chunk"):
+                            logger.debug(
+                                "Audio del navegador",
+                                extra={"bytes": audio_size, "sampleEvery": log_sampler.every},
+                            )
                         try:
-                            audio_event = {
-                                "type": "input_audio_buffer.append",
-                                "audio": audio_base64
-                            }
-                            await realtime_ws.send(json.dumps(audio_event))
-                            if audio_size % 100 == 0:
-                                print(f"Audio recibido y enviado a GPT Realtime: {audio_size} bytes")
+                            await audio_coalescer.push(audio_data)
                         except websockets.exceptions.ConnectionClosed:
-                            print("Conexión con GPT Realtime cerrada (enviando audio)")
+                            logger.info("Conexión con GPT Realtime cerrada (enviando audio)")
                             break
                     else:
-                        print("Advertencia: Audio recibido con 0 bytes")
+                        if log_sampler.sample("empty_audio"):
+                            logger.warning("Audio recibido con 0 bytes", extra={"sampleEvery": log_sampler.every})
                     
                 elif "text" in data:
                     try:
+                        # Mantener el orden: el audio pendiente sale antes que cualquier evento de texto.
+                        await audio_coalescer.flush()
                         message = json.loads(data["text"])
                         message_type = message.get("type", "unknown")
-                        print(f"Recibido del frontend: {message_type}")
+                        logger.info("Recibido del frontend", extra={"event": message_type})
 
                         # Forzar control manual de respuestas en cualquier session.update de frontend.
                         if message_type == "session.update":
                             session_payload = message.get("session")
                             if isinstance(session_payload, dict):
+                                if "instructions" in session_payload:
+                                    # El prompt lo decide el backend (antes se imponía en cada
+                                    # response.create); así la sesión queda con el vigente.
+                                    session_payload["instructions"] = current_session_prompt()
+                                    session_ctx["upstream_instructions"] = session_payload["instructions"]
                                 td = session_payload.get("turn_detection")
                                 if isinstance(td, dict):
                                     td["create_response"] = False
+                                # El modelo de transcripción lo decide el backend (deltas para la precarga).
+                                transcription = session_payload.get("input_audio_transcription")
+                                if isinstance(transcription, dict):
+                                    transcription["model"] = REALTIME_TRANSCRIPTION_MODEL
 
                         # Captura mensajes de texto de usuario si vienen por item.create.
                         should_trigger_manual_response = False
@@ -1375,25 +2441,26 @@ async def handle_realtime_connection(realtime_ws, websocket):
                         # Bloquear response.create del frontend: lo controla el backend
                         # para garantizar que Firebase se procese antes de responder.
                         if message_type == "response.create":
-                            print("ℹ️ response.create recibido desde frontend, se ignora (modo control backend).")
+                            logger.info("response.create recibido desde frontend, se ignora (modo control backend)")
                             continue
 
                         await realtime_ws.send(json.dumps(message))
 
                         # Flujo manual para mensajes de texto de usuario.
                         if should_trigger_manual_response:
+                            turn_latency.start_turn()
                             await resolve_user_context_if_needed()
                             await trigger_response_create()
                     except json.JSONDecodeError:
                         pass
                     except websockets.exceptions.ConnectionClosed:
-                        print("Conexión con GPT Realtime cerrada (enviando texto)")
+                        logger.info("Conexión con GPT Realtime cerrada (enviando texto)")
                         break
                         
         except WebSocketDisconnect:
-            print("Cliente desconectado")
+            logger.info("Cliente desconectado")
         except Exception as e:
-            print(f"Error en forward_to_realtime: {e}")
+            logger.error("Error en forward_to_realtime: %s", e)
             try:
                 if not websocket.client_state.name == "DISCONNECTED":
                     await websocket.send_json({
@@ -1403,31 +2470,86 @@ async def handle_realtime_connection(realtime_ws, websocket):
             except:
                 pass
 
+    async def send_binary_audio_delta(data: dict[str, Any]) -> None:
+        """Decodifica el base64 una sola vez y envía el PCM16 como frame binario."""
+        delta = data.get("delta")
+        if not isinstance(delta, str) or not delta:
+            return
+        content_index = data.get("content_index")
+        frame = build_binary_audio_frame(
+            str(data.get("item_id") or ""),
+            content_index if isinstance(content_index, int) else 0,
+            base64.b64decode(delta),
+        )
+        if websocket.client_state.name != "DISCONNECTED":
+            await websocket.send_bytes(frame)
+
+    def on_upstream_event(event_type: Optional[str]) -> None:
+        turn_latency.on_upstream_event(event_type)
+        if event_type == "response.audio.delta":
+            session.audio_deltas_out += 1
+        elif event_type == "response.done":
+            session.responses += 1
+
     async def forward_to_client():
         try:
             while True:
                 message = await realtime_ws.recv()
                 if isinstance(message, str):
+                    # Fast path: eventos que no inspeccionamos (p. ej. response.audio.delta)
+                    # se reenvían como el frame de texto original, sin decode/re-encode.
+                    event_type = peek_event_type(message) if REALTIME_FAST_RELAY else None
+                    on_upstream_event(event_type)
+                    if binary_audio and event_type == "response.audio.delta":
+                        try:
+                            await send_binary_audio_delta(json.loads(message))
+                        except RuntimeError:
+                            logger.info("Cliente desconectado, no se puede enviar audio")
+                            break
+                        continue
+                    if event_type is not None and event_type not in INSPECTED_REALTIME_EVENTS:
+                        try:
+                            if websocket.client_state.name != "DISCONNECTED":
+                                await websocket.send_text(message)
+                        except RuntimeError:
+                            logger.info("Cliente desconectado, no se puede enviar mensaje")
+                            break
+                        continue
+
                     try:
                         data = json.loads(message)
                         """
                         print(f"Recibido de GPT Realtime: {data.get('type', 'unknown')}")
                         """
+                        if event_type is None:
+                            on_upstream_event(data.get("type"))
+
+                        # Transcripción parcial: precarga especulativa del número de orden.
+                        if data.get("type") == TRANSCRIPTION_DELTA_EVENT:
+                            delta = data.get("delta")
+                            if ORDER_NUMBER_PREFETCH and not session_ctx["is_user_locked"] and isinstance(delta, str):
+                                order_prefetcher.on_delta(str(data.get("item_id") or ""), delta)
 
                         # Captura transcripción final de audio de usuario.
-                        if data.get("type") == "conversation.item.input_audio_transcription.completed":
+                        if data.get("type") == TRANSCRIPTION_COMPLETED_EVENT:
+                            order_prefetcher.finish_item(str(data.get("item_id") or ""))
                             transcript = data.get("transcript")
                             if isinstance(transcript, str) and transcript.strip():
                                 session_ctx["latest_user_text"] = transcript.strip()
                                 await resolve_user_context_if_needed()
                                 # Solo después de transcribir y resolver Firebase.
                                 await trigger_response_create()
+                            else:
+                                order_prefetcher.discard()
 
                         try:
-                            if websocket.client_state.name != "DISCONNECTED":
-                                await websocket.send_json(data)
+                            if binary_audio and data.get("type") == "response.audio.delta":
+                                await send_binary_audio_delta(data)
+                            elif websocket.client_state.name != "DISCONNECTED":
+                                # El evento no se modifica: reenviar el texto original.
+                                await websocket.send_text(message)
                         except RuntimeError:
-                            print("Cliente desconectado, no se puede enviar mensaje")
+                            logger.info("Cliente desconectado, no se puede enviar mensaje")
                             break
                     except json.JSONDecodeError:
                         try:
@@ -1440,11 +2562,11 @@ async def handle_realtime_connection(realtime_ws, websocket):
                         if websocket.client_state.name != "DISCONNECTED":
                             await websocket.send_bytes(message)
                     except RuntimeError:
-                        print("Cliente desconectado, no se puede enviar audio")
+                        logger.info("Cliente desconectado, no se puede enviar audio")
                         break
                     
         except websockets.exceptions.ConnectionClosed:
-            print("Conexión con GPT Realtime cerrada")
+            logger.info("Conexión con GPT Realtime cerrada")
             try:
                 if websocket.client_state.name != "DISCONNECTED":
                     await websocket.send_json({
@@ -1454,7 +2576,7 @@ async def handle_realtime_connection(realtime_ws, websocket):
             except:
                 pass
         except Exception as e:
-            print(f"Error en forward_to_client: {e}")
+            logger.error("Error en forward_to_client: %s", e)
             try:
                 if websocket.client_state.name != "DISCONNECTED":
                     await websocket.send_json({
@@ -1465,23 +2587,38 @@ async def handle_realtime_connection(realtime_ws, websocket):
                 pass
 
     try:
-        initial_response = await realtime_ws.recv()
-        if isinstance(initial_response, str):
-            response_data = json.loads(initial_response)
-            print(f"Respuesta inicial de GPT Realtime: {response_data.get('type', 'unknown')}")
-            if websocket.client_state.name != "DISCONNECTED":
-                await websocket.send_json(response_data)
+        if warmup_events is not None:
+            # Reenviar lo recibido al calentar la conexión (session.created/session.updated).
+            for warmup_event in warmup_events:
+                if websocket.client_state.name == "DISCONNECTED":
+                    break
+                if isinstance(warmup_event, str):
+                    await websocket.send_text(warmup_event)
+                else:
+                    await websocket.send_bytes(warmup_event)
+            logger.info("Sesión GPT Realtime pre-calentada", extra={"warmupEvents": len(warmup_events)})
+        else:
+            initial_response = await realtime_ws.recv()
+            if isinstance(initial_response, str):
+                response_data = json.loads(initial_response)
+                logger.info("Respuesta inicial de GPT Realtime", extra={"event": response_data.get("type", "unknown")})
+                if websocket.client_state.name != "DISCONNECTED":
+                    await websocket.send_text(initial_response)
     except Exception as e:
-        print(f"Error esperando respuesta inicial: {e}")
+        logger.error("Error esperando respuesta inicial: %s", e)
     
     try:
-        await asyncio.gather(
-            forward_to_realtime(),
-            forward_to_client(),
-            return_exceptions=True
-        )
+        # Cuando un lado termina (cliente desconectado o upstream cerrado) el otro sobra:
+        # si no, la sesión (y su hueco de admisión) seguía viva hasta que cerrara Azure.
+        relay_tasks = [asyncio.create_task(forward_to_realtime()), asyncio.create_task(forward_to_client())]
+        try:
+            await asyncio.wait(relay_tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in relay_tasks:
+                task.cancel()
+            await asyncio.gather(*relay_tasks, return_exceptions=True)
     except Exception as e:
-        print(f"Error en WebSocket: {e}")
+        logger.error("Error en WebSocket: %s", e)
         try:
             if websocket.client_state.name != "DISCONNECTED":
                 await websocket.send_json({
@@ -1495,6 +2632,23 @@ async def handle_realtime_connection(realtime_ws, websocket):
         except:
             pass
     finally:
+        await audio_coalescer.close()
+        order_prefetcher.close()
+        for task in list(progress_tasks):
+            task.cancel()
+        if session_tasks:
+            # No perder escrituras en curso en Firebase si el visitante se va justo después.
+            await asyncio.wait(set(session_tasks), timeout=FIREBASE_HTTP_WRITE_TIMEOUT_SECONDS)
+        logger.info(
+            "Fin de sesión de voz",
+            extra={
+                "audioChunks": audio_coalescer.chunks_received,
+                "audioAppends": audio_coalescer.frames_sent,
+                "instructionsSkipped": session_ctx["instructions_skipped"],
+                "prefetchHits": order_prefetcher.hits,
+                "prefetchWasted": order_prefetcher.wasted,
+            },
+        )
         # Limpieza explícita de contexto al terminar la sesión.
         session_ctx["latest_user_text"] = ""
         session_ctx["is_user_locked"] = False
@@ -0,0 +1,206 @@
+"""
+Métricas de latencia en formato de exposición de Prometheus (texto 0.0.4).
+
+Sin dependencias: histogramas con buckets fijos y una etiqueta opcional. Registrar
+una observación es una búsqueda binaria y unos incrementos bajo un lock (los
+helpers de imagen se ejecutan en hilos); el texto solo se genera cuando alguien
+consulta /metrics, y es entonces cuando los `Gauge` leen su valor actual.
+"""
+
+import asyncio
+import functools
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Callable, Iterator, Optional, Sequence
+
+# De 5 ms a 60 s: cubre desde lecturas cacheadas hasta la generación de imágenes.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Hitos de un turno de voz, medidos desde el final del habla del visitante.
+TURN_STAGE_TRANSCRIPTION = "transcription_completed"
+TURN_STAGE_USER_LOOKUP = "user_lookup_done"
+TURN_STAGE_RESPONSE_CREATE = "response_create_sent"
+TURN_STAGE_FIRST_AUDIO = "first_audio_delta"
+TURN_STAGE_RESPONSE_DONE = "response_done"
+
+_registry: list["Histogram | Gauge"] = []
+_enabled = True
+
+
+def set_enabled(enabled: bool) -> None:
+    """Con False, `observe` no hace nada (y /metrics no debería exponerse)."""
+    global _enabled
+    _enabled = enabled
+
+
+class Histogram:
+    """Histograma acumulativo con una etiqueta opcional (`label_name`)."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_name: Optional[str] = None,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.label_name = label_name
+        self._buckets = tuple(sorted(buckets))
+        # Por valor de etiqueta: [conteo por bucket (+ el de +Inf), suma].
+        self._series: dict[str, tuple[list[int], list[float]]] = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, label_value: str = "") -> None:
+        if not _enabled:
+            return
+        index = bisect_left(self._buckets, value)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = ([0] * (len(self._buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    @contextmanager
+    def time(self, label_value: str = "") -> Iterator[None]:
+        started = perf_counter()
+        cancelled = False
+        try:
+            yield
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            if not cancelled:
+                self.observe(perf_counter() - started, label_value)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {label: (list(counts), total[0]) for label, (counts, total) in self._series.items()}
+        for label_value in sorted(series):
+            counts, total = series[label_value]
+            label = f'{self.label_name}="{escape_label_value(label_value)}",' if self.label_name else ""
+            cumulative = 0
+            for bound, count in zip(self._buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label}le="{format_bound(bound)}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'{self.name}_bucket{{{label}le="+Inf"}} {cumulative}')
+            braces = "{" + label.rstrip(",") + "}" if label else ""
+            lines.append(f"{self.name}_sum{braces} {total}")
+            lines.append(f"{self.name}_count{braces} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """
+    Valor instantáneo leído con `read` al generar /metrics (p. ej. sesiones activas).
+    Con `metric_type="counter"` expone un total acumulado que solo crece.
+    """
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], float], metric_type: str = "gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.metric_type = metric_type
+        self._read = read
+        _registry.append(self)
+
+    def render(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+            f"{self.name} {self._read()}",
+        ]
+
+
+def timed(histogram: Histogram, label_value: Optional[str] = None) -> Callable:
+    """
+    Decorador: observa la duración de cada llamada (síncrona o async); etiqueta =
+    nombre de la función. Las llamadas canceladas no se observan.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        label = label_value or func.__name__
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = perf_counter()
+                cancelled = False
+                try:
+                    return await func(*args, **kwargs)
+                except asyncio.CancelledError:
+                    # Cancelada (p. ej. una lectura especulativa descartada): no es
+                    # una llamada completada y sesgaría el histograma.
+                    cancelled = True
+                    raise
+                finally:
+                    if not cancelled:
+                        histogram.observe(perf_counter() - started, label)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(perf_counter() - started, label)
+
+        return wrapper
+
+    return decorator
+
+
+class TurnLatencyTracker:
+    """
+    Cronometra un turno de voz: empieza con el final del habla
+    (`input_audio_buffer.speech_stopped`, o el texto del visitante) y registra cada
+    hito la primera vez que ocurre en el turno, en segundos desde ese inicio.
+    """
+
+    def __init__(self, histogram: Histogram):
+        self._histogram = histogram
+        self._started: Optional[float] = None
+        self._seen: set[str] = set()
+
+    def start_turn(self) -> None:
+        self._started = perf_counter()
+        self._seen.clear()
+
+    def mark(self, stage: str) -> None:
+        if self._started is None or stage in self._seen:
+            return
+        self._seen.add(stage)
+        self._histogram.observe(perf_counter() - self._started, stage)
+
+    def on_upstream_event(self, event_type: Optional[str]) -> None:
+        if event_type == "response.audio.delta":
+            self.mark(TURN_STAGE_FIRST_AUDIO)
+        elif event_type == "input_audio_buffer.speech_stopped":
+            self.start_turn()
+        elif event_type == "conversation.item.input_audio_transcription.completed":
+            self.mark(TURN_STAGE_TRANSCRIPTION)
+        elif event_type == "response.done":
+            self.mark(TURN_STAGE_RESPONSE_DONE)
+            self._started = None
+
+
+def render_metrics() -> str:
+    lines: list[str] = []
+    for histogram in _registry:
+        lines.extend(histogram.render())
+    return "\n".join(lines) + "\n"
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_bound(bound: float) -> str:
+    return repr(float(bound))
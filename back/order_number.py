@@ -0,0 +1,204 @@
+"""
+Detección del número de orden en las transcripciones del visitante.
+
+Se ejecuta con cada transcripción, así que todo lo que no depende del texto se
+prepara una sola vez: patrones compilados a nivel de módulo, las palabras clave
+de todos los idiomas en una única alternancia (una sola búsqueda en lugar de un
+`in` por palabra) y el diccionario palabra -> dígito. Cada fase se detiene en la
+primera coincidencia (`search`) en vez de construir listas con `findall`.
+
+Los idiomas se describen con `NumberLanguage`; añadir uno (p. ej. catalán) solo
+amplía la alternancia compilada, no añade pasadas por transcripción.
+"""
+
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+# Marcas diacríticas combinantes (bloque U+0300-U+036F, salvo U+034F que tiene clase 0):
+# cubren las tildes de ES/CA/EN.
+COMBINING_MARKS_PATTERN = re.compile("[\u0300-\u034e\u0350-\u036f]")
+
+# 1) Número continuo; 2) dígitos separados por espacios, comas, puntos o guiones.
+CONTIGUOUS_NUMBER_PATTERN = re.compile(r"\b\d{1,6}\b")
+SEPARATED_DIGITS_PATTERN = re.compile(r"(?:\d[\s,.\-]*){2,6}")
+NON_DIGIT_PATTERN = re.compile(r"\D")
+
+MAX_ORDER_DIGITS = 6
+
+
+def normalize_text(text: str) -> str:
+    """Normaliza texto para detectar números con más robustez."""
+    lowered = text.lower().strip()
+    if lowered.isascii():
+        # NFKD no cambia texto ASCII: la mayoría de transcripciones en inglés.
+        return lowered
+    normalized = COMBINING_MARKS_PATTERN.sub("", unicodedata.normalize("NFKD", lowered))
+    if normalized.isascii():
+        return normalized
+    return "".join(ch for ch in normalized if not unicodedata.combining(ch))
+
+
+@dataclass(frozen=True)
+class NumberLanguage:
+    """Palabras clave de intención y dígitos dichos con palabras de un idioma (ya normalizados)."""
+
+    code: str
+    intent_keywords: tuple[str, ...]
+    digit_words: dict[str, str] = field(default_factory=dict)
+
+
+SPANISH = NumberLanguage(
+    code="es",
+    intent_keywords=(
+        "numero",
+        "codigo",
+        "orden",
+        "id",
+        "identificador",
+        "soy",
+        "mi numero",
+        "mi codigo",
+    ),
+    digit_words={
+        "cero": "0",
+        "uno": "1",
+        "una": "1",
+        "dos": "2",
+        "tres": "3",
+        "cuatro": "4",
+        "cinco": "5",
+        "seis": "6",
+        "siete": "7",
+        "ocho": "8",
+        "nueve": "9",
+    },
+)
+
+ENGLISH = NumberLanguage(
+    code="en",
+    intent_keywords=(
+        "number",
+        "code",
+        "order",
+        "identifier",
+        "my number",
+        "my code",
+        "i am",
+        "i'm",
+        "im ",
+    ),
+    digit_words={
+        "zero": "0",
+        "oh": "0",
+        "one": "1",
+        "two": "2",
+        "three": "3",
+        "four": "4",
+        "five": "5",
+        "six": "6",
+        "seven": "7",
+        "eight": "8",
+        "nine": "9",
+    },
+)
+
+# No está activo por defecto: "set", "nou" o "u" son palabras frecuentes en inglés/castellano.
+CATALAN = NumberLanguage(
+    code="ca",
+    intent_keywords=(
+        "numero",
+        "codi",
+        "ordre",
+        "identificador",
+        "soc",
+        "el meu numero",
+        "el meu codi",
+    ),
+    digit_words={
+        "zero": "0",
+        "u": "1",
+        "un": "1",
+        "una": "1",
+        "dos": "2",
+        "tres": "3",
+        "quatre": "4",
+        "cinc": "5",
+        "sis": "6",
+        "set": "7",
+        "vuit": "8",
+        "nou": "9",
+    },
+)
+
+LANGUAGES_BY_CODE = {language.code: language for language in (SPANISH, ENGLISH, CATALAN)}
+
+
+def languages_for_codes(codes: Iterable[str]) -> list[NumberLanguage]:
+    """Idiomas a partir de códigos (`es,en,ca`); ValueError si alguno no existe."""
+    languages = []
+    for code in codes:
+        normalized = code.strip().lower()
+        if not normalized:
+            continue
+        if normalized not in LANGUAGES_BY_CODE:
+            raise ValueError(f"Idioma de número de orden desconocido: {code}")
+        languages.append(LANGUAGES_BY_CODE[normalized])
+    return languages
+
+
+class OrderNumberExtractor:
+    """
+    Extrae números de orden de frases como "soy el número 42", "mi código es cuatro dos",
+    "my number is 42" o "my code is four two". Solo busca número si aparece alguna
+    palabra clave de intención, para evitar falsos positivos.
+    """
+
+    def __init__(self, languages: Iterable[NumberLanguage] = (SPANISH, ENGLISH)):
+        keywords: set[str] = set()
+        word_to_digit: dict[str, str] = {}
+        for language in languages:
+            keywords.update(language.intent_keywords)
+            for word, digit in language.digit_words.items():
+                if word_to_digit.setdefault(word, digit) != digit:
+                    raise ValueError(f"'{word}' tiene dígitos distintos según el idioma")
+        if not keywords:
+            raise ValueError("Se necesita al menos un idioma")
+
+        # Una palabra clave que contiene a otra no cambia el resultado ("mi numero" ⊃ "numero").
+        minimal_keywords = sorted(
+            keyword
+            for keyword in keywords
+            if not any(other != keyword and other in keyword for other in keywords)
+        )
+        self._keyword_pattern = re.compile("|".join(re.escape(keyword) for keyword in minimal_keywords))
+        self._word_to_digit = word_to_digit
+        words = "|".join(sorted(word_to_digit, key=len, reverse=True))
+        self._word_pattern = re.compile(rf"\b(?:{words})\b")
+        self._sequence_pattern = re.compile(rf"\b(?:{words})\b(?:[\s,.\-]+\b(?:{words})\b)*")
+
+    def extract(self, text: str) -> Optional[str]:
+        if not text:
+            return None
+
+        normalized = normalize_text(text)
+        if self._keyword_pattern.search(normalized) is None:
+            return None
+
+        match = CONTIGUOUS_NUMBER_PATTERN.search(normalized)
+        if match is not None:
+            return match.group()
+
+        # Cualquier coincidencia tiene entre 2 y 6 dígitos: vale la primera.
+        match = SEPARATED_DIGITS_PATTERN.search(normalized)
+        if match is not None:
+            return NON_DIGIT_PATTERN.sub("", match.group())
+
+        # 3) Número expresado en palabras: la primera secuencia de hasta 6 dígitos.
+        for match in self._sequence_pattern.finditer(normalized):
+            words = self._word_pattern.findall(match.group())
+            if 1 <= len(words) <= MAX_ORDER_DIGITS:
+                return "".join(self._word_to_digit[word] for word in words)
+
+        return None
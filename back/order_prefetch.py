@@ -0,0 +1,83 @@
+"""
+Búsqueda especulativa del visitante mientras se transcribe su frase.
+
+La transcripción llega por trozos (`conversation.item.input_audio_transcription.delta`)
+antes del evento final. En cuanto el texto parcial contiene un número de orden
+probable se lanza ya la lectura de `users/{order}`; cuando llega la transcripción
+final se confirma (se reutiliza esa lectura, casi siempre terminada) o se descarta.
+Así el viaje a Firebase se solapa con el final de la transcripción.
+"""
+
+import asyncio
+import logging
+from time import monotonic
+from typing import Any, Awaitable, Callable, Optional
+
+from order_number import OrderNumberExtractor
+
+logger = logging.getLogger("fulgencio.order_prefetch")
+
+ProfileFetcher = Callable[[str], Awaitable[Optional[dict[str, Any]]]]
+
+
+class OrderNumberPrefetcher:
+    """
+    Estado por sesión de voz. `on_delta` acumula el texto parcial de cada item y
+    lanza como mucho `max_per_turn` lecturas especulativas por turno; `commit`
+    devuelve el perfil del número confirmado y cancela el resto.
+    """
+
+    def __init__(self, extractor: OrderNumberExtractor, fetch: ProfileFetcher, max_per_turn: int = 3):
+        self._extractor = extractor
+        self._fetch = fetch
+        self._max_per_turn = max(0, max_per_turn)
+        self._partials: dict[str, str] = {}
+        self._lookups: dict[str, tuple[asyncio.Task, float]] = {}
+        self.hits = 0
+        self.wasted = 0
+
+    def on_delta(self, item_id: str, delta: str) -> Optional[str]:
+        """Añade un trozo de transcripción; devuelve el número si se lanzó su lectura."""
+        text = self._partials.get(item_id, "") + delta
+        self._partials[item_id] = text
+        if len(self._lookups) >= self._max_per_turn:
+            return None
+        order_number = self._extractor.extract(text)
+        if not order_number or order_number in self._lookups:
+            return None
+        self._lookups[order_number] = (asyncio.create_task(self._fetch(order_number)), monotonic())
+        return order_number
+
+    def finish_item(self, item_id: str) -> None:
+        """La transcripción final del item ya llegó: su texto parcial sobra."""
+        self._partials.pop(item_id, None)
+
+    async def commit(self, order_number: str) -> Optional[dict[str, Any]]:
+        """Perfil de `order_number`, reutilizando la lectura especulativa si existe."""
+        lookup = self._lookups.pop(order_number, None)
+        self.discard()
+        if lookup is None:
+            return await self._fetch(order_number)
+
+        task, started = lookup
+        self.hits += 1
+        logger.info(
+            "Perfil pedido desde la transcripción parcial",
+            extra={
+                "order": order_number,
+                "prefetchLeadMs": round((monotonic() - started) * 1000),
+                "prefetchReady": task.done(),
+            },
+        )
+        return await task
+
+    def discard(self) -> None:
+        """Cancela las lecturas especulativas no confirmadas del turno."""
+        for task, _ in self._lookups.values():
+            task.cancel()
+        self.wasted += len(self._lookups)
+        self._lookups.clear()
+
+    def close(self) -> None:
+        self.discard()
+        self._partials.clear()
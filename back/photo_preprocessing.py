@@ -0,0 +1,159 @@
+"""
+Preprocesado de la foto antes de enviarla a Azure images/edits.
+
+Pasos (cada uno cronometrado): detección del formato real, decodificación con
+la orientación EXIF aplicada, recorte opcional a la cara, reducción a la
+resolución que usa el modelo y re-codificación JPEG sin metadatos (EXIF/GPS).
+El recorte de cara necesita OpenCV (`opencv-python-headless`), que es opcional:
+si no está instalado ese paso se omite.
+"""
+
+import io
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Optional
+
+from PIL import Image, ImageOps
+
+from blob_store import sniff_image_content_type
+
+try:
+    import cv2
+    import numpy
+except ImportError:  # pragma: no cover - dependencia opcional
+    cv2 = None
+    numpy = None
+
+# Margen alrededor de la cara detectada: la caricatura necesita cabeza, pelo y hombros.
+FACE_CROP_MARGIN = 1.8
+
+EXTENSIONS_BY_CONTENT_TYPE = {
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/webp": "webp",
+    "image/gif": "gif",
+}
+
+
+@dataclass
+class PreprocessedPhoto:
+    data: bytes
+    content_type: str
+    width: int
+    height: int
+    original_size: int
+    original_content_type: str
+    face_cropped: bool = False
+    timings_ms: dict[str, float] = field(default_factory=dict)
+
+    @property
+    def filename(self) -> str:
+        return f"image_to_edit.{EXTENSIONS_BY_CONTENT_TYPE.get(self.content_type, 'bin')}"
+
+
+def preprocess_photo(
+    image_bytes: bytes,
+    max_side: int = 1024,
+    jpeg_quality: int = 85,
+    face_crop: bool = False,
+) -> PreprocessedPhoto:
+    """
+    Devuelve la foto lista para subir. Lanza ValueError si los bytes no son una imagen.
+    Si no hace falta reducir ni recortar y la original ya es más pequeña y no lleva
+    metadatos, se envía la original tal cual.
+    """
+    timings: dict[str, float] = {}
+    started = perf_counter()
+
+    def lap(step: str) -> None:
+        nonlocal started
+        now = perf_counter()
+        timings[step] = round((now - started) * 1000, 2)
+        started = now
+
+    original_content_type = sniff_image_content_type(image_bytes[:16])
+    lap("sniff")
+
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as opened:
+            has_metadata = bool(opened.info.get("exif") or opened.getexif())
+            if opened.format == "JPEG":
+                # Decodificación JPEG a escala reducida (DCT) cuando la foto es mucho mayor
+                # que max_side: evita decodificar y luego reducir millones de píxeles.
+                opened.draft("RGB", (max_side, max_side))
+            image = ImageOps.exif_transpose(opened)
+            image.load()
+    except Exception as err:
+        raise ValueError(f"La foto no es una imagen válida: {err}") from err
+    lap("decode")
+
+    face_cropped = False
+    if face_crop:
+        cropped = crop_to_face(image)
+        if cropped is not None:
+            image = cropped
+            face_cropped = True
+        lap("face_crop")
+
+    resized = max(image.size) > max_side
+    if resized:
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    lap("resize")
+
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    output = io.BytesIO()
+    # Sin exif=...: Pillow no copia metadatos al guardar.
+    image.save(output, format="JPEG", quality=jpeg_quality, optimize=True)
+    encoded = output.getvalue()
+    lap("encode")
+
+    if (
+        not resized
+        and not face_cropped
+        and not has_metadata
+        and original_content_type in EXTENSIONS_BY_CONTENT_TYPE
+        and len(image_bytes) <= len(encoded)
+    ):
+        return PreprocessedPhoto(
+            data=image_bytes,
+            content_type=original_content_type,
+            width=image.width,
+            height=image.height,
+            original_size=len(image_bytes),
+            original_content_type=original_content_type,
+            timings_ms=timings,
+        )
+
+    return PreprocessedPhoto(
+        data=encoded,
+        content_type="image/jpeg",
+        width=image.width,
+        height=image.height,
+        original_size=len(image_bytes),
+        original_content_type=original_content_type,
+        face_cropped=face_cropped,
+        timings_ms=timings,
+    )
+
+
+def crop_to_face(image: Image.Image) -> Optional[Image.Image]:
+    """
+    Recorta un cuadrado centrado en la cara más grande (detector Haar de OpenCV).
+    Devuelve None si OpenCV no está disponible o no se detecta ninguna cara.
+    """
+    if cv2 is None:
+        return None
+
+    gray = numpy.asarray(image.convert("L"))
+    detector = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+    faces = detector.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(64, 64))
+    if len(faces) == 0:
+        return None
+
+    x, y, w, h = max(faces, key=lambda face: face[2] * face[3])
+    side = min(int(max(w, h) * FACE_CROP_MARGIN), image.width, image.height)
+    center_x, center_y = x + w // 2, y + h // 2
+    left = min(max(0, center_x - side // 2), image.width - side)
+    top = min(max(0, center_y - side // 2), image.height - side)
+    return image.crop((left, top, left + side, top + side))
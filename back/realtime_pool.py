@@ -0,0 +1,237 @@
+"""
+Pool de conexiones pre-calentadas con GPT Realtime (Azure OpenAI).
+
+Cada conexión del pool ya tiene aplicado el `session.update` inicial (prompt de
+bienvenida, VAD, formatos de audio), de modo que un visitante nuevo no paga el
+handshake WebSocket + TLS + configuración de sesión antes del primer audio.
+Las conexiones son de un solo uso: al terminar la conversación se cierran y el
+pool repone otra en segundo plano.
+"""
+
+import asyncio
+import json
+from collections import deque
+from dataclasses import dataclass, field
+from time import monotonic
+from typing import Any, Callable, Optional
+
+import websockets
+from websockets.protocol import State
+
+
+class RealtimeSessionInitError(RuntimeError):
+    """El servidor rechazó el `session.update` inicial (evento `error`)."""
+
+
+@dataclass
+class RealtimeLease:
+    """Conexión realtime entregada a una sesión /ws, con los eventos recibidos al calentarla."""
+
+    connection: Any
+    url: str
+    created_at: float
+    warmup_events: list[Any] = field(default_factory=list)
+
+    @property
+    def age_seconds(self) -> float:
+        return monotonic() - self.created_at
+
+    @property
+    def is_open(self) -> bool:
+        return self.connection.state is State.OPEN
+
+    async def close(self) -> None:
+        try:
+            await self.connection.close()
+        except Exception:
+            pass
+
+
+class RealtimeConnectionPool:
+    """
+    Mantiene `size` conexiones realtime ya inicializadas.
+    - Recicla las que superan `max_age_seconds` (la sesión upstream tiene vida limitada).
+    - Comprueba con ping las conexiones ociosas cada `ping_interval_seconds`.
+    - Recuerda qué forma de URL (deployment=/model=) funcionó y la prueba primero.
+    Con size=0 no mantiene conexiones ociosas, pero `acquire` sigue abriendo e
+    inicializando la conexión con la misma lógica.
+    """
+
+    def __init__(
+        self,
+        url_candidates: list[str],
+        headers: dict[str, str],
+        session_init_factory: Callable[[], dict[str, Any]],
+        size: int = 2,
+        max_age_seconds: float = 600,
+        ping_interval_seconds: float = 30,
+        connect_timeout_seconds: float = 10,
+    ):
+        self._url_candidates = [url for url in url_candidates if url]
+        self._headers = headers
+        self._session_init_factory = session_init_factory
+        self._size = max(0, size)
+        self._max_age_seconds = max_age_seconds
+        self._ping_interval_seconds = max(1.0, ping_interval_seconds)
+        self._connect_timeout_seconds = connect_timeout_seconds
+        self._idle: deque[RealtimeLease] = deque()
+        self._working_url: Optional[str] = None
+        self._maintainer: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.hits = 0
+        self.misses = 0
+        self.recycled = 0
+        self.failed_connects = 0
+
+    async def start(self) -> None:
+        """Arranca la tarea de mantenimiento que rellena y vigila el pool."""
+        if self._maintainer is not None or self._size <= 0 or not self._url_candidates:
+            return
+        self._wakeup = asyncio.Event()
+        self._maintainer = asyncio.create_task(self._maintain())
+        print(f"✅ Pool realtime iniciado (tamaño {self._size})")
+
+    async def stop(self) -> None:
+        """Detiene el mantenimiento y cierra las conexiones ociosas."""
+        if self._maintainer is not None:
+            self._maintainer.cancel()
+            try:
+                await self._maintainer
+            except asyncio.CancelledError:
+                pass
+            self._maintainer = None
+        while self._idle:
+            await self._idle.popleft().close()
+
+    async def acquire(self) -> RealtimeLease:
+        """
+        Devuelve una conexión lista para usar. Si no hay ninguna caliente,
+        abre una nueva en el momento (mismo coste que antes del pool).
+        """
+        while self._idle:
+            lease = self._idle.popleft()
+            if not lease.is_open or lease.age_seconds > self._max_age_seconds:
+                self.recycled += 1
+                await lease.close()
+                continue
+            self.hits += 1
+            self._wake_maintainer()
+            return lease
+
+        self.misses += 1
+        self._wake_maintainer()
+        # Conexión bajo demanda: si el session.update falla, el error llega al cliente.
+        return await self.open_connection(forward_init_error=True)
+
+    async def open_connection(self, forward_init_error: bool = False) -> RealtimeLease:
+        """
+        Abre e inicializa una conexión probando primero la URL que ya funcionó.
+        Un `error` en respuesta al session.update cuenta como fallo de conexión
+        (se cierra y se prueba la siguiente URL), salvo con `forward_init_error`,
+        que la entrega con el error entre sus `warmup_events`.
+        """
+        candidates = list(self._url_candidates)
+        if self._working_url in candidates:
+            candidates.remove(self._working_url)
+            candidates.insert(0, self._working_url)
+
+        last_error: Optional[Exception] = None
+        for url in candidates:
+            try:
+                lease = await asyncio.wait_for(
+                    self._connect_and_initialize(url, forward_init_error),
+                    timeout=self._connect_timeout_seconds,
+                )
+            except Exception as err:
+                last_error = err
+                self.failed_connects += 1
+                print(f"⚠️ No se pudo abrir conexión realtime ({url}): {err}")
+                continue
+            if self._working_url != url:
+                print(f"✅ URL realtime operativa: {url}")
+            self._working_url = url
+            return lease
+
+        raise RuntimeError(f"No se pudo conectar con GPT Realtime: {last_error}")
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "size": self._size,
+            "idle": len(self._idle),
+            "hits": self.hits,
+            "misses": self.misses,
+            "recycled": self.recycled,
+            "failed_connects": self.failed_connects,
+            "working_url_cached": self._working_url is not None,
+        }
+
+    async def _connect_and_initialize(self, url: str, forward_init_error: bool = False) -> RealtimeLease:
+        connection = await websockets.connect(url, additional_headers=self._headers)
+        created_at = monotonic()
+        warmup_events: list[Any] = []
+        try:
+            # El servidor abre con session.created; después aplicamos la configuración
+            # y esperamos su confirmación. Una conexión ociosa o de resúmenes con la
+            # configuración rechazada no sirve: el error la descarta.
+            warmup_events.append(await connection.recv())
+            await connection.send(json.dumps(self._session_init_factory()))
+            while True:
+                raw = await connection.recv()
+                warmup_events.append(raw)
+                if not isinstance(raw, str):
+                    continue
+                event = json.loads(raw)
+                event_type = event.get("type")
+                if event_type == "session.updated":
+                    break
+                if event_type == "error":
+                    if forward_init_error:
+                        break
+                    error = event.get("error") or {}
+                    raise RealtimeSessionInitError(
+                        f"session.update rechazado: {error.get('message') or error.get('code') or raw}"
+                    )
+        except BaseException:
+            try:
+                await connection.close()
+            except Exception:
+                pass
+            raise
+        return RealtimeLease(connection, url, created_at, warmup_events)
+
+    async def _maintain(self) -> None:
+        while True:
+            try:
+                await self._prune_idle()
+                while len(self._idle) < self._size:
+                    self._idle.append(await self.open_connection())
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                print(f"⚠️ Error rellenando pool realtime: {err}")
+
+            # Esperar a que alguien consuma una conexión o a la siguiente ronda de pings.
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._ping_interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _prune_idle(self) -> None:
+        for lease in list(self._idle):
+            healthy = lease.is_open and lease.age_seconds <= self._max_age_seconds
+            if healthy:
+                try:
+                    pong_waiter = await lease.connection.ping()
+                    await asyncio.wait_for(pong_waiter, timeout=self._connect_timeout_seconds)
+                except Exception:
+                    healthy = False
+            # Puede haberse entregado a una sesión mientras esperábamos el pong.
+            if not healthy and lease in self._idle:
+                self._idle.remove(lease)
+                self.recycled += 1
+                await lease.close()
+
+    def _wake_maintainer(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
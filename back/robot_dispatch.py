@@ -0,0 +1,237 @@
+"""
+Envío de órdenes a los robots físicos (regalo y caricatura) por HTTP.
+
+Cada robot atiende un trabajo cada vez, así que tiene su propia cola FIFO con un
+único worker: una orden no se envía hasta que la anterior se entregó o se dio por
+perdida. Los envíos usan un `httpx.AsyncClient` persistente (keep-alive), se
+reintentan con backoff exponencial y llevan una clave de idempotencia por número de
+orden: cada visitante recibe una sola orden (regalo o dibujo), aunque se repita el
+lock-in o cambie entre tanto el robot que le corresponde.
+"""
+
+import asyncio
+import datetime
+from dataclasses import dataclass, field
+from time import monotonic
+from typing import Any, Optional
+
+import httpx
+
+DELIVERY_QUEUED = "queued"
+DELIVERY_SENDING = "sending"
+DELIVERY_RETRYING = "retrying"
+DELIVERY_DELIVERED = "delivered"
+DELIVERY_FAILED = "failed"
+
+
+class RobotNotConfiguredError(KeyError):
+    """El robot no tiene URL configurada."""
+
+
+class RobotQueueFullError(RuntimeError):
+    """La cola del robot ha alcanzado su capacidad máxima."""
+
+
+def utc_now_iso() -> str:
+    return datetime.datetime.utcnow().isoformat() + "Z"
+
+
+@dataclass
+class RobotDelivery:
+    id: str
+    robot: str
+    order_number: str
+    payload: dict[str, Any] = field(repr=False)
+    status: str = DELIVERY_QUEUED
+    attempts: int = 0
+    error: Optional[str] = None
+    created_at: str = field(default_factory=utc_now_iso)
+    updated_at: str = field(default_factory=utc_now_iso)
+    finished_monotonic: Optional[float] = None
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "deliveryId": self.id,
+            "robot": self.robot,
+            "orderNumber": self.order_number,
+            "status": self.status,
+            "attempts": self.attempts,
+            "error": self.error,
+            "createdAt": self.created_at,
+            "updatedAt": self.updated_at,
+        }
+
+    def _set_status(self, status: str, error: Optional[str] = None) -> None:
+        self.status = status
+        self.error = error
+        self.updated_at = utc_now_iso()
+
+
+class RobotDispatcher:
+    """
+    `robot_urls` asocia nombre de robot -> URL; los robots sin URL http(s) se ignoran.
+    Una respuesta 4xx (salvo 408/409/429) es definitiva; el resto de fallos se
+    reintentan hasta `max_attempts` con espera `retry_base_seconds * 2^n` (tope
+    `retry_max_seconds`) sin dejar pasar a las órdenes que esperan detrás.
+    """
+
+    def __init__(
+        self,
+        robot_urls: dict[str, str],
+        timeout_seconds: float = 10,
+        max_attempts: int = 5,
+        retry_base_seconds: float = 1,
+        retry_max_seconds: float = 30,
+        max_queue_size: int = 100,
+        retention_seconds: float = 86400,
+    ):
+        self._robot_urls = {
+            robot: url.strip()
+            for robot, url in robot_urls.items()
+            if url and url.strip().startswith(("http://", "https://"))
+        }
+        self._timeout_seconds = timeout_seconds
+        self._max_attempts = max(1, max_attempts)
+        self._retry_base_seconds = retry_base_seconds
+        self._retry_max_seconds = retry_max_seconds
+        self._max_queue_size = max(1, max_queue_size)
+        self._retention_seconds = retention_seconds
+        self._deliveries: dict[str, RobotDelivery] = {}
+        self._queues: dict[str, asyncio.Queue] = {}
+        self._workers: list[asyncio.Task] = []
+        self._http: Optional[httpx.AsyncClient] = None
+
+    def configured(self, robot: str) -> bool:
+        return robot in self._robot_urls
+
+    async def start(self) -> None:
+        if self._workers or not self._robot_urls:
+            return
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=len(self._robot_urls) * 2,
+                max_keepalive_connections=len(self._robot_urls) * 2,
+                keepalive_expiry=60,
+            ),
+            timeout=self._timeout_seconds,
+        )
+        for robot in self._robot_urls:
+            self._queues[robot] = asyncio.Queue(maxsize=self._max_queue_size)
+            self._workers.append(asyncio.create_task(self._worker(robot)))
+
+    async def stop(self) -> None:
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def dispatch(self, robot: str, order_number: str, payload: dict[str, Any]) -> RobotDelivery:
+        """
+        Encola la orden y la devuelve sin esperar al robot. Si el visitante ya tiene
+        una entrega activa o completada (de cualquier robot), devuelve esa.
+        """
+        if robot not in self._queues:
+            raise RobotNotConfiguredError(robot)
+        self._prune_finished()
+
+        delivery_id = build_delivery_id(order_number)
+        existing = self._deliveries.get(delivery_id)
+        if existing is not None and existing.status != DELIVERY_FAILED:
+            return existing
+
+        delivery = RobotDelivery(id=delivery_id, robot=robot, order_number=order_number, payload=payload)
+        try:
+            self._queues[robot].put_nowait(delivery)
+        except asyncio.QueueFull as err:
+            raise RobotQueueFullError(f"Cola del robot {robot} llena") from err
+        self._deliveries[delivery_id] = delivery
+        return delivery
+
+    def get(self, order_number: str) -> Optional[RobotDelivery]:
+        return self._deliveries.get(build_delivery_id(order_number))
+
+    def find_by_order(self, order_number: str) -> list[RobotDelivery]:
+        return [
+            delivery for delivery in self._deliveries.values() if delivery.order_number == order_number
+        ]
+
+    def stats(self) -> dict[str, Any]:
+        counts: dict[str, int] = {}
+        for delivery in self._deliveries.values():
+            counts[delivery.status] = counts.get(delivery.status, 0) + 1
+        return {
+            "robots": sorted(self._robot_urls),
+            "queued": {robot: queue.qsize() for robot, queue in self._queues.items()},
+            "deliveries": counts,
+        }
+
+    async def _worker(self, robot: str) -> None:
+        queue = self._queues[robot]
+        while True:
+            delivery = await queue.get()
+            try:
+                await self._deliver(robot, delivery)
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                self._finish(delivery, DELIVERY_FAILED, f"Error inesperado: {err!r}")
+            finally:
+                queue.task_done()
+
+    async def _deliver(self, robot: str, delivery: RobotDelivery) -> None:
+        url = self._robot_urls[robot]
+        while True:
+            delivery.attempts += 1
+            delivery._set_status(DELIVERY_SENDING)
+            retryable = True
+            try:
+                response = await self._http.post(
+                    url,
+                    json=delivery.payload,
+                    headers={"Idempotency-Key": delivery.id},
+                )
+                if 200 <= response.status_code < 300:
+                    print(f"✅ Robot {robot} recibió la orden de {delivery.order_number}")
+                    self._finish(delivery, DELIVERY_DELIVERED)
+                    return
+                error = f"HTTP {response.status_code} {response.text[:200]}"
+                retryable = response.status_code in (408, 409, 429) or response.status_code >= 500
+            except httpx.HTTPError as err:
+                error = f"{err!r}"
+
+            if not retryable or delivery.attempts >= self._max_attempts:
+                print(f"❌ Robot {robot} no recibió la orden de {delivery.order_number}: {error}")
+                self._finish(delivery, DELIVERY_FAILED, error)
+                return
+
+            delay = min(self._retry_max_seconds, self._retry_base_seconds * (2 ** (delivery.attempts - 1)))
+            print(
+                f"⚠️ Robot {robot} falló para {delivery.order_number} "
+                f"(intento {delivery.attempts}), reintento en {delay:.1f}s: {error}"
+            )
+            delivery._set_status(DELIVERY_RETRYING, error)
+            await asyncio.sleep(delay)
+
+    def _finish(self, delivery: RobotDelivery, status: str, error: Optional[str] = None) -> None:
+        delivery._set_status(status, error)
+        delivery.payload = {}  # La imagen de la caricatura no se retiene tras el envío.
+        delivery.finished_monotonic = monotonic()
+
+    def _prune_finished(self) -> None:
+        now = monotonic()
+        expired = [
+            delivery_id
+            for delivery_id, delivery in self._deliveries.items()
+            if delivery.finished_monotonic is not None
+            and now - delivery.finished_monotonic > self._retention_seconds
+        ]
+        for delivery_id in expired:
+            del self._deliveries[delivery_id]
+
+
+def build_delivery_id(order_number: str) -> str:
+    """Clave de idempotencia: una entrega por número de orden, sea del robot que sea."""
+    return f"order-{order_number}"
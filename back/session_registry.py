@@ -0,0 +1,223 @@
+"""
+Registro de sesiones de voz (/ws) con control de admisión.
+
+Cada visitante conectado abre una sesión GPT Realtime upstream, así que el número
+de sesiones simultáneas por contenedor se limita (`max_sessions`). Cuando no hay
+hueco, la sesión espera en una cola FIFO acotada (`max_waiting`, hasta
+`wait_timeout_seconds`) y recibe el hueco de la que termine; si la cola está llena
+(o es de tamaño 0) se rechaza al momento. Los contadores de `stats()` sirven como
+señal de autoescalado (sesiones activas, en espera y rechazadas).
+"""
+
+import asyncio
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from time import monotonic
+from typing import Any, Awaitable, Callable, Optional
+
+SESSION_WAITING = "waiting"
+SESSION_ACTIVE = "active"
+SESSION_CLOSED = "closed"
+
+
+class SessionLimitError(RuntimeError):
+    """No hay hueco para otra sesión de voz (cola llena o espera agotada)."""
+
+    def __init__(self, message: str, reason: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+@dataclass
+class VoiceSession:
+    id: str
+    client: str = ""
+    binary_audio: bool = False
+    state: str = SESSION_WAITING
+    order_number: Optional[str] = None
+    created_at: float = field(default_factory=monotonic)
+    admitted_at: Optional[float] = None
+    # Uso de recursos: se incrementa desde el relay (enteros, sin locks: un solo bucle).
+    audio_bytes_in: int = 0
+    audio_deltas_out: int = 0
+    responses: int = 0
+
+    @property
+    def wait_seconds(self) -> float:
+        end = self.admitted_at if self.admitted_at is not None else monotonic()
+        return end - self.created_at
+
+    def snapshot(self) -> dict[str, Any]:
+        now = monotonic()
+        return {
+            # Sin IP del cliente ni número de orden: /sessions no lleva autenticación.
+            "id": self.id,
+            "state": self.state,
+            "binaryAudio": self.binary_audio,
+            "waitSeconds": round(self.wait_seconds, 3),
+            "activeSeconds": round(now - self.admitted_at, 1) if self.admitted_at is not None else 0,
+            "audioBytesIn": self.audio_bytes_in,
+            "audioDeltasOut": self.audio_deltas_out,
+            "responses": self.responses,
+        }
+
+
+class SessionRegistry:
+    """
+    Sesiones vivas por id. `admit` deja la sesión activa (esperando turno si hace
+    falta) o lanza SessionLimitError; `release` la quita y cede el hueco a la
+    primera en espera. `max_sessions` = 0 desactiva el límite.
+    """
+
+    def __init__(self, max_sessions: int = 0, max_waiting: int = 0, wait_timeout_seconds: float = 30):
+        self.max_sessions = max(0, max_sessions)
+        self.max_waiting = max(0, max_waiting)
+        self.wait_timeout_seconds = wait_timeout_seconds
+        self.sessions: dict[str, VoiceSession] = {}
+        self._waiters: deque[tuple[VoiceSession, asyncio.Future]] = deque()
+        self._active = 0
+        self.peak_active = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def has_capacity(self) -> bool:
+        return not self.max_sessions or self._active < self.max_sessions
+
+    def queue_position(self, session: VoiceSession) -> int:
+        """Posición (1 = la siguiente) de una sesión en espera, o 0 si no espera."""
+        for position, (waiting_session, _) in enumerate(self._waiters, start=1):
+            if waiting_session is session:
+                return position
+        return 0
+
+    def register(self, client: str = "", binary_audio: bool = False) -> VoiceSession:
+        """Crea la sesión (en espera) sin pedir hueco todavía."""
+        session = VoiceSession(id=uuid.uuid4().hex[:12], client=client, binary_audio=binary_audio)
+        self.sessions[session.id] = session
+        return session
+
+    def try_admit(self, session: VoiceSession) -> bool:
+        """Activa la sesión si hay hueco y nadie espera delante (sin bloquear)."""
+        if self._waiters or not self.has_capacity():
+            return False
+        self._activate(session)
+        return True
+
+    async def admit(self, session: VoiceSession) -> None:
+        """Espera en la cola hasta que haya hueco; SessionLimitError si no cabe o se agota la espera."""
+        if self.try_admit(session):
+            return
+        if len(self._waiters) >= self.max_waiting:
+            self.rejected += 1
+            self.sessions.pop(session.id, None)
+            raise SessionLimitError(
+                f"Límite de {self.max_sessions} sesiones de voz alcanzado", reason="full"
+            )
+
+        waiter: asyncio.Future = asyncio.get_running_loop().create_future()
+        entry = (session, waiter)
+        self._waiters.append(entry)
+        self.queued += 1
+        try:
+            # asyncio.wait (no wait_for): nunca se traga una cancelación que llegue
+            # justo cuando se concede el hueco, así que este hueco no queda sin dueño.
+            await asyncio.wait({waiter}, timeout=self.wait_timeout_seconds)
+        except BaseException:
+            # Cancelada mientras esperaba: fuera de la cola; si ya tenía hueco, se devuelve.
+            if waiter.done():
+                self.release(session)
+            else:
+                self._waiters.remove(entry)
+                waiter.cancel()
+                self.sessions.pop(session.id, None)
+            raise
+        if not waiter.done():
+            self._waiters.remove(entry)
+            waiter.cancel()
+            self.timed_out += 1
+            self.sessions.pop(session.id, None)
+            raise SessionLimitError(
+                f"Sin hueco tras {self.wait_timeout_seconds:g} s en cola", reason="timeout"
+            )
+
+    async def wait_for_slot(
+        self,
+        session: VoiceSession,
+        on_queued: Callable[[int], Awaitable[None]],
+        disconnected: Callable[[], Awaitable[None]],
+    ) -> bool:
+        """
+        `admit` para una conexión viva: avisa de la posición en cola con `on_queued` y
+        abandona la cola si `disconnected` termina antes (devuelve False). Pase lo que
+        pase (incluido un fallo al avisar), la espera no queda huérfana: se cancela y,
+        si ya tenía hueco, lo devuelve. SessionLimitError si se rechaza o se agota.
+        """
+        admission = asyncio.create_task(self.admit(session))
+        disconnect: Optional[asyncio.Task] = None
+        try:
+            await asyncio.sleep(0)  # Ya en la cola (o rechazada): la posición es válida.
+            position = self.queue_position(session)
+            if position:
+                await on_queued(position)
+            disconnect = asyncio.create_task(disconnected())
+            await asyncio.wait({admission, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            pending = [admission]
+            if disconnect is not None:
+                disconnect.cancel()
+                pending.append(disconnect)
+            if not admission.done():
+                admission.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        if admission.cancelled():
+            return False
+        admission.result()
+        return True
+
+    def release(self, session: VoiceSession) -> None:
+        """Quita la sesión; si estaba activa, el hueco pasa a la primera en espera."""
+        if self.sessions.pop(session.id, None) is None or session.state != SESSION_ACTIVE:
+            return
+        session.state = SESSION_CLOSED
+        self._active -= 1
+        while self._waiters and self.has_capacity():
+            waiting_session, waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self._activate(waiting_session)
+            waiter.set_result(None)
+
+    def _activate(self, session: VoiceSession) -> None:
+        session.state = SESSION_ACTIVE
+        session.admitted_at = monotonic()
+        self._active += 1
+        self.admitted += 1
+        self.peak_active = max(self.peak_active, self._active)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "maxSessions": self.max_sessions,
+            "maxWaiting": self.max_waiting,
+            "active": self._active,
+            "waiting": len(self._waiters),
+            "utilization": round(self._active / self.max_sessions, 3) if self.max_sessions else None,
+            "peakActive": self.peak_active,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "timedOut": self.timed_out,
+        }
+
+    def snapshot(self) -> list[dict[str, Any]]:
+        return [session.snapshot() for session in self.sessions.values()]
@@ -0,0 +1,173 @@
+"""
+Logging estructurado que nunca bloquea el bucle de eventos.
+
+`print` escribe en stdout de forma síncrona y, en el contenedor, stdout es una
+tubería que se bloquea si el recolector de logs va lento: el relay de audio se
+quedaba esperando a un print. Aquí el hilo que registra solo encola el registro
+(`put_nowait` sobre una cola acotada; si está llena se descarta y se cuenta) y un
+hilo aparte lo serializa como una línea JSON y lo escribe.
+
+Cada línea lleva los campos del contexto (id de sesión, número de orden) fijados
+con `bind_log_context` / `update_log_context`, además de los `extra` de la llamada.
+Los mensajes por chunk de audio se muestrean con `LogSampler`.
+"""
+
+import atexit
+import contextvars
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from typing import Any, Optional
+
+LOGGER_NAME = "fulgencio"
+
+# Atributos propios de LogRecord: el resto son campos `extra` o de contexto.
+STANDARD_RECORD_ATTRIBUTES = frozenset(
+    logging.LogRecord("", logging.INFO, "", 0, "", None, None).__dict__
+) | {"message", "asctime", "taskName"}
+
+# Diccionario compartido por todas las tareas de una sesión: actualizarlo (p. ej. al
+# resolver el número de orden) se ve también en las tareas ya creadas.
+_log_context: contextvars.ContextVar[Optional[dict[str, Any]]] = contextvars.ContextVar(
+    "fulgencio_log_context", default=None
+)
+
+
+def bind_log_context(**fields: Any) -> dict[str, Any]:
+    """Abre un contexto nuevo (hereda el actual) para esta tarea y las que cree después."""
+    context = {**(_log_context.get() or {}), **fields}
+    _log_context.set(context)
+    return context
+
+
+def update_log_context(**fields: Any) -> None:
+    """Añade campos al contexto actual, visible para todas las tareas que lo comparten."""
+    context = _log_context.get()
+    if context is None:
+        bind_log_context(**fields)
+    else:
+        context.update(fields)
+
+
+class ContextFilter(logging.Filter):
+    """Copia el contexto al registro en el hilo que registra (antes de encolarlo)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _log_context.get()
+        if context:
+            for key, value in context.items():
+                if not hasattr(record, key):
+                    setattr(record, key, value)
+        return True
+
+
+class JsonLineFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry: dict[str, Any] = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in STANDARD_RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Formato legible para desarrollo local: nivel, mensaje y campos al final."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = " ".join(
+            f"{key}={value}"
+            for key, value in record.__dict__.items()
+            if key not in STANDARD_RECORD_ATTRIBUTES and not key.startswith("_")
+        )
+        line = f"{record.levelname:<7} {record.getMessage()}"
+        return f"{line} [{fields}]" if fields else line
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que descarta (y cuenta) en vez de bloquear si la cola está llena."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class DrainingQueueListener(logging.handlers.QueueListener):
+    """Al parar espera hueco para el centinela: el hilo escritor está vaciando la cola."""
+
+    def enqueue_sentinel(self) -> None:
+        self.queue.put(self._sentinel)
+
+
+class LogSampler:
+    """Deja pasar uno de cada `every` mensajes por clave (1 = todos)."""
+
+    def __init__(self, every: int = 1):
+        self.every = max(1, every)
+        self._counts: dict[str, int] = {}
+
+    def sample(self, key: str) -> bool:
+        count = self._counts.get(key, 0) + 1
+        self._counts[key] = count
+        return (count - 1) % self.every == 0
+
+
+_handler: Optional[DroppingQueueHandler] = None
+_listener: Optional[DrainingQueueListener] = None
+
+
+def configure_logging(level: str = "INFO", json_format: bool = True, queue_size: int = 10000) -> logging.Logger:
+    """Configura el logger `fulgencio` (y sus hijos) con la cola y el hilo escritor."""
+    global _handler, _listener
+
+    logger = logging.getLogger(LOGGER_NAME)
+    if _listener is not None:
+        _listener.stop()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
+    log_queue: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonLineFormatter() if json_format else TextFormatter())
+    _listener = DrainingQueueListener(log_queue, stream_handler, respect_handler_level=False)
+    _listener.start()
+
+    _handler = DroppingQueueHandler(log_queue)
+    _handler.addFilter(ContextFilter())
+    logger.addHandler(_handler)
+    logger.setLevel(level.upper())
+    logger.propagate = False
+    return logger
+
+
+def stop_logging() -> None:
+    """Vacía la cola y detiene el hilo escritor."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def logging_stats() -> dict[str, Any]:
+    return {
+        "queued": _handler.queue.qsize() if _handler is not None else 0,
+        "dropped": _handler.dropped if _handler is not None else 0,
+    }
+
+
+atexit.register(stop_logging)
@@ -0,0 +1,282 @@
+"""
+Servicio de resúmenes de conversación con sesiones GPT Realtime reutilizables.
+
+Al cerrar el evento llegan muchos resúmenes a la vez; abrir un WebSocket y
+configurar la sesión por cada uno (handshake + TLS + session.update) costaba más
+que el propio resumen. Aquí `workers` tareas mantienen cada una su sesión de
+texto abierta y atienden una cola acotada:
+
+- Cada trabajo crea su item con un id propio y, al terminar, borra ese item y los
+  de la respuesta (`conversation.item.delete`), así la sesión vuelve limpia.
+- Si una sesión falla o se agota el tiempo a mitad de respuesta, se cierra y el
+  worker abre otra para el siguiente trabajo (nunca se reutiliza con eventos pendientes).
+- Plazo total por resumen (cola + respuesta). El resumen local se calcula en
+  paralelo como cobertura y se devuelve si el modelo no llega a tiempo o falla.
+- Opcionalmente, un resumen por REST (chat completions) cubre los fallos de la
+  sesión realtime.
+"""
+
+import asyncio
+import json
+import uuid
+from dataclasses import dataclass, field
+from time import monotonic
+from typing import Any, Awaitable, Callable, Optional
+
+from realtime_pool import RealtimeConnectionPool, RealtimeLease
+
+SUMMARY_SOURCE_MODEL = "model"
+SUMMARY_SOURCE_REST = "rest"
+SUMMARY_SOURCE_FALLBACK = "fallback"
+
+TEXT_DELTA_EVENTS = ("conversation.item.output_text.delta", "response.output_text.delta")
+TEXT_DONE_EVENTS = ("conversation.item.output_text.done", "response.output_text.done")
+
+# Los ids de item de Realtime admiten como máximo 32 caracteres.
+ITEM_ID_PREFIX = "sum_"
+
+
+class SummaryQueueFullError(RuntimeError):
+    """La cola de resúmenes ha alcanzado su capacidad máxima."""
+
+
+class SummaryUnavailableError(RuntimeError):
+    """Ni la sesión realtime ni el resumen REST han devuelto texto."""
+
+
+@dataclass
+class SummaryJob:
+    prompt: str
+    deadline: float
+    future: asyncio.Future = field(repr=False)
+
+    @property
+    def remaining_seconds(self) -> float:
+        return self.deadline - monotonic()
+
+
+class SummarizationService:
+    """
+    `pool` solo se usa para abrir e inicializar sesiones (misma lógica de URL y
+    timeouts que el relay de voz, con su propio session.update de texto).
+    `rest_summarize(prompt)` es opcional y se usa si la sesión realtime falla.
+    """
+
+    def __init__(
+        self,
+        pool: RealtimeConnectionPool,
+        rest_summarize: Optional[Callable[[str], Awaitable[str]]] = None,
+        workers: int = 2,
+        max_queue_size: int = 32,
+        deadline_seconds: float = 20,
+        session_max_age_seconds: float = 600,
+        cleanup_timeout_seconds: float = 5,
+    ):
+        self._pool = pool
+        self._rest_summarize = rest_summarize
+        self._workers_count = max(1, workers)
+        self._max_queue_size = max(1, max_queue_size)
+        self._deadline_seconds = deadline_seconds
+        self._session_max_age_seconds = session_max_age_seconds
+        self._cleanup_timeout_seconds = cleanup_timeout_seconds
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: list[asyncio.Task] = []
+        self._leases: dict[int, RealtimeLease] = {}
+        self.completed = 0
+        self.fallbacks = 0
+        self.rejected = 0
+        self.sessions_opened = 0
+
+    async def start(self) -> None:
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=self._max_queue_size)
+        self._workers = [asyncio.create_task(self._worker(index)) for index in range(self._workers_count)]
+
+    async def stop(self) -> None:
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        for lease in self._leases.values():
+            await lease.close()
+        self._leases.clear()
+        if self._queue is not None:
+            while not self._queue.empty():
+                job = self._queue.get_nowait()
+                if not job.future.done():
+                    job.future.set_exception(SummaryUnavailableError("Servicio detenido"))
+
+    async def summarize(self, prompt: str, fallback: Callable[[], str]) -> tuple[str, str]:
+        """
+        Devuelve (resumen, origen). `fallback` se ejecuta en un hilo en paralelo con
+        el modelo y su resultado se usa si el modelo falla o no termina en el plazo.
+        Lanza SummaryQueueFullError si la cola está llena.
+        """
+        loop = asyncio.get_running_loop()
+        job = SummaryJob(prompt=prompt, deadline=monotonic() + self._deadline_seconds, future=loop.create_future())
+        if self._queue is None:
+            raise SummaryUnavailableError("Servicio de resúmenes no iniciado")
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull as err:
+            self.rejected += 1
+            raise SummaryQueueFullError("Cola de resúmenes llena") from err
+
+        hedge = asyncio.create_task(asyncio.to_thread(fallback))
+        try:
+            summary, source = await asyncio.wait_for(asyncio.shield(job.future), timeout=self._deadline_seconds)
+            if summary.strip():
+                self.completed += 1
+                hedge.cancel()
+                return summary.strip(), source
+        except asyncio.TimeoutError:
+            print(f"⚠️ Resumen sin respuesta del modelo en {self._deadline_seconds:.0f}s, se usa el local")
+        except Exception as err:
+            print(f"⚠️ Error resumiendo con gpt-realtime: {err}")
+        finally:
+            # Si el plazo venció, el worker lo detecta y descarta el trabajo.
+            if not job.future.done():
+                job.future.cancel()
+
+        self.fallbacks += 1
+        return await hedge, SUMMARY_SOURCE_FALLBACK
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "workers": self._workers_count,
+            "sessions_open": sum(1 for lease in self._leases.values() if lease.is_open),
+            "sessions_opened": self.sessions_opened,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "completed": self.completed,
+            "fallbacks": self.fallbacks,
+            "rejected": self.rejected,
+            "rest_fallback": self._rest_summarize is not None,
+        }
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.future.done() or job.remaining_seconds <= 0:
+                    continue
+                await self._run_job(index, job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                if not job.future.done():
+                    job.future.set_exception(err)
+            finally:
+                self._queue.task_done()
+
+    async def _run_job(self, index: int, job: SummaryJob) -> None:
+        realtime_error: Optional[Exception] = None
+        try:
+            lease = await self._session(index)
+            text, output_item_ids = await asyncio.wait_for(
+                self._exchange(lease, job.prompt),
+                timeout=max(0.0, job.remaining_seconds),
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as err:
+            # Estado desconocido (respuesta a medias, eventos pendientes): sesión descartada.
+            await self._discard_session(index)
+            realtime_error = err
+        else:
+            if not job.future.done():
+                job.future.set_result((text, SUMMARY_SOURCE_MODEL))
+            # La limpieza ya no retrasa al cliente.
+            await self._clear_items(index, lease, output_item_ids)
+            return
+
+        if self._rest_summarize is None or job.remaining_seconds <= 0 or job.future.done():
+            raise realtime_error
+        print(f"⚠️ Sesión realtime de resúmenes falló ({realtime_error}), se usa REST")
+        text = await asyncio.wait_for(self._rest_summarize(job.prompt), timeout=job.remaining_seconds)
+        if not job.future.done():
+            job.future.set_result((text, SUMMARY_SOURCE_REST))
+
+    async def _session(self, index: int) -> RealtimeLease:
+        lease = self._leases.get(index)
+        if lease is not None and lease.is_open and lease.age_seconds <= self._session_max_age_seconds:
+            return lease
+        await self._discard_session(index)
+        lease = await self._pool.open_connection()
+        self.sessions_opened += 1
+        self._leases[index] = lease
+        return lease
+
+    async def _discard_session(self, index: int) -> None:
+        lease = self._leases.pop(index, None)
+        if lease is not None:
+            await lease.close()
+
+    async def _exchange(self, lease: RealtimeLease, prompt: str) -> tuple[str, list[str]]:
+        """Envía el prompt como item propio, espera response.done y devuelve el texto."""
+        connection = lease.connection
+        item_id = ITEM_ID_PREFIX + uuid.uuid4().hex[:24]
+        await connection.send(json.dumps({
+            "type": "conversation.item.create",
+            "item": {
+                "id": item_id,
+                "type": "message",
+                "role": "user",
+                "content": [{"type": "input_text", "text": prompt}],
+            },
+        }))
+        await connection.send(json.dumps({"type": "response.create"}))
+
+        collected_text_parts: list[str] = []
+        item_ids = [item_id]
+        while True:
+            raw = await connection.recv()
+            if not isinstance(raw, str):
+                continue
+            event = json.loads(raw)
+            event_type = event.get("type")
+            if event_type in TEXT_DELTA_EVENTS:
+                delta = event.get("delta")
+                if isinstance(delta, str):
+                    collected_text_parts.append(delta)
+            elif event_type in TEXT_DONE_EVENTS:
+                text = event.get("text")
+                if isinstance(text, str) and text.strip() and not "".join(collected_text_parts).strip():
+                    collected_text_parts.append(text)
+            elif event_type == "error":
+                raise SummaryUnavailableError(f"Error de GPT Realtime: {event.get('error', event)}")
+            elif event_type == "response.done":
+                response = event.get("response") or {}
+                item_ids.extend(
+                    output["id"]
+                    for output in response.get("output") or []
+                    if isinstance(output, dict) and isinstance(output.get("id"), str)
+                )
+                if response.get("status") not in (None, "completed"):
+                    raise SummaryUnavailableError(f"Respuesta {response.get('status')}: {response.get('status_details')}")
+                return "".join(collected_text_parts), item_ids
+
+    async def _clear_items(self, index: int, lease: RealtimeLease, item_ids: list[str]) -> None:
+        """Borra los items del trabajo y espera la confirmación antes de reutilizar la sesión."""
+        try:
+            for item_id in item_ids:
+                await lease.connection.send(json.dumps({"type": "conversation.item.delete", "item_id": item_id}))
+
+            async def wait_deleted() -> None:
+                pending = set(item_ids)
+                while pending:
+                    raw = await lease.connection.recv()
+                    if not isinstance(raw, str):
+                        continue
+                    event = json.loads(raw)
+                    if event.get("type") == "conversation.item.deleted":
+                        pending.discard(event.get("item_id"))
+                    elif event.get("type") == "error":
+                        raise SummaryUnavailableError(f"Error borrando items: {event.get('error', event)}")
+
+            await asyncio.wait_for(wait_deleted(), timeout=self._cleanup_timeout_seconds)
+        except asyncio.CancelledError:
+            raise
+        except Exception as err:
+            print(f"⚠️ No se pudo limpiar la sesión de resúmenes, se cierra: {err}")
+            await self._discard_session(index)
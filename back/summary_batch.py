@@ -0,0 +1,196 @@
+"""
+Resúmenes por lotes (exportación de fin de jornada).
+
+- Las conversaciones idénticas (mismos mensajes tras normalizar) se resumen una vez.
+- Un número fijo de workers consume las conversaciones únicas: la concurrencia
+  no crece con el tamaño del lote.
+- Cada resumen obtenido del modelo se guarda en un checkpoint del lote (JSONL en
+  disco o en memoria); si la exportación se corta y se reenvía, solo se resume
+  lo que falta. Sin `batchId` explícito, el lote se identifica por su contenido.
+- Los resultados salen en orden de finalización, uno por conversación.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+from summarization import SUMMARY_SOURCE_FALLBACK
+
+# Validar con fullmatch: con match y "^...$", "abc\n" pasaría (y sería el nombre del checkpoint).
+BATCH_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+Summarizer = Callable[[list[dict[str, str]]], Awaitable[tuple[str, str]]]
+
+
+def build_conversation_key(messages: list[dict[str, str]]) -> str:
+    """Clave de contenido: SHA-256 de los mensajes (rol + texto) normalizados."""
+    normalized = [
+        [str(item.get("role", "")).strip().lower(), str(item.get("content", "")).strip()]
+        for item in messages
+        if isinstance(item, dict)
+    ]
+    encoded = json.dumps(normalized, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def build_batch_id(keys: list[str]) -> str:
+    """Id determinista: reenviar la misma exportación reanuda el mismo lote."""
+    return hashlib.sha256("\n".join(keys).encode("ascii")).hexdigest()[:32]
+
+
+class SummaryCheckpointStore:
+    """
+    Resúmenes ya obtenidos por lote y clave de conversación. Con `directory`
+    se escriben como JSONL (`{batchId}.jsonl`, una línea por resumen, sobrevive a
+    reinicios); sin él se guardan en memoria para los últimos `max_batches` lotes.
+    """
+
+    def __init__(self, directory: str = "", max_batches: int = 64):
+        self._directory = directory
+        self._max_batches = max(1, max_batches)
+        self._memory: OrderedDict[str, dict[str, dict[str, Any]]] = OrderedDict()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def load(self, batch_id: str) -> dict[str, dict[str, Any]]:
+        if not self._directory:
+            entries = self._memory.setdefault(batch_id, {})
+            self._memory.move_to_end(batch_id)
+            while len(self._memory) > self._max_batches:
+                self._memory.popitem(last=False)
+            return dict(entries)
+
+        entries: dict[str, dict[str, Any]] = {}
+        try:
+            with open(self._path(batch_id), encoding="utf-8") as checkpoint_file:
+                for line in checkpoint_file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # Última línea a medias si el proceso se cortó al escribir.
+                    if isinstance(entry, dict) and isinstance(entry.get("key"), str):
+                        entries[entry["key"]] = entry
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def record(self, batch_id: str, key: str, summary: str, source: str) -> None:
+        entry = {"key": key, "summary": summary, "source": source}
+        if not self._directory:
+            self._memory.setdefault(batch_id, {})[key] = entry
+            return
+        with open(self._path(batch_id), "a", encoding="utf-8") as checkpoint_file:
+            checkpoint_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def _path(self, batch_id: str) -> str:
+        return os.path.join(self._directory, f"{batch_id}.jsonl")
+
+
+async def stream_summary_batch(
+    conversations: list[tuple[Optional[str], list[dict[str, str]]]],
+    summarize: Summarizer,
+    checkpoints: SummaryCheckpointStore,
+    batch_id: Optional[str] = None,
+    concurrency: int = 2,
+) -> AsyncIterator[dict[str, Any]]:
+    """
+    Genera los eventos del lote: `batch` (cabecera), un `result` o `error` por
+    conversación y `done` al final. Si el consumidor se va, los workers se cancelan
+    y el checkpoint conserva lo ya resumido.
+    """
+    started = monotonic()
+    keys = [build_conversation_key(messages) for _, messages in conversations]
+    if batch_id is None:
+        batch_id = build_batch_id(keys)
+    elif not BATCH_ID_PATTERN.fullmatch(batch_id):
+        raise ValueError("batchId solo admite letras, números, '_' y '-' (máx. 64)")
+
+    indexes_by_key: dict[str, list[int]] = {}
+    for index, key in enumerate(keys):
+        indexes_by_key.setdefault(key, []).append(index)
+
+    done_entries = checkpoints.load(batch_id)
+    pending_keys = [key for key in indexes_by_key if key not in done_entries]
+
+    yield {
+        "type": "batch",
+        "batchId": batch_id,
+        "conversations": len(conversations),
+        "unique": len(indexes_by_key),
+        "resumed": len(indexes_by_key) - len(pending_keys),
+    }
+
+    def fan_out(key: str, event: dict[str, Any]) -> list[dict[str, Any]]:
+        return [
+            {**event, "index": index, "id": conversations[index][0]}
+            for index in indexes_by_key[key]
+        ]
+
+    completed = 0
+    failed = 0
+    for key in indexes_by_key:
+        if key in done_entries:
+            entry = done_entries[key]
+            for event in fan_out(key, {
+                "type": "result", "summary": entry["summary"], "source": entry["source"], "checkpointed": True,
+            }):
+                completed += 1
+                yield event
+
+    work: asyncio.Queue = asyncio.Queue()
+    for key in pending_keys:
+        work.put_nowait(key)
+    results: asyncio.Queue = asyncio.Queue()
+
+    async def worker() -> None:
+        while True:
+            try:
+                key = work.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            messages = conversations[indexes_by_key[key][0]][1]
+            try:
+                summary, source = await summarize(messages)
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                await results.put(fan_out(key, {"type": "error", "error": str(err)}))
+                continue
+            # Los resúmenes locales (modelo no disponible) se reintentan al reanudar.
+            checkpointed = source != SUMMARY_SOURCE_FALLBACK
+            if checkpointed:
+                try:
+                    checkpoints.record(batch_id, key, summary, source)
+                except OSError as err:
+                    print(f"⚠️ No se pudo guardar el checkpoint del lote {batch_id}: {err}")
+                    checkpointed = False
+            await results.put(fan_out(key, {
+                "type": "result", "summary": summary, "source": source, "checkpointed": checkpointed,
+            }))
+
+    workers = [asyncio.create_task(worker()) for _ in range(min(max(1, concurrency), len(pending_keys)))]
+    try:
+        for _ in pending_keys:
+            for event in await results.get():
+                if event["type"] == "result":
+                    completed += 1
+                else:
+                    failed += 1
+                yield event
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    yield {
+        "type": "done",
+        "batchId": batch_id,
+        "completed": completed,
+        "failed": failed,
+        "elapsedSeconds": round(monotonic() - started, 2),
+    }
@@ -0,0 +1,83 @@
+"""Cabeceras Range / If-Range de /blobs/{key} (RFC 7233)."""
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from blob_store import LocalBlobStore
+from main import parse_byte_range
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 4
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("bytes=0-9", (0, 9)),
+        ("bytes=10-", (10, 99)),
+        ("bytes=-5", (95, 99)),
+        ("bytes=-500", (0, 99)),
+        ("bytes=90-500", (90, 99)),
+    ],
+)
+def test_valid_ranges(header, expected):
+    assert parse_byte_range(header, 100) == expected
+
+
+@pytest.mark.parametrize(
+    "header",
+    [None, "", "bytes=abc-", "bytes=5-2", "bytes=", "bytes=-", "bytes=7", "bytes=+1-2", "items=0-1", "bytes=0-1,5-6"],
+)
+def test_malformed_or_multi_range_headers_are_ignored(header):
+    assert parse_byte_range(header, 100) is None
+
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=250-300", "bytes=-0"])
+def test_unsatisfiable_ranges(header):
+    with pytest.raises(ValueError):
+        parse_byte_range(header, 100)
+
+
+@pytest.fixture
+def blob(tmp_path, monkeypatch):
+    store = LocalBlobStore(str(tmp_path))
+    monkeypatch.setattr(main, "blob_store", store)
+    return store.put(PNG)
+
+
+@pytest.fixture
+def client():
+    # Sin `with`: no arranca el lifespan (pools, colas) que /blobs no necesita.
+    return TestClient(main.app)
+
+
+def test_blob_range_returns_partial_content(client, blob):
+    response = client.get(f"/blobs/{blob}", headers={"Range": "bytes=0-7"})
+    assert response.status_code == 206
+    assert response.content == PNG[:8]
+    assert response.headers["content-range"] == f"bytes 0-7/{len(PNG)}"
+    assert response.headers["content-type"] == "image/png"
+
+
+def test_blob_malformed_range_returns_full_body(client, blob):
+    response = client.get(f"/blobs/{blob}", headers={"Range": "bytes=abc-"})
+    assert response.status_code == 200
+    assert response.content == PNG
+
+
+def test_blob_unsatisfiable_start_returns_416(client, blob):
+    response = client.get(f"/blobs/{blob}", headers={"Range": f"bytes={len(PNG)}-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(PNG)}"
+
+
+def test_blob_if_range_mismatch_returns_full_body(client, blob):
+    response = client.get(f"/blobs/{blob}", headers={"Range": "bytes=0-7", "If-Range": '"otra-version"'})
+    assert response.status_code == 200
+    assert response.content == PNG
+
+
+def test_blob_if_range_match_honours_range(client, blob):
+    response = client.get(f"/blobs/{blob}", headers={"Range": "bytes=-4", "If-Range": f'"{blob}"'})
+    assert response.status_code == 206
+    assert response.content == PNG[-4:]
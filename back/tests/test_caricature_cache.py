@@ -0,0 +1,120 @@
+"""Caché de caricaturas: coalescencia de peticiones idénticas y cancelación."""
+
+import asyncio
+
+from caricature_cache import (
+    CACHE_SOURCE_COALESCED,
+    CACHE_SOURCE_GENERATED,
+    CACHE_SOURCE_MEMORY,
+    CaricatureResultCache,
+)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_concurrent_requests_share_one_generation():
+    async def scenario():
+        cache = CaricatureResultCache()
+        release = asyncio.Event()
+        calls = 0
+
+        async def generate(publish):
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return ["img"]
+
+        leader = asyncio.create_task(cache.get_or_generate("k", generate))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(cache.get_or_generate("k", generate))
+        await asyncio.sleep(0)
+        release.set()
+
+        assert await leader == (["img"], CACHE_SOURCE_GENERATED)
+        assert await follower == (["img"], CACHE_SOURCE_COALESCED)
+        assert calls == 1
+        assert await cache.get_or_generate("k", generate) == (["img"], CACHE_SOURCE_MEMORY)
+
+    run(scenario())
+
+
+def test_cancelling_the_leader_does_not_cancel_coalesced_requests():
+    async def scenario():
+        cache = CaricatureResultCache()
+        release = asyncio.Event()
+
+        async def generate(publish):
+            await release.wait()
+            return ["img"]
+
+        leader = asyncio.create_task(cache.get_or_generate("k", generate))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(cache.get_or_generate("k", generate))
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        await asyncio.gather(leader, return_exceptions=True)
+        assert leader.cancelled()
+        release.set()
+
+        assert await follower == (["img"], CACHE_SOURCE_COALESCED)
+        assert cache.stats()["in_flight"] == 0
+
+    run(scenario())
+
+
+def test_errors_reach_every_request_and_are_not_cached():
+    async def scenario():
+        cache = CaricatureResultCache()
+        release = asyncio.Event()
+
+        async def failing(publish):
+            await release.wait()
+            raise RuntimeError("azure")
+
+        leader = asyncio.create_task(cache.get_or_generate("k", failing))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(cache.get_or_generate("k", failing))
+        await asyncio.sleep(0)
+        release.set()
+
+        results = await asyncio.gather(leader, follower, return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+        async def generate(publish):
+            return ["img"]
+
+        assert await cache.get_or_generate("k", generate) == (["img"], CACHE_SOURCE_GENERATED)
+
+    run(scenario())
+
+
+def test_partial_results_reach_every_coalesced_request():
+    async def scenario():
+        cache = CaricatureResultCache()
+        release = asyncio.Event()
+        first_partial = asyncio.Event()
+        leader_partials: list[int] = []
+        follower_partials: list[int] = []
+
+        async def generate(publish):
+            publish(0)
+            first_partial.set()
+            await release.wait()
+            publish(1)
+            return ["img"]
+
+        leader = asyncio.create_task(cache.get_or_generate("k", generate, leader_partials.append))
+        await first_partial.wait()
+        # Se une tarde: recibe la última previsualización y las siguientes.
+        follower = asyncio.create_task(cache.get_or_generate("k", generate, follower_partials.append))
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(leader, follower)
+
+        assert leader_partials == [0, 1]
+        assert follower_partials == [0, 1]
+
+    run(scenario())
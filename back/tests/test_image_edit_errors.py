@@ -0,0 +1,32 @@
+"""400 de images/edits: solo el rechazo del streaming desactiva las previsualizaciones."""
+
+import json
+
+from main import image_edit_rejects_streaming
+
+
+def test_rejected_stream_parameter_disables_streaming():
+    body = json.dumps({"error": {"code": "invalid_request_error", "message": "Unknown parameter", "param": "stream"}})
+    assert image_edit_rejects_streaming(body)
+
+
+def test_rejected_partial_images_message_disables_streaming():
+    body = json.dumps({"error": {"message": "partial_images is not supported for this api-version"}})
+    assert image_edit_rejects_streaming(body)
+
+
+def test_photo_rejection_is_not_a_streaming_error():
+    body = json.dumps({
+        "error": {
+            "code": "content_policy_violation",
+            "message": "Your request was rejected as a result of our safety system.",
+            "param": None,
+        }
+    })
+    assert not image_edit_rejects_streaming(body)
+    assert not image_edit_rejects_streaming(json.dumps({"error": {"message": "Invalid image file"}}))
+
+
+def test_non_json_body_is_searched_as_text():
+    assert image_edit_rejects_streaming("Bad Request: stream not supported")
+    assert not image_edit_rejects_streaming("Bad Request: upstream image invalid")
@@ -0,0 +1,72 @@
+"""Decodificación al vuelo del campo base64 de /photo/generate-caricature."""
+
+import base64
+import json
+
+import pytest
+
+from image_payloads import Base64FieldStreamDecoder, PayloadTooLargeError
+
+PHOTO = bytes(range(256)) * 40  # 10240 bytes: el base64 termina en "==".
+
+
+def build_body(value: str, **fields) -> bytes:
+    return json.dumps({"orderNumber": "42", **fields, "photoBase64": value}).encode("utf-8")
+
+
+def decode_in_chunks(body: bytes, chunk_size: int, max_bytes: int = 0):
+    decoder = Base64FieldStreamDecoder("photoBase64", max_bytes=max_bytes)
+    for offset in range(0, len(body), chunk_size):
+        decoder.feed(body[offset:offset + chunk_size])
+    return decoder.finish()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 16, 1024])
+def test_data_url_prefix_split_across_chunks(chunk_size):
+    value = "data:image/jpeg;base64," + base64.b64encode(PHOTO).decode("ascii")
+    fields, photo = decode_in_chunks(build_body(value), chunk_size)
+    assert photo == PHOTO
+    assert fields["orderNumber"] == "42"
+
+
+def test_padding_split_across_chunks():
+    encoded = base64.b64encode(PHOTO).decode("ascii")
+    assert encoded.endswith("==")
+    body = build_body(encoded)
+    padding_at = body.index(b"==")
+    decoder = Base64FieldStreamDecoder("photoBase64")
+    decoder.feed(body[:padding_at + 1])
+    decoder.feed(body[padding_at + 1:])
+    _, photo = decoder.finish()
+    assert photo == PHOTO
+
+
+def test_key_late_in_a_large_body_is_found():
+    body = build_body(base64.b64encode(PHOTO).decode("ascii"), notes="x" * 300_000)
+    fields, photo = decode_in_chunks(body, 4096)
+    assert photo == PHOTO
+    assert len(fields["notes"]) == 300_000
+
+
+def test_key_split_across_chunks_with_spaces():
+    encoded = base64.b64encode(PHOTO).decode("ascii")
+    body = b'{"orderNumber": "42", "photoBase64"  :  "' + encoded.encode("ascii") + b'"}'
+    _, photo = decode_in_chunks(body, 5)
+    assert photo == PHOTO
+
+
+def test_escaped_characters_are_rejected():
+    body = b'{"orderNumber": "42", "photoBase64": "AAAA\\/AAA"}'
+    with pytest.raises(ValueError):
+        decode_in_chunks(body, 8)
+
+
+def test_missing_key_is_rejected():
+    with pytest.raises(ValueError):
+        decode_in_chunks(json.dumps({"orderNumber": "42", "photo": "AAAA"}).encode("utf-8"), 4)
+
+
+def test_oversized_body_is_rejected():
+    body = build_body(base64.b64encode(PHOTO).decode("ascii"))
+    with pytest.raises(PayloadTooLargeError):
+        decode_in_chunks(body, 512, max_bytes=len(body) - 1)
@@ -0,0 +1,39 @@
+"""Cola de trabajos: último trabajo por clave y su limpieza al expirar."""
+
+import asyncio
+
+from job_queue import JOB_SUCCEEDED, JobQueue
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def finish(queue: JobQueue, job) -> None:
+    async for snapshot in queue.subscribe(job):
+        if snapshot["status"] == JOB_SUCCEEDED:
+            return
+
+
+def test_latest_job_by_key_is_dropped_when_the_job_expires():
+    async def scenario():
+        async def runner(job):
+            return {"ok": True}
+
+        queue = JobQueue("test", runner, retention_seconds=0)
+        await queue.start()
+        try:
+            first = queue.submit({}, key="42")
+            assert queue.latest("42") is first
+            second = queue.submit({}, key="42")
+            assert queue.latest("42") is second
+            await finish(queue, first)
+            await finish(queue, second)
+
+            queue.submit({}, key="7")  # Cada envío limpia los trabajos expirados.
+            assert queue.latest("42") is None
+            assert "42" not in queue._latest_by_key
+        finally:
+            await queue.stop()
+
+    run(scenario())
@@ -0,0 +1,48 @@
+"""Histogramas: las llamadas canceladas no cuentan como completadas."""
+
+import asyncio
+
+import pytest
+
+from metrics import Histogram, timed
+
+
+def observed_count(histogram: Histogram, label: str) -> int:
+    line = next(line for line in histogram.render() if line.startswith(f'{histogram.name}_count{{call="{label}"}}'))
+    return int(line.rsplit(" ", 1)[1])
+
+
+def build_histogram() -> Histogram:
+    return Histogram("test_call_seconds", "Duración de prueba", label_name="call")
+
+
+def test_timed_skips_cancelled_calls():
+    histogram = build_histogram()
+
+    @timed(histogram)
+    async def lookup(wait: bool) -> str:
+        if wait:
+            await asyncio.Event().wait()
+        return "ok"
+
+    async def scenario():
+        assert await lookup(False) == "ok"
+        speculative = asyncio.create_task(lookup(True))
+        await asyncio.sleep(0)
+        speculative.cancel()
+        await asyncio.gather(speculative, return_exceptions=True)
+
+    asyncio.run(scenario())
+    assert observed_count(histogram, "lookup") == 1
+
+
+def test_timed_records_failed_calls():
+    histogram = build_histogram()
+
+    @timed(histogram)
+    async def lookup() -> None:
+        raise RuntimeError("firebase")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(lookup())
+    assert observed_count(histogram, "lookup") == 1
@@ -0,0 +1,220 @@
+"""Control de admisión de /ws: cola, rechazo, espera agotada, cancelación y traspaso del hueco."""
+
+import asyncio
+
+import pytest
+
+from session_registry import SESSION_ACTIVE, SESSION_CLOSED, SessionLimitError, SessionRegistry
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def never_disconnects() -> None:
+    await asyncio.Event().wait()
+
+
+def test_rejects_immediately_when_queue_is_full():
+    async def scenario():
+        registry = SessionRegistry(max_sessions=1, max_waiting=1, wait_timeout_seconds=5)
+        first = registry.register()
+        await registry.admit(first)
+        queued = asyncio.create_task(registry.admit(registry.register()))
+        await asyncio.sleep(0)
+
+        extra = registry.register()
+        with pytest.raises(SessionLimitError) as error:
+            await registry.admit(extra)
+        assert error.value.reason == "full"
+        assert extra.id not in registry.sessions
+        assert registry.stats()["rejected"] == 1
+
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+
+    run(scenario())
+
+
+def test_zero_queue_rejects_without_waiting():
+    async def scenario():
+        registry = SessionRegistry(max_sessions=1, max_waiting=0)
+        await registry.admit(registry.register())
+        with pytest.raises(SessionLimitError):
+            await registry.admit(registry.register())
+        assert registry.waiting == 0
+
+    run(scenario())
+
+
+def test_wait_times_out_and_leaves_queue():
+    async def scenario():
+        registry = SessionRegistry(max_sessions=1, max_waiting=2, wait_timeout_seconds=0.05)
+        await registry.admit(registry.register())
+        late = registry.register()
+        with pytest.raises(SessionLimitError) as error:
+            await registry.admit(late)
+        assert error.value.reason == "timeout"
+        assert registry.waiting == 0
+        assert late.id not in registry.sessions
+        assert registry.stats()["timedOut"] == 1
+        assert registry.active == 1
+
+    run(scenario())
+
+
+def test_cancel_while_queued_leaves_queue_without_taking_slot():
+    async def scenario():
+        registry = SessionRegistry(max_sessions=1, max_waiting=2, wait_timeout_seconds=5)
+        first = registry.register()
+        await registry.admit(first)
+        waiting = registry.register()
+        task = asyncio.create_task(registry.admit(waiting))
+        await asyncio.sleep(0)
+        assert registry.queue_position(waiting) == 1
+
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert registry.waiting == 0
+        assert waiting.id not in registry.sessions
+
+        registry.release(first)
+        assert registry.active == 0
+
+    run(scenario())
+
+
+def test_cancel_after_grant_returns_slot_to_next_waiter():
+    async def scenario():
+        registry = SessionRegistry(max_sessions=1, max_waiting=2, wait_timeout_seconds=5)
+        first = registry.register()
+        await registry.admit(first)
+        granted, next_in_line = registry.register(), registry.register()
+        granted_task = asyncio.create_task(registry.admit(granted))
+        next_task = asyncio.create_task(registry.admit(next_in_line))
+        await asyncio.sleep(0)
+
+        # El hueco se concede y la espera se cancela antes de que la tarea lo recoja.
+        registry.release(first)
+        assert granted.state == SESSION_ACTIVE
+        granted_task.cancel()
+        await asyncio.gather(granted_task, return_exceptions=True)
+
+        await next_task
+        assert granted.state == SESSION_CLOSED
+        assert next_in_line.state == SESSION_ACTIVE
+        assert registry.active == 1
+
+    run(scenario())
+
+
+def test_release_hands_slots_over_in_fifo_order():
+    async def scenario():
+        registry = SessionRegistry(max_sessions=1, max_waiting=3, wait_timeout_seconds=5)
+        first = registry.register()
+        await registry.admit(first)
+        waiting = [registry.register() for _ in range(3)]
+        order: list[str] = []
+
+        async def admit_and_record(session):
+            await registry.admit(session)
+            order.append(session.id)
+
+        tasks = [asyncio.create_task(admit_and_record(session)) for session in waiting]
+        await asyncio.sleep(0)
+        assert [registry.queue_position(session) for session in waiting] == [1, 2, 3]
+
+        previous = first
+        for session in waiting:
+            registry.release(previous)
+            await asyncio.sleep(0)
+            assert registry.active == 1
+            previous = session
+        await asyncio.gather(*tasks)
+        assert order == [session.id for session in waiting]
+
+        # Nadie espera ya: una sesión nueva entra directamente al liberar la última.
+        registry.release(previous)
+        assert registry.try_admit(registry.register())
+
+    run(scenario())
+
+
+def test_wait_for_slot_returns_false_when_client_disconnects():
+    async def scenario():
+        registry = SessionRegistry(max_sessions=1, max_waiting=2, wait_timeout_seconds=5)
+        first = registry.register()
+        await registry.admit(first)
+        gone = asyncio.Event()
+        positions: list[int] = []
+
+        async def on_queued(position: int) -> None:
+            positions.append(position)
+
+        async def disconnected() -> None:
+            await gone.wait()
+
+        waiting = registry.register()
+        task = asyncio.create_task(registry.wait_for_slot(waiting, on_queued, disconnected))
+        await asyncio.sleep(0.01)
+        gone.set()
+        assert await task is False
+        assert positions == [1]
+        assert registry.waiting == 0
+        assert waiting.id not in registry.sessions
+
+        registry.release(first)
+        assert registry.active == 0
+
+    run(scenario())
+
+
+def test_wait_for_slot_send_failure_does_not_orphan_the_slot():
+    async def scenario():
+        registry = SessionRegistry(max_sessions=1, max_waiting=2, wait_timeout_seconds=5)
+        first = registry.register()
+        await registry.admit(first)
+
+        async def on_queued(position: int) -> None:
+            raise RuntimeError("cliente desconectado")
+
+        waiting = registry.register()
+        with pytest.raises(RuntimeError):
+            await registry.wait_for_slot(waiting, on_queued, never_disconnects)
+        assert registry.waiting == 0
+
+        # Antes, la espera huérfana recibía este hueco y se quedaba activa sin dueño.
+        registry.release(first)
+        await asyncio.sleep(0)
+        assert registry.active == 0
+        assert registry.sessions == {}
+
+    run(scenario())
+
+
+def test_wait_for_slot_admits_when_slot_frees():
+    async def scenario():
+        registry = SessionRegistry(max_sessions=1, max_waiting=1, wait_timeout_seconds=5)
+        first = registry.register()
+        await registry.admit(first)
+
+        async def on_queued(position: int) -> None:
+            pass
+
+        waiting = registry.register()
+        task = asyncio.create_task(registry.wait_for_slot(waiting, on_queued, never_disconnects))
+        await asyncio.sleep(0.01)
+        registry.release(first)
+        assert await task is True
+        assert waiting.state == SESSION_ACTIVE
+
+    run(scenario())
+
+
+def test_snapshot_hides_client_address_and_order_number():
+    registry = SessionRegistry(max_sessions=1)
+    session = registry.register(client="10.0.0.7")
+    session.order_number = "42"
+    snapshot = registry.snapshot()[0]
+    assert "client" not in snapshot and "orderNumber" not in snapshot
+    assert "10.0.0.7" not in snapshot.values() and "42" not in snapshot.values()
@@ -0,0 +1,141 @@
+"""
+Caché en memoria de registros users/{order_number} de Realtime Database.
+
+TTL por entrada, expulsión LRU con límite de entradas y de bytes (los registros
+incluyen `photo` y `caricatures` en base64, de varios MB), y caché negativa de
+corta duración para números que no existen. Es thread-safe porque la
+invalidación llega desde el listener del Admin SDK, que corre en otro hilo.
+"""
+
+import threading
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Optional
+
+
+class UserRecordCache:
+    """
+    Los valores devueltos se comparten entre llamadas: tratarlos como solo lectura
+    (copiar antes de modificar).
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = 60,
+        negative_ttl_seconds: float = 5,
+        max_entries: int = 256,
+        max_bytes: int = 64 * 1024 * 1024,
+    ):
+        self._ttl_seconds = ttl_seconds
+        self._negative_ttl_seconds = negative_ttl_seconds
+        self._max_entries = max(1, max_entries)
+        self._max_bytes = max(0, max_bytes)
+        # order_number -> (valor o None, expira_en, tamaño estimado en bytes)
+        self._entries: OrderedDict[str, tuple[Optional[dict[str, Any]], float, int]] = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._ttl_seconds > 0
+
+    def get(self, order_number: str) -> tuple[bool, Optional[dict[str, Any]]]:
+        """Devuelve (encontrado, valor). Un valor None encontrado es un negativo cacheado."""
+        with self._lock:
+            entry = self._entries.get(order_number)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            value, expires_at, _ = entry
+            if expires_at <= monotonic():
+                self._remove(order_number)
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(order_number)
+            if value is None:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return True, value
+
+    def put(self, order_number: str, value: Optional[dict[str, Any]]) -> None:
+        """Guarda el registro (o None para cachear que no existe)."""
+        if not self.enabled:
+            return
+        ttl = self._ttl_seconds if value is not None else self._negative_ttl_seconds
+        if ttl <= 0:
+            return
+        size = estimate_size_bytes(value)
+        if size > self._max_bytes:
+            # Un registro mayor que toda la caché no se guarda (vaciaría el resto).
+            self.invalidate(order_number)
+            return
+        with self._lock:
+            self._remove(order_number)
+            self._entries[order_number] = (value, monotonic() + ttl, size)
+            self._total_bytes += size
+            self._evict()
+
+    def apply_fields(self, order_number: str, fields: dict[str, Any]) -> None:
+        """
+        Write-through de un update parcial: si el registro está cacheado se actualiza,
+        si no (o era un negativo) se invalida para que la próxima lectura vaya a Firebase.
+        """
+        with self._lock:
+            entry = self._entries.get(order_number)
+        if entry is None or entry[0] is None:
+            self.invalidate(order_number)
+            return
+        updated = dict(entry[0])
+        updated.update(fields)
+        self.put(order_number, updated)
+
+    def invalidate(self, order_number: str) -> None:
+        with self._lock:
+            self._remove(order_number)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _remove(self, order_number: str) -> None:
+        entry = self._entries.pop(order_number, None)
+        if entry is not None:
+            self._total_bytes -= entry[2]
+
+    def _evict(self) -> None:
+        while self._entries and (
+            len(self._entries) > self._max_entries or self._total_bytes > self._max_bytes
+        ):
+            _, (_, _, size) = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+
+
+def estimate_size_bytes(value: Any) -> int:
+    """Estimación barata del tamaño de un valor JSON (dominada por los strings base64)."""
+    if value is None:
+        return 16
+    if isinstance(value, str):
+        return len(value) + 16
+    if isinstance(value, dict):
+        return 64 + sum(len(str(k)) + estimate_size_bytes(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return 64 + sum(estimate_size_bytes(v) for v in value)
+    return 16
@@ -8,6 +8,15 @@ export const WEBSOCKET_URL =
         : `ws://${window.location.hostname}:8000/ws`)
     : "ws://localhost:8000/ws");
 
+// Pide al backend el audio de respuesta como frames binarios PCM16 (sin base64 ni JSON).
+export const WEBSOCKET_BINARY_AUDIO = true;
+
+export function buildWebSocketUrl(baseUrl: string = WEBSOCKET_URL): string {
+  if (!WEBSOCKET_BINARY_AUDIO) return baseUrl;
+  const separator = baseUrl.includes("?") ? "&" : "?";
+  return `${baseUrl}${separator}audio=binary`;
+}
+
 export const AUDIO_CONFIG = {
   channelCount: 1,
   sampleRate: 24000,
@@ -2,11 +2,13 @@ import { useState, useRef, useCallback, useEffect } from "react";
 import { useWebSocket } from "./useWebSocket";
 import { useAudioRecording } from "./useAudioRecording";
 import { useAudioPlayback } from "./useAudioPlayback";
-import { WEBSOCKET_URL, VOICE_DETECTION } from "../constants";
+import { VOICE_DETECTION, WEBSOCKET_BINARY_AUDIO, buildWebSocketUrl } from "../constants";
 import { Message, ConnectionStatus, WebSocketMessage } from "../types";
 import {
   arrayBufferToFloat32,
   base64ToFloat32,
+  parseBinaryAudioFrame,
+  pcm16ToFloat32,
 } from "../services/audioUtils";
 import { useFirebase } from "./useFirebase";
 
@@ -90,6 +92,13 @@ export function useVoiceConversation(): UseVoiceConversationReturn {
     return "http://localhost:8000";
   }, []);
 
+  // Las imágenes pueden llegar como data URL o como referencia relativa del backend (/blobs/...).
+  const resolveMediaUrl = useCallback(
+    (src: string): string =>
+      src.startsWith("/blobs/") ? `${resolveBackendHttpBaseUrl()}${src}` : src,
+    [resolveBackendHttpBaseUrl]
+  );
+
   const summarizeUserMessages = useCallback(
     async (messages: Message[]): Promise<string> => {
       const normalized = messages
@@ -163,7 +172,7 @@ export function useVoiceConversation(): UseVoiceConversationReturn {
         typeof data.photo === "string" &&
         data.photo.trim().length > 0
       ) {
-        setResolvedPhoto(data.photo);
+        setResolvedPhoto(resolveMediaUrl(data.photo));
         return;
       }
 
@@ -173,7 +182,7 @@ export function useVoiceConversation(): UseVoiceConversationReturn {
     return () => {
       unsubscribe();
     };
-  }, [subscribe]);
+  }, [subscribe, resolveMediaUrl]);
 
   // Monitorear el estado del audio para actualizar isSpeaking
   useEffect(() => {
@@ -294,7 +303,10 @@ export function useVoiceConversation(): UseVoiceConversationReturn {
 
         try {
           const arrayBuffer = await blob.arrayBuffer();
-          const float32 = await arrayBufferToFloat32(arrayBuffer);
+          // En modo binario cada frame lleva cabecera (item_id, content_index) antes del PCM16.
+          const float32 = WEBSOCKET_BINARY_AUDIO
+            ? pcm16ToFloat32(parseBinaryAudioFrame(arrayBuffer).pcm16)
+            : await arrayBufferToFloat32(arrayBuffer);
           console.log("▶️ Reproduciendo audio, tamaño:", float32.length);
           playAudio(float32);
         } catch (audioErr) {
@@ -311,16 +323,30 @@ export function useVoiceConversation(): UseVoiceConversationReturn {
         setTranscription((prev) => [...prev, userMessage]);
       });
 
-      onMessage("user.context.resolved", (data: WebSocketMessage) => {
+      const applyResolvedCaricatures = (data: WebSocketMessage) => {
         if (Array.isArray(data.caricatures)) {
           const cleaned = data.caricatures.filter(
             (img: unknown) => typeof img === "string" && img.trim().length > 0
           ) as string[];
           console.log("🖼️ Caricaturas recibidas en frontend:", cleaned.length);
-          setResolvedCaricatures(cleaned);
+          setResolvedCaricatures(cleaned.map(resolveMediaUrl));
         } else {
           setResolvedCaricatures([]);
         }
+      };
+
+      // El backend confirma primero el usuario (datos ligeros) y después envía
+      // foto y caricaturas en un evento aparte.
+      onMessage("user.context.resolved", applyResolvedCaricatures);
+      onMessage("user.context.media", applyResolvedCaricatures);
+
+      // Mientras la caricatura se genera llegan previsualizaciones progresivas;
+      // user.context.media con las caricaturas finales las sustituye.
+      onMessage("caricature.preview", (data: WebSocketMessage) => {
+        if (typeof data.image === "string" && data.image.length > 0) {
+          console.log("🖼️ Previsualización de caricatura recibida:", data.index);
+          setResolvedCaricatures([data.image]);
+        }
       });
 
       // Handler para cuando se completa el procesamiento de un mensaje de texto
@@ -535,7 +561,7 @@ export function useVoiceConversation(): UseVoiceConversationReturn {
       });
 
       // Ahora conectar (el servicio se creará y aplicará los handlers guardados)
-      await connect(WEBSOCKET_URL);
+      await connect(buildWebSocketUrl());
 
       // Iniciar grabación de audio
       await startRecording(handleAudioChunk, handleUserSpeaking);
@@ -562,6 +588,7 @@ export function useVoiceConversation(): UseVoiceConversationReturn {
     audioIsRecording,
     hasActiveAudio,
     generateUserId,
+    resolveMediaUrl,
   ]);
 
   const stopConversation = useCallback((transcription: Message[]) => {
@@ -57,3 +57,26 @@ export function base64ToFloat32(base64: string): Float32Array {
   return pcm16ToFloat32(pcm16);
 }
 
+/**
+ * Frame binario de audio enviado por el backend en modo `/ws?audio=binary`:
+ * <uint16 LE longitud_cabecera><uint16 LE content_index><item_id ASCII (relleno a par)><PCM16>
+ */
+export interface BinaryAudioFrame {
+  itemId: string;
+  contentIndex: number;
+  pcm16: Int16Array;
+}
+
+/**
+ * Decodifica un frame binario de audio (sin base64) del backend
+ */
+export function parseBinaryAudioFrame(buffer: ArrayBuffer): BinaryAudioFrame {
+  const view = new DataView(buffer);
+  const headerLength = view.getUint16(0, true);
+  const contentIndex = view.getUint16(2, true);
+  const itemId = new TextDecoder("ascii")
+    .decode(new Uint8Array(buffer, 4, headerLength - 4))
+    .replace(/\0+$/, "");
+  const pcm16 = new Int16Array(buffer, headerLength, (buffer.byteLength - headerLength) >> 1);
+  return { itemId, contentIndex, pcm16 };
+}